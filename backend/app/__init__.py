@@ -8,9 +8,15 @@ from pymongo.server_api import ServerApi
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .ctms_routes import ctms_bp
 from .integration_routes import integration_blueprint
 from .email_service import mail
+from .email_outbox import outbox
+from .email_templates import email_templates
+from .keypair_pool import keypair_pool
+from .password_hashing import password_hasher
+from . import crypto_utils, file_storage, projections, serializers
 
 load_dotenv()
 bcrypt = Bcrypt()
@@ -25,9 +31,9 @@ def create_app():
         "https://regdoc-backend.onrender.com"  # Backend can call itself
     ])
 
-    app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-    app.config['MAIL_PORT'] = 587
-    app.config['MAIL_USE_TLS'] = True
+    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
     app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME') 
     app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD') 
     app.config['FRONTEND_URL'] = os.getenv('FRONTEND_URL', 'http://localhost:3000')
@@ -36,18 +42,101 @@ def create_app():
     app.config['DEMO_EMAIL'] = os.getenv('DEMO_EMAIL')
     
     mail.init_app(app)
+
+    app.config['EMAIL_WORKERS'] = int(os.getenv('EMAIL_WORKERS', 2))
+    outbox.init_app(app)
+    email_templates.init_app(app)
+
+    app.config['MAX_UPLOAD_BYTES'] = int(os.getenv('MAX_UPLOAD_BYTES', file_storage.DEFAULT_MAX_UPLOAD_BYTES))
+    file_storage.init_app(app)
+
+    serializers.init_app(app)
+
+    app.config['SIGNATURE_AUDIT_WORKERS'] = int(os.getenv('SIGNATURE_AUDIT_WORKERS', 2))
+
+    app.config['KEYPAIR_POOL_SIZE'] = int(os.getenv('KEYPAIR_POOL_SIZE', 20))
+    keypair_pool.init_app(app)
+
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_CHECK_WORKERS'] = int(os.getenv('PASSWORD_CHECK_WORKERS', 2))
+    app.config['PASSWORD_CHECK_MAX_PENDING'] = int(os.getenv('PASSWORD_CHECK_MAX_PENDING', 16))
+    password_hasher.init_app(app)
+
+    app.config['LOGIN_ATTEMPT_WINDOW_SECONDS'] = int(os.getenv('LOGIN_ATTEMPT_WINDOW_SECONDS', 15 * 60))
+    app.config['LOGIN_MAX_ACCOUNT_FAILURES'] = int(os.getenv('LOGIN_MAX_ACCOUNT_FAILURES', 5))
+    app.config['LOGIN_MAX_IP_FAILURES'] = int(os.getenv('LOGIN_MAX_IP_FAILURES', 50))
+
+    # Behind a reverse proxy, trust its X-Forwarded-For so per-IP limits see the real client
+    if os.getenv('PROXY_FIX_X_FOR'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.getenv('PROXY_FIX_X_FOR')))
+
+    app.config['PUBLIC_KEY_CACHE_SIZE'] = int(os.getenv('PUBLIC_KEY_CACHE_SIZE', crypto_utils.PUBLIC_KEY_CACHE_SIZE))
+    app.config['PRIVATE_KEY_CACHE_SIZE'] = int(os.getenv('PRIVATE_KEY_CACHE_SIZE', crypto_utils.PRIVATE_KEY_CACHE_SIZE))
+    app.config['PRIVATE_KEY_TTL_SECONDS'] = int(os.getenv('PRIVATE_KEY_TTL_SECONDS', crypto_utils.PRIVATE_KEY_TTL_SECONDS))
+    crypto_utils.configure_key_caches(
+        public_max_size=app.config['PUBLIC_KEY_CACHE_SIZE'],
+        private_max_size=app.config['PRIVATE_KEY_CACHE_SIZE'],
+        private_ttl_seconds=app.config['PRIVATE_KEY_TTL_SECONDS']
+    )
+
+    app.config['PROJECTION_INSTRUMENTATION'] = os.getenv('PROJECTION_INSTRUMENTATION', 'false').lower() in ('1', 'true')
     
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
     jwt = JWTManager(app)
     
     global db
     try:
-        client = MongoClient(os.getenv("MONGO_URI"), server_api=ServerApi('1'))
+        client = MongoClient(
+            os.getenv("MONGO_URI"),
+            server_api=ServerApi('1'),
+            retryWrites=True,
+            event_listeners=projections.event_listeners(app)
+        )
         client.admin.command('ping')
         print("You successfully connected to MongoDB!")
         db = client.RegDocDB
     except Exception as e:
         print(e)
+
+    if db is not None:
+        from .transactions import supports_transactions
+        if not supports_transactions(db.client):
+            print("⚠️ MongoDB deployment has no transactions - multi-document writes will run write by write")
+
+        from .indexes import ensure_indexes
+        ensure_indexes(db)
+
+        from .document_heads import backfill_lineage_heads
+        backfilled = backfill_lineage_heads(db)
+        if backfilled:
+            print(f"Flagged latest versions for {backfilled} lineage(s)")
+
+        from .search_index import backfill_search_index
+        indexed = backfill_search_index(db)
+        if indexed:
+            print(f"Built search index entries for {indexed} document(s)")
+
+        from .document_revisions import backfill_revisions
+        revisioned = backfill_revisions(db)
+        if revisioned:
+            print(f"Started {revisioned} document(s) at revision 0")
+
+        from .audit_log import migrate_history
+        migrated = migrate_history(db)
+        if migrated:
+            print(f"Moved history of {migrated} document(s) to audit_events")
+
+    from .indexes import indexes_cli
+    app.cli.add_command(indexes_cli)
+
+    from .audit_log import audit_cli
+    app.cli.add_command(audit_cli)
+
+    from .keypair_pool import keypool_cli
+    app.cli.add_command(keypool_cli)
+
+    from .signature_audit import signature_audit_cli
+    app.cli.add_command(signature_audit_cli)
         
     bcrypt.init_app(app)
     
@@ -75,4 +164,7 @@ def create_app():
     from .integration_routes import integration_blueprint
     app.register_blueprint(integration_blueprint, url_prefix='/api/integrations')
 
+    from .signature_audit_routes import signature_audit_blueprint
+    app.register_blueprint(signature_audit_blueprint, url_prefix='/api/signature-audits')
+
     return app
\ No newline at end of file
@@ -0,0 +1,437 @@
+# backend/app/audit_log.py
+
+"""
+Append-only, hash-chained audit trail for documents.
+
+Every history entry is written as its own `audit_events` record, indexed by
+(document_id, timestamp). The document keeps only its last
+RECENT_HISTORY_SIZE entries in `history`, as the summary that detail views
+show. The full trail is served page by page from
+GET /api/documents/<id>/history.
+
+Routes write through `update_with_history`, which takes the same update
+document as before. The `$push.history` entry is capped with `$each`/`$slice`
+and also appended to audit_events; update pipelines pass their entry as an
+expression instead. `migrate_history` moves arrays written
+before this change into the collection:
+
+    flask --app run audit migrate-history
+
+Events of one document form a chain: each carries its position `seq` (from 1),
+the previous event's `hash` as `prev_hash`, and a SHA-256 `hash` over its own
+canonical JSON. Editing, reordering or deleting an event breaks the chain.
+`verify_chains` checks only what was written since the last checkpoint,
+starting from each document's last verified (seq, hash) in
+`audit_chain_heads`, and records the run in `audit_checkpoints`:
+
+    flask --app run audit verify          # e.g. nightly from cron
+    flask --app run audit verify --full   # re-check every chain from seq 1
+
+A change and its event are written in one transaction where the deployment
+supports them (see transactions). Standalone servers have none. There the
+document write also adds the entry to the document's `audit_pending` list,
+keyed by the _id its event will get, and the entry is removed once the event
+is stored. If a crash comes between the two writes, `verify_chains` appends
+the leftover entries before it checks anything.
+"""
+
+import datetime
+import hashlib
+import json
+import click
+from bson import ObjectId
+from flask.cli import AppGroup
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .transactions import is_chain_position_conflict, run_in_transaction, supports_transactions
+
+RECENT_HISTORY_SIZE = 20
+PENDING_FIELD = 'audit_pending'
+
+EVENT_FIELDS = ('action', 'user_id', 'user_username', 'timestamp', 'details')
+HASHED_FIELDS = EVENT_FIELDS + ('document_id', 'lineage_id', 'doc_number', 'seq', 'prev_hash')
+GENESIS_HASH = '0' * 64
+APPEND_RETRIES = 5
+# Discovery rescans events slightly older than the last checkpoint, because
+# ObjectIds from different processes are only roughly time-ordered
+CHECKPOINT_OVERLAP = datetime.timedelta(minutes=5)
+MAX_REPORTED_FAILURES = 100
+
+
+def _canonical_timestamp(value):
+    """Naive UTC truncated to milliseconds, which is what MongoDB stores and returns."""
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def _canonical_value(value):
+    if isinstance(value, datetime.datetime):
+        return _canonical_timestamp(value).isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot hash {type(value).__name__}")
+
+
+def event_hash(event):
+    """SHA-256 hex digest of the event's chained fields."""
+    payload = json.dumps(
+        {field: event.get(field) for field in HASHED_FIELDS},
+        sort_keys=True, separators=(',', ':'), default=_canonical_value
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _event(document, entry):
+    event = {field: entry.get(field) for field in EVENT_FIELDS}
+    event['document_id'] = document['_id']
+    event['lineage_id'] = document.get('lineage_id')
+    event['doc_number'] = document.get('doc_number')
+    if event['timestamp'] is None:
+        event['timestamp'] = datetime.datetime.now(datetime.timezone.utc)
+    event['timestamp'] = _canonical_timestamp(event['timestamp'])
+    return event
+
+
+def _chain_tip(db, document_id, session=None):
+    return db.audit_events.find_one(
+        {'document_id': document_id, 'seq': {'$exists': True}},
+        {'seq': 1, 'hash': 1},
+        sort=[('seq', DESCENDING)],
+        session=session
+    )
+
+
+def _link(event, tip):
+    event['seq'] = tip['seq'] + 1 if tip else 1
+    event['prev_hash'] = tip['hash'] if tip else GENESIS_HASH
+    event['hash'] = event_hash(event)
+    return event
+
+
+def append_event(db, document, entry, session=None, event_id=None):
+    """Chain one history entry onto the document's audit trail. `document` needs _id, lineage_id and doc_number.
+
+    The unique (document_id, seq) index makes concurrent appends race for the
+    same position; the loser re-reads the tip and links after the winner.
+    Inside a transaction the failed insert has already aborted it, so the
+    error is raised for run_in_transaction to retry the whole transaction.
+
+    With `event_id` the append is idempotent: if an event with that _id is
+    already stored, nothing is written and None is returned.
+    """
+    event = _event(document, entry)
+    for _ in range(APPEND_RETRIES):
+        _link(event, _chain_tip(db, event['document_id'], session))
+        event.pop('_id', None)
+        if event_id is not None:
+            event['_id'] = event_id
+        try:
+            db.audit_events.insert_one(event, session=session)
+            return event
+        except DuplicateKeyError as e:
+            if session is not None and session.in_transaction:
+                raise
+            if event_id is not None and not is_chain_position_conflict(e):
+                return None
+            continue
+    raise RuntimeError(f"Could not append audit event for document {event['document_id']}")
+
+
+def _pending(event_id, entry):
+    return {'event_id': event_id, 'entry': entry}
+
+
+def _clear_pending(db, document_id, event_id):
+    db.documents.update_one({'_id': document_id}, {'$pull': {PENDING_FIELD: {'event_id': event_id}}})
+
+
+def insert_with_history(db, document, session=None):
+    """insert_one on documents that also records the new document's first history entry in audit_events."""
+    entry = document['history'][0]
+    if session is None and not supports_transactions(db.client):
+        event_id = ObjectId()
+        document[PENDING_FIELD] = [_pending(event_id, entry)]
+        db.documents.insert_one(document)
+        append_event(db, document, entry, event_id=event_id)
+        _clear_pending(db, document['_id'], event_id)
+        return document
+
+    def write(session):
+        db.documents.insert_one(document, session=session)
+        append_event(db, document, entry, session)
+        return document
+
+    return write(session) if session is not None else run_in_transaction(db, write)
+
+
+def update_with_history(db, document_filter, update, projection=None, history=None, session=None):
+    """update_one on documents that also records its `$push.history` entry in audit_events.
+
+    `update` may also be an update pipeline, for writes that derive new values
+    from stored ones. Pipelines cannot `$push`, so their entry is passed as
+    `history`: an expression evaluated against the updated document.
+
+    Every update also increments the document's `_rev` (see document_revisions).
+
+    Returns the updated document's identifying fields and `_rev` plus
+    `projection`, or None if nothing matched (in which case no event is written).
+
+    The update and its event are written in one transaction: the caller's
+    `session`, or a new one from run_in_transaction. Standalone servers record
+    the entry as pending instead (see the module docstring).
+    """
+    fields = {'_id': 1, 'lineage_id': 1, 'doc_number': 1, '_rev': 1, **(projection or {})}
+    pipeline = isinstance(update, list)
+    records_event = history is not None if pipeline else 'history' in update.get('$push', {})
+    transactional = session is not None or supports_transactions(db.client)
+    event_id = None if transactional or not records_event else ObjectId()
+
+    if pipeline:
+        update = update + [{'$set': {'_rev': {'$add': [{'$ifNull': ['$_rev', 0]}, 1]}}}]
+        if history is not None:
+            update = update + [{'$set': {'history': {'$slice': [
+                {'$concatArrays': [{'$ifNull': ['$history', []]}, [history]]},
+                -RECENT_HISTORY_SIZE
+            ]}}}]
+            fields['history'] = {'$slice': -1}
+        if event_id is not None:
+            update = update + [{'$set': {PENDING_FIELD: {'$concatArrays': [
+                {'$ifNull': ['$' + PENDING_FIELD, []]},
+                [_pending({'$literal': event_id}, {'$arrayElemAt': ['$history', -1]})]
+            ]}}}]
+    else:
+        update.setdefault('$inc', {})['_rev'] = 1
+        push = update.get('$push', {})
+        if records_event:
+            if event_id is not None:
+                push[PENDING_FIELD] = _pending(event_id, push['history'])
+            push['history'] = {'$each': [push['history']], '$slice': -RECENT_HISTORY_SIZE}
+
+    def write(session):
+        document = db.documents.find_one_and_update(
+            document_filter,
+            update,
+            projection=fields,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if document is not None and records_event:
+            entry = document['history'][-1] if pipeline else update['$push']['history']['$each'][0]
+            append_event(db, document, entry, session, event_id)
+            if event_id is not None:
+                _clear_pending(db, document['_id'], event_id)
+        return document
+
+    if session is None and transactional and records_event:
+        return run_in_transaction(db, write)
+    return write(session)
+
+
+def recover_pending_events(db):
+    """Append the events of changes whose append was interrupted. Returns the number appended.
+
+    Safe alongside live writes: each pending entry carries its event's _id,
+    so an event that was appended meanwhile is not written again.
+    """
+    recovered = 0
+    documents = db.documents.find(
+        {PENDING_FIELD + '.event_id': {'$exists': True}},
+        {'lineage_id': 1, 'doc_number': 1, PENDING_FIELD: 1}
+    )
+    for document in documents:
+        for pending in document[PENDING_FIELD]:
+            if append_event(db, document, pending['entry'], event_id=pending['event_id']) is not None:
+                recovered += 1
+            _clear_pending(db, document['_id'], pending['event_id'])
+    return recovered
+
+
+def history_page(db, document_id, limit, before=None):
+    """Newest-first page of a document's events; `before` is (timestamp, _id) of the last event seen."""
+    query = {'document_id': document_id}
+    if before:
+        timestamp, event_id = before
+        query['$or'] = [
+            {'timestamp': {'$lt': timestamp}},
+            {'timestamp': timestamp, '_id': {'$lt': event_id}}
+        ]
+    return list(db.audit_events.find(query).sort([('timestamp', -1), ('_id', -1)]).limit(limit))
+
+
+def migrate_history(db, batch_size=100):
+    """Copy pre-existing history arrays into audit_events and trim them. Safe to re-run.
+
+    Events are upserted by (document_id, legacy_index), so a run interrupted
+    between copying and trimming a document never duplicates its events. The
+    copied events are then linked into the document's hash chain. Trimming
+    changes the history a detail response shows, so it also bumps `_rev`.
+    """
+    migrated = []
+    pending = db.documents.find(
+        {'audit_migrated': {'$ne': True}},
+        {'lineage_id': 1, 'doc_number': 1, 'history': 1}
+    ).batch_size(batch_size)
+    for document in pending:
+        history = document.get('history', [])
+        if history:
+            db.audit_events.bulk_write([
+                UpdateOne(
+                    {'document_id': document['_id'], 'legacy_index': index},
+                    {'$setOnInsert': _event(document, entry)},
+                    upsert=True
+                )
+                for index, entry in enumerate(history)
+            ], ordered=False)
+        # Trim in place, so an entry pushed meanwhile is not overwritten by this stale copy
+        db.documents.update_one(
+            {'_id': document['_id']},
+            {'$push': {'history': {'$each': [], '$slice': -RECENT_HISTORY_SIZE}},
+             '$set': {'audit_migrated': True}, '$inc': {'_rev': 1}}
+        )
+        migrated.append(document['_id'])
+    chain_unlinked_events(db, migrated)
+    return len(migrated)
+
+
+def chain_unlinked_events(db, document_ids=None):
+    """Link events written before chaining existed onto their document's chain, oldest first.
+
+    Looks at `document_ids`, or scans the whole collection when None. Returns
+    the number of events linked. Events are only updated while they still
+    lack a `seq`, so concurrent runs cannot relink one twice.
+    """
+    if document_ids is None:
+        document_ids = db.audit_events.distinct('document_id', {'seq': {'$exists': False}})
+    linked = 0
+    for document_id in document_ids:
+        tip = _chain_tip(db, document_id)
+        unlinked = db.audit_events.find(
+            {'document_id': document_id, 'seq': {'$exists': False}}
+        ).sort([('timestamp', ASCENDING), ('_id', ASCENDING)])
+        for event in unlinked:
+            event['timestamp'] = _canonical_timestamp(event['timestamp'])
+            _link(event, tip)
+            try:
+                result = db.audit_events.update_one(
+                    {'_id': event['_id'], 'seq': {'$exists': False}},
+                    {'$set': {'seq': event['seq'], 'prev_hash': event['prev_hash'], 'hash': event['hash']}}
+                )
+            except DuplicateKeyError:
+                print(f"⚠️ Audit chain of {document_id} moved while linking, will retry next run")
+                break
+            if not result.modified_count:
+                break
+            tip = event
+            linked += 1
+    return linked
+
+
+def _verify_chain(db, document_id, head):
+    """Check events after `head` ({'seq', 'hash'} or None). Returns (new_head, events_checked, error)."""
+    if head:
+        anchor = db.audit_events.find_one({'document_id': document_id, 'seq': head['seq']}, {'hash': 1})
+        if anchor is None or anchor['hash'] != head['hash']:
+            return head, 0, f"event {head['seq']} changed or removed after it was verified"
+
+    expected_seq = head['seq'] + 1 if head else 1
+    expected_prev = head['hash'] if head else GENESIS_HASH
+    checked = 0
+    events = db.audit_events.find(
+        {'document_id': document_id, 'seq': {'$gte': expected_seq}}
+    ).sort('seq', ASCENDING)
+    for event in events:
+        if event['seq'] != expected_seq:
+            return head, checked, f"event {expected_seq} is missing"
+        if event['prev_hash'] != expected_prev:
+            return head, checked, f"event {event['seq']} does not link to event {event['seq'] - 1}"
+        if event_hash(event) != event['hash']:
+            return head, checked, f"event {event['seq']} does not match its hash"
+        head = {'seq': event['seq'], 'hash': event['hash']}
+        expected_seq, expected_prev = event['seq'] + 1, event['hash']
+        checked += 1
+    return head, checked, None
+
+
+def verify_document_chain(db, document_id):
+    """Full check of one document's chain, without touching checkpoints."""
+    head, checked, error = _verify_chain(db, document_id, None)
+    return {'verified': error is None, 'events_checked': checked,
+            'last_seq': head['seq'] if head else 0, 'error': error}
+
+
+def verify_chains(db, full=False):
+    """Verify events added since the last checkpoint and record a new checkpoint.
+
+    A document whose chain failed keeps its last good head and is flagged
+    `broken`, so it is re-reported on every run until someone looks at it.
+    """
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    recovered = recover_pending_events(db)
+    if recovered:
+        print(f"🩹 Recovered {recovered} audit event(s) whose write was interrupted")
+    unlinked = db.audit_events.distinct('document_id', {'seq': {'$exists': False}})
+    if unlinked:
+        linked = chain_unlinked_events(db, unlinked)
+        print(f"🔗 Linked {linked} audit event(s) written before hash chaining")
+    last = db.audit_checkpoints.find_one({'status': 'completed'}, sort=[('started_at', DESCENDING)])
+
+    if full or last is None:
+        document_ids = set(db.audit_events.distinct('document_id'))
+    else:
+        since = ObjectId.from_datetime(last['started_at'] - CHECKPOINT_OVERLAP)
+        document_ids = set(db.audit_events.distinct('document_id', {'_id': {'$gte': since}}))
+        document_ids.update(head['_id'] for head in db.audit_chain_heads.find({'broken': True}, {'_id': 1}))
+        document_ids.update(unlinked)
+
+    events_checked, failures = 0, []
+    for document_id in document_ids:
+        head = None if full else db.audit_chain_heads.find_one({'_id': document_id})
+        head, checked, error = _verify_chain(db, document_id, head)
+        events_checked += checked
+        if error:
+            failures.append({'document_id': document_id, 'error': error})
+        if head:
+            db.audit_chain_heads.update_one(
+                {'_id': document_id},
+                {'$set': {'seq': head['seq'], 'hash': head['hash'], 'broken': error is not None,
+                          'verified_at': started_at}},
+                upsert=True
+            )
+
+    checkpoint = {
+        'started_at': started_at,
+        'finished_at': datetime.datetime.now(datetime.timezone.utc),
+        'full': full or last is None,
+        'documents_checked': len(document_ids),
+        'events_checked': events_checked,
+        'failure_count': len(failures),
+        'failures': failures[:MAX_REPORTED_FAILURES],
+        'status': 'completed'
+    }
+    db.audit_checkpoints.insert_one(checkpoint)
+    return checkpoint
+
+
+audit_cli = AppGroup('audit', help="Document audit trail maintenance.")
+
+
+@audit_cli.command('migrate-history')
+def migrate_history_command():
+    """Move document history arrays into audit_events."""
+    from . import db
+    click.echo(f"Migrated history of {migrate_history(db)} document(s)")
+
+
+@audit_cli.command('verify')
+@click.option('--full', is_flag=True, help="Re-verify every chain from its first event.")
+def verify_command(full):
+    """Verify audit hash chains written since the last checkpoint."""
+    from . import db
+    checkpoint = verify_chains(db, full=full)
+    click.echo(f"Checked {checkpoint['events_checked']} event(s) across "
+               f"{checkpoint['documents_checked']} document(s)")
+    for failure in checkpoint['failures']:
+        click.echo(f"❌ {failure['document_id']}: {failure['error']}")
+    if checkpoint['failure_count']:
+        raise SystemExit(1)
@@ -1,8 +1,11 @@
 import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from . import db, bcrypt
+from . import login_throttle
+from .password_hashing import password_hasher, PasswordHasherBusy
 from flask_jwt_extended import create_access_token
-from .crypto_utils import generate_keys
+from pymongo.errors import DuplicateKeyError
+from .keypair_pool import keypair_pool
 
 auth_blueprint = Blueprint('auth', __name__)
 
@@ -21,7 +24,8 @@ def register_user():
     
     hashed_password = bcrypt.generate_password_hash(data.get('password')).decode('utf-8')
 
-    private_key, public_key = generate_keys()
+    keypair = keypair_pool.acquire()
+    private_key, public_key = keypair
     new_user = {
         'email': email,
         'username': data.get('username'),
@@ -32,7 +36,12 @@ def register_user():
         'public_key': public_key
     }
     
-    result = users_collection.insert_one(new_user)
+    try:
+        result = users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        # A concurrent registration with the same email got past the check above
+        keypair_pool.give_back(keypair)
+        return jsonify({"error": "User with this email already exists"}), 409
     return jsonify({
         "message": "User registered successfully!",
         "user_id": str(result.inserted_id)
@@ -46,13 +55,27 @@ def login_user():
         return jsonify({"error": "Missing email or password"}), 400
     email = data.get('email')
     password = data.get('password')
-    user = users_collection.find_one({'email': email})
-    if user and bcrypt.check_password_hash(user['password'], password):
+    client_ip = request.remote_addr
+
+    # Limits are checked before bcrypt so blocked guesses cost no hashing CPU
+    wait_seconds = login_throttle.retry_after(db, current_app.config, email, client_ip)
+    if wait_seconds:
+        return jsonify({"error": "Too many failed login attempts. Please try again later."}), 429, {'Retry-After': str(wait_seconds)}
+
+    user = users_collection.find_one({'email': email}, {'password': 1, 'role': 1})
+    try:
+        valid = bool(user) and password_hasher.check(user['password'], password)
+    except PasswordHasherBusy:
+        return jsonify({"error": "Login service is busy. Please retry shortly."}), 429, {'Retry-After': '1'}
+
+    if valid:
+        login_throttle.clear_account(db, current_app.config, email)
         identity = str(user['_id'])
         additional_claims = {"role": user['role']}
         access_token = create_access_token(identity=identity, additional_claims=additional_claims)
         return jsonify(access_token=access_token), 200
     else:
+        login_throttle.record_failure(db, current_app.config, email, client_ip)
         return jsonify({"error": "Invalid credentials"}), 401
     
 
@@ -1,9 +1,17 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from Crypto.PublicKey import RSA
 from Crypto.Signature import pkcs1_15
 from Crypto.Hash import SHA256
 import base64
 
 KEY_LENGTH = 2048
+HASH_CHUNK_SIZE = 255 * 1024  # GridFS default chunk size
+PUBLIC_KEY_CACHE_SIZE = 256
+PRIVATE_KEY_CACHE_SIZE = 32
+PRIVATE_KEY_TTL_SECONDS = 300
 
 def generate_keys():
     """Generates a new RSA public/private key pair."""
@@ -12,20 +20,145 @@ def generate_keys():
     public_key_pem = key.publickey().export_key().decode('utf-8')
     return private_key_pem, public_key_pem
 
-def sign_data(private_key_pem, data):
-    """Signs data with a private key."""
-    key = RSA.import_key(private_key_pem)
-    h = SHA256.new(data)
+def key_fingerprint(pem):
+    """SHA-256 of a PEM string; cache keys never hold the PEM itself."""
+    return hashlib.sha256(pem.strip().encode('utf-8')).hexdigest()
+
+class KeyCache:
+    """Bounded LRU of parsed RSA keys keyed by PEM fingerprint, with hit/miss stats.
+
+    With a TTL, entries are dropped once it passes: on the next access, and by
+    one sweeper thread per cache so an idle process does not keep them either.
+    The sweeper sleeps until the earliest expiry and exits when the cache has
+    no entries left to expire. A TTL of 0 disables caching.
+    """
+
+    def __init__(self, max_size, ttl_seconds=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def configure(self, max_size=None, ttl_seconds=None):
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl_seconds is not None:
+                self.ttl_seconds = ttl_seconds
+            self._entries.clear()
+
+    def _expired(self, expires_at):
+        return expires_at is not None and expires_at <= time.monotonic()
+
+    def purge_expired(self):
+        with self._lock:
+            for fingerprint in [f for f, (expires_at, _) in self._entries.items() if self._expired(expires_at)]:
+                del self._entries[fingerprint]
+                self.expirations += 1
+
+    def _sweep(self):
+        while True:
+            with self._lock:
+                next_expiry = min((e for e, _ in self._entries.values() if e is not None), default=None)
+                if next_expiry is None:
+                    self._sweeper = None
+                    return
+            time.sleep(max(next_expiry - time.monotonic(), 0))
+            self.purge_expired()
+
+    def load(self, pem):
+        """Parsed key for a PEM, importing it on a miss."""
+        fingerprint = key_fingerprint(pem)
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[fingerprint]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        key = RSA.import_key(pem)
+        if self.ttl_seconds == 0 or self.max_size <= 0:
+            return key
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[fingerprint] = (expires_at, key)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if expires_at is not None and self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep, name="key-cache-sweeper", daemon=True)
+                self._sweeper.start()
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+public_key_cache = KeyCache(PUBLIC_KEY_CACHE_SIZE)
+private_key_cache = KeyCache(PRIVATE_KEY_CACHE_SIZE, ttl_seconds=PRIVATE_KEY_TTL_SECONDS)
+
+def configure_key_caches(public_max_size=None, private_max_size=None, private_ttl_seconds=None):
+    """Apply cache limits from app config; clears both caches."""
+    public_key_cache.configure(max_size=public_max_size)
+    private_key_cache.configure(max_size=private_max_size, ttl_seconds=private_ttl_seconds)
+
+def key_cache_stats():
+    return {'public': public_key_cache.stats(), 'private': private_key_cache.stats()}
+
+def hash_stream(stream, chunk_size=HASH_CHUNK_SIZE):
+    """SHA-256 of a readable stream, read in chunks so memory stays bounded."""
+    h = SHA256.new()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        h.update(chunk)
+    return h
+
+def load_public_key(public_key_pem):
+    """Parsed public key from the bounded cache."""
+    return public_key_cache.load(public_key_pem)
+
+def sign_digest(private_key_pem, h):
+    """Signs an already computed SHA-256 hash object with a private key."""
+    key = private_key_cache.load(private_key_pem)
     signature = pkcs1_15.new(key).sign(h)
     return base64.b64encode(signature).decode('utf-8')
 
-def verify_signature(public_key_pem, data, signature):
-    """Verifies a signature with a public key."""
-    key = RSA.import_key(public_key_pem)
-    h = SHA256.new(data)
+def verify_digest(public_key_pem, h, signature):
+    """Verifies a signature over an already computed SHA-256 hash object."""
+    key = load_public_key(public_key_pem)
     signature_bytes = base64.b64decode(signature)
     try:
         pkcs1_15.new(key).verify(h, signature_bytes)
         return True
     except (ValueError, TypeError):
-        return False
\ No newline at end of file
+        return False
+
+def sign_data(private_key_pem, data):
+    """Signs data with a private key."""
+    return sign_digest(private_key_pem, SHA256.new(data))
+
+def verify_signature(public_key_pem, data, signature):
+    """Verifies a signature with a public key."""
+    return verify_digest(public_key_pem, SHA256.new(data), signature)
@@ -0,0 +1,92 @@
+# backend/app/current_user.py
+
+"""
+Request-scoped loader for the authenticated user.
+
+`get_current_user()` resolves the JWT identity once per request into
+`flask.g`, backed by a small in-process TTL/LRU cache so repeated requests
+from the same user skip the `users` round trip. Cached copies never contain
+`password` or `private_key`; callers that must sign ask for
+`include_secrets=True`, which always reads from the database.
+
+The cache is per process: `invalidate_user` clears the local entry on a role
+change and the TTL bounds how long other workers can serve the old role.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+from bson.objectid import ObjectId
+
+USER_CACHE_TTL_SECONDS = 30
+USER_CACHE_MAX_SIZE = 1024
+
+PUBLIC_USER_PROJECTION = {'password': 0, 'private_key': 0}
+
+
+class UserCache:
+    """Thread-safe LRU of user documents with a per-entry time-to-live."""
+
+    def __init__(self, max_size=USER_CACHE_MAX_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return dict(user)
+
+    def put(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, dict(user))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def get_current_user(include_secrets=False):
+    """Return the authenticated user's document, or None if it no longer exists."""
+    from . import db
+
+    user_id = ObjectId(get_jwt_identity())
+
+    if include_secrets:
+        if 'current_user_with_secrets' not in g:
+            g.current_user_with_secrets = db.users.find_one({'_id': user_id})
+        return g.current_user_with_secrets
+
+    if 'current_user' not in g:
+        user = user_cache.get(user_id)
+        if user is None:
+            user = db.users.find_one({'_id': user_id}, PUBLIC_USER_PROJECTION)
+            if user:
+                user_cache.put(user_id, user)
+        g.current_user = user
+    return g.current_user
+
+
+def invalidate_user(user_id):
+    """Drop a user from this process's cache after their record changes."""
+    user_cache.invalidate(ObjectId(user_id))
@@ -22,12 +22,10 @@ def role_required(required_role):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            from . import db
-            from bson.objectid import ObjectId
-            from flask_jwt_extended import get_jwt_identity
+            from .current_user import get_current_user
             
-            user_id = get_jwt_identity()
-            user = db.users.find_one({'_id': ObjectId(user_id)})
+            # Shares the per-request lookup with the route it wraps
+            user = get_current_user()
             
             if not user:
                 return jsonify(error="User not found"), 404
@@ -0,0 +1,52 @@
+# backend/app/document_heads.py
+
+"""
+Maintains the `is_latest` flag that marks the current version of each lineage.
+
+The library view only ever shows one document per lineage. Instead of grouping
+the whole collection on every request, the newest version (highest
+major.minor) carries `is_latest: True` and listing becomes an indexed find.
+"""
+
+from pymongo import DESCENDING
+
+HEAD_SORT = [('major_version', DESCENDING), ('minor_version', DESCENDING), ('created_at', DESCENDING)]
+
+
+def refresh_lineage_head(db, lineage_id, session=None):
+    """Re-point `is_latest` at the newest version of a lineage.
+
+    Called after any write that adds, re-versions or removes a lineage member
+    (upload, amendment, final approval, delete). With `session` it joins that
+    session's transaction.
+
+    The new head is flagged before the old one is cleared. Outside a
+    transaction a reader may briefly see two heads, but never none, so the
+    lineage does not drop out of the library between the two writes.
+    """
+    if not lineage_id:
+        return None
+
+    head = db.documents.find_one({'lineage_id': lineage_id}, {'_id': 1}, sort=HEAD_SORT, session=session)
+    if not head:
+        return None
+
+    db.documents.update_one({'_id': head['_id']}, {'$set': {'is_latest': True}}, session=session)
+    db.documents.update_many(
+        {'lineage_id': lineage_id, 'is_latest': True, '_id': {'$ne': head['_id']}},
+        {'$set': {'is_latest': False}},
+        session=session
+    )
+    return head['_id']
+
+
+def backfill_lineage_heads(db):
+    """Flag lineages written before `is_latest` existed. Safe to run repeatedly."""
+    lineage_ids = db.documents.distinct('lineage_id', {'is_latest': {'$exists': False}})
+    for lineage_id in lineage_ids:
+        db.documents.update_many(
+            {'lineage_id': lineage_id, 'is_latest': {'$exists': False}},
+            {'$set': {'is_latest': False}}
+        )
+        refresh_lineage_head(db, lineage_id)
+    return len(lineage_ids)
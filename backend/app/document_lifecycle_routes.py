@@ -4,16 +4,18 @@ import datetime
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson.objectid import ObjectId
-import gridfs
 from . import db
+from .current_user import get_current_user
+from .document_heads import refresh_lineage_head
+from .search_index import build_search_fields, document_search_texts, search_terms_update
+from .audit_log import insert_with_history, update_with_history
+from .file_storage import store_upload, release_file
+from .projections import route_projection, AMENDMENT_CONFLICT_PROJECTION, DOCUMENT_STATE_PROJECTION
+from .document_revisions import if_match_revisions, is_stale
+from .transactions import run_in_transaction
+from .workflow_transitions import RACE_MESSAGE, TransitionRejected, apply_transition, check_transition, conflict
 
 document_lifecycle_blueprint = Blueprint('document_lifecycle', __name__)
-fs = gridfs.GridFS(db)
-
-
-def is_admin(user):
-    """Check if user is admin"""
-    return user['role'] == 'Admin'
 
 
 # ================================
@@ -28,26 +30,16 @@ def archive_document(doc_id):
     """
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
 
-        if not user or not doc:
+        if not user:
             return jsonify({"error": "User or document not found"}), 404
 
-        # Admin can do all actions, or Archivist role
-        if not is_admin(user) and user['role'] != 'Archivist':
-            return jsonify({"error": "You do not have permission to archive documents"}), 403
-
-        # Only Approved or Superseded documents can be archived
-        if doc['status'] not in ['Approved', 'Superseded']:
-            return jsonify({"error": "Only Approved or Superseded documents can be archived"}), 400
-
-        # Update status to Archived
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
+        # Admin or Archivist, and only Approved or Superseded documents (see TRANSITIONS)
+        doc = apply_transition(
+            db, 'archive', ObjectId(doc_id), user,
             {
                 '$set': {
-                    'status': 'Archived',
                     'archived_at': datetime.datetime.now(datetime.timezone.utc),
                     'archived_by_user_id': user_id,
                     'archived_by_username': user['username']
@@ -61,11 +53,14 @@ def archive_document(doc_id):
                         'details': 'Document moved to long-term archive storage'
                     }
                 }
-            }
+            },
+            expected_rev=if_match_revisions()
         )
 
-        return jsonify({"message": "Document archived successfully"}), 200
+        return jsonify({"message": "Document archived successfully", "rev": doc['_rev']}), 200
 
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in archive_document: {e}")
         return jsonify({"error": str(e)}), 500
@@ -84,12 +79,16 @@ def create_amendment(doc_id):
     """
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        original_doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
+        original_doc = db.documents.find_one({'_id': ObjectId(doc_id)}, route_projection())
 
         if not original_doc or not user:
             return jsonify({"error": "Document or user not found"}), 404
 
+        # With If-Match, only amend the version the client last saw
+        if is_stale(original_doc, if_match_revisions()):
+            return jsonify(conflict(original_doc).body), 409
+
         # Only approved documents can be amended
         if original_doc['status'] != 'Approved':
             return jsonify({"error": "Only approved documents can be amended"}), 400
@@ -98,7 +97,7 @@ def create_amendment(doc_id):
         existing_amendment = db.documents.find_one({
             'amended_from': str(original_doc['_id']),
             'status': {'$in': ['Draft', 'In QC', 'QC Complete', 'In Review', 'Review Complete', 'Pending Approval']}
-        })
+        }, AMENDMENT_CONFLICT_PROJECTION)
 
         if existing_amendment:
             return jsonify({
@@ -122,10 +121,8 @@ def create_amendment(doc_id):
             return jsonify({"error": "No file selected"}), 400
 
         # Store file in GridFS
-        file_id = fs.put(
+        stored = store_upload(
             file,
-            filename=file.filename,
-            content_type=file.content_type,
             uploaded_by=user_id,
             uploaded_at=datetime.datetime.now(datetime.timezone.utc)
         )
@@ -147,8 +144,10 @@ def create_amendment(doc_id):
             'approver': {},
             'revisions': [{
                 'revision_number': 0,
-                'file_id': file_id,
+                'file_id': stored['file_id'],
                 'filename': file.filename,
+                'size': stored['size'],
+                'sha256': stored['sha256'],
                 'uploaded_by_id': user_id,
                 'uploaded_by_username': user['username'],
                 'uploaded_at': datetime.datetime.now(datetime.timezone.utc)
@@ -162,34 +161,59 @@ def create_amendment(doc_id):
                 'details': f"Amendment from v{original_doc['major_version']}.{original_doc.get('minor_version', 0)} - Reason: {reason}"
             }],
             'amendment_reason': reason,
-            'amended_from': str(original_doc['_id'])
+            'amended_from': str(original_doc['_id']),
+            'is_latest': False,
+            'audit_migrated': True,
+            '_rev': 0
         }
 
-        # Insert new document
-        result = db.documents.insert_one(new_doc)
-
-        # Add history to original document
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
-            {
-                '$push': {
-                    'history': {
-                        'action': 'Amended',
-                        'user_id': user_id,
-                        'user_username': user['username'],
-                        'timestamp': datetime.datetime.now(datetime.timezone.utc),
-                        'details': f'Amendment created - New draft v{new_doc["major_version"]}.{new_doc["minor_version"]}. Reason: {reason}'
+        new_doc.update(build_search_fields(*document_search_texts(new_doc)))
+
+        def amend_in_lineage(session):
+            # Record the amendment on the original first, and only while it is still the
+            # Approved revision read above: of two concurrent amendments, one loses here
+            original = update_with_history(
+                db,
+                {'_id': original_doc['_id'], 'status': 'Approved', '_rev': original_doc.get('_rev', 0)},
+                {
+                    '$push': {
+                        'history': {
+                            'action': 'Amended',
+                            'user_id': user_id,
+                            'user_username': user['username'],
+                            'timestamp': datetime.datetime.now(datetime.timezone.utc),
+                            'details': f'Amendment created - New draft v{new_doc["major_version"]}.{new_doc["minor_version"]}. Reason: {reason}'
+                        }
                     }
-                }
-            }
-        )
+                },
+                session=session
+            )
+            if original is None:
+                current = db.documents.find_one({'_id': original_doc['_id']}, DOCUMENT_STATE_PROJECTION, session=session)
+                if current is None:
+                    raise TransitionRejected("Document or user not found", 404)
+                if current['status'] != 'Approved':
+                    raise TransitionRejected("Only approved documents can be amended", 400)
+                raise conflict(current, RACE_MESSAGE)
+
+            # Insert new document
+            insert_with_history(db, new_doc, session)
+            refresh_lineage_head(db, new_doc['lineage_id'], session)
+
+        try:
+            run_in_transaction(db, amend_in_lineage)
+        except Exception:
+            release_file(stored['file_id'])
+            raise
 
         return jsonify({
             "message": "Amendment created successfully",
-            "new_document_id": str(result.inserted_id),
+            "new_document_id": str(new_doc['_id']),
             "new_version": f"{new_doc['major_version']}.{new_doc['minor_version']}"
         }), 201
 
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in create_amendment: {e}")
         import traceback
@@ -208,7 +232,7 @@ def can_amend_document(doc_id):
     Returns false if amendment already in progress.
     """
     try:
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        doc = db.documents.find_one({'_id': ObjectId(doc_id)}, route_projection())
         
         if not doc:
             return jsonify({"error": "Document not found"}), 404
@@ -224,7 +248,7 @@ def can_amend_document(doc_id):
         existing_amendment = db.documents.find_one({
             'amended_from': str(doc['_id']),
             'status': {'$in': ['Draft', 'In QC', 'QC Complete', 'In Review', 'Review Complete', 'Pending Approval']}
-        })
+        }, AMENDMENT_CONFLICT_PROJECTION)
         
         if existing_amendment:
             return jsonify({
@@ -257,40 +281,26 @@ def withdraw_document(doc_id):
     """
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
 
-        if not user or not doc:
+        if not user:
             return jsonify({"error": "User or document not found"}), 404
 
-        # Admin can do all actions, or must be document author
-        if not is_admin(user) and doc['author_id'] != user_id:
-            return jsonify({"error": "You do not have permission to withdraw this document"}), 403
-
-        # Only these statuses can be withdrawn
-        withdrawable_statuses = [
-            'Draft', 'In QC', 'In Review', 'Pending Approval', 
-            'QC Rejected', 'Review Rejected', 'Approval Rejected', 'Under Revision'
-        ]
-        
-        if doc['status'] not in withdrawable_statuses:
-            return jsonify({"error": f"Documents with status '{doc['status']}' cannot be withdrawn"}), 400
-
         # Get withdrawal reason
         data = request.get_json()
         reason = data.get('reason', 'No reason provided')
 
-        # Update status to Withdrawn
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
+        # Admin or the document author, and only statuses before approval (see TRANSITIONS)
+        doc = apply_transition(
+            db, 'withdraw', ObjectId(doc_id), user,
             {
                 '$set': {
-                    'status': 'Withdrawn',
                     'withdrawn_at': datetime.datetime.now(datetime.timezone.utc),
                     'withdrawn_by_user_id': user_id,
                     'withdrawn_by_username': user['username'],
                     'withdrawal_reason': reason
                 },
+                '$addToSet': search_terms_update(reason),
                 '$push': {
                     'history': {
                         'action': 'Document Withdrawn',
@@ -300,11 +310,14 @@ def withdraw_document(doc_id):
                         'details': f'Document withdrawn - Reason: {reason}'
                     }
                 }
-            }
+            },
+            expected_rev=if_match_revisions()
         )
 
-        return jsonify({"message": "Document withdrawn successfully"}), 200
+        return jsonify({"message": "Document withdrawn successfully", "rev": doc['_rev']}), 200
 
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in withdraw_document: {e}")
         return jsonify({"error": str(e)}), 500
@@ -323,38 +336,30 @@ def mark_document_obsolete(doc_id):
     """
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
 
-        if not user or not doc:
+        if not user:
             return jsonify({"error": "User or document not found"}), 404
 
-        # Admin can do all actions, or Quality Manager role
-        if not is_admin(user) and user['role'] != 'Quality Manager':
-            return jsonify({"error": "You do not have permission to mark documents as obsolete"}), 403
-
-        # Only Approved documents can be marked obsolete
-        if doc['status'] != 'Approved':
-            return jsonify({"error": "Only Approved documents can be marked as obsolete"}), 400
-
         # Get obsolescence reason (required)
         data = request.get_json()
         reason = data.get('reason')
         
         if not reason:
+            check_transition(db, 'mark_obsolete', ObjectId(doc_id), user)
             return jsonify({"error": "Reason for marking document as obsolete is required"}), 400
 
-        # Update status to Obsolete
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
+        # Admin or Quality Manager, and only Approved documents (see TRANSITIONS)
+        doc = apply_transition(
+            db, 'mark_obsolete', ObjectId(doc_id), user,
             {
                 '$set': {
-                    'status': 'Obsolete',
                     'obsolete_at': datetime.datetime.now(datetime.timezone.utc),
                     'obsolete_by_user_id': user_id,
                     'obsolete_by_username': user['username'],
                     'obsolescence_reason': reason
                 },
+                '$addToSet': search_terms_update(reason),
                 '$push': {
                     'history': {
                         'action': 'Document Marked Obsolete',
@@ -364,11 +369,14 @@ def mark_document_obsolete(doc_id):
                         'details': f'Document marked as obsolete - Reason: {reason}'
                     }
                 }
-            }
+            },
+            expected_rev=if_match_revisions()
         )
 
-        return jsonify({"message": "Document marked as obsolete successfully"}), 200
+        return jsonify({"message": "Document marked as obsolete successfully", "rev": doc['_rev']}), 200
 
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in mark_document_obsolete: {e}")
         return jsonify({"error": str(e)}), 500
@@ -381,28 +389,28 @@ def delete_document(document_id):
     Delete a document (only allowed for Draft and Withdrawn status).
     Only author or admin can delete.
     """
-    import gridfs
     from bson.objectid import ObjectId
     
-    fs = gridfs.GridFS(db)
-    
     try:
         # Get current user
         user_id_str = get_jwt_identity()
-        user = db.users.find_one({'_id': ObjectId(user_id_str)})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
 
         # Get document from MongoDB
         try:
-            document = db.documents.find_one({"_id": ObjectId(document_id)})
+            document = db.documents.find_one({"_id": ObjectId(document_id)}, route_projection())
         except:
             return jsonify({"error": "Invalid document ID"}), 400
         
         if not document:
             return jsonify({"error": "Document not found"}), 404
 
+        if is_stale(document, if_match_revisions()):
+            return jsonify(conflict(document).body), 409
+
         # Extract document details
         revisions = document.get('revisions', [])
         filename = revisions[0].get('filename', 'Unknown') if revisions else 'Unknown'
@@ -420,21 +428,26 @@ def delete_document(document_id):
                 "error": f"Cannot delete document with status '{status}'. Only 'Draft' and 'Withdrawn' documents can be deleted."
             }), 400
 
-        # ✅ Delete ALL revision files from GridFS
+        # ✅ Delete document from MongoDB, only as it was checked above
+        result = db.documents.delete_one({"_id": ObjectId(document_id), "_rev": document.get('_rev', 0)})
+        
+        if result.deleted_count == 0:
+            current = db.documents.find_one({"_id": ObjectId(document_id)}, DOCUMENT_STATE_PROJECTION)
+            if current:
+                return jsonify(conflict(current, RACE_MESSAGE).body), 409
+            return jsonify({"error": "Failed to delete document from database"}), 500
+
+        # ✅ Release each revision's file; shared files stay until their last reference goes
         for revision in revisions:
             file_id = revision.get('file_id')
             if file_id:
                 try:
-                    fs.delete(file_id)
-                    print(f"✅ Deleted GridFS file: {file_id}")
+                    if release_file(file_id):
+                        print(f"✅ Deleted GridFS file: {file_id}")
                 except Exception as e:
-                    print(f"⚠️ Warning: Could not delete GridFS file {file_id}: {e}")
+                    print(f"⚠️ Warning: Could not release GridFS file {file_id}: {e}")
 
-        # ✅ Delete document from MongoDB
-        result = db.documents.delete_one({"_id": ObjectId(document_id)})
-        
-        if result.deleted_count == 0:
-            return jsonify({"error": "Failed to delete document from database"}), 500
+        refresh_lineage_head(db, document.get('lineage_id'))
 
         print(f"✅ Deleted document: {doc_number} ({filename}) by {user.get('username')}")
         
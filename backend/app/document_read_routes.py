@@ -1,22 +1,62 @@
 # backend/app/document_read_routes.py
 
-from flask import Blueprint, jsonify, send_file, request
+import base64
+import datetime
+import json
+from flask import Blueprint, Response, jsonify, request, send_file
 from . import db
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from .current_user import get_current_user
+from .search_index import search_filter, relevance_stage
+from .projections import route_projection
+from .document_revisions import revision_etag
+from .audit_log import history_page, verify_document_chain, RECENT_HISTORY_SIZE
+from .serializers import (
+    AUDIT_EVENT_SCHEMA, DOCUMENT_DETAIL_SCHEMA, LINEAGE_VERSION_SCHEMA, LIST_SCHEMA, SIGNATURE_SCHEMA
+)
+from flask_jwt_extended import jwt_required
 import gridfs
 from gridfs.errors import NoFile
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 
 document_read_blueprint = Blueprint('document_read', __name__)
 fs = gridfs.GridFS(db)
 
+# Only the fields the library table renders
+LIST_PROJECTION = {
+    'doc_number': 1, 'status': 1, 'author_id': 1, 'author_username': 1,
+    'qc_due_date': 1, 'review_due_date': 1, 'approver.due_date': 1,
+    'active_revision': 1, 'revisions.filename': 1, 'created_at': 1
+}
+
+LIST_SORT = [('created_at', -1), ('_id', -1)]
+
+
+def encode_list_cursor(doc):
+    """Opaque keyset cursor pointing just after `doc` in LIST_SORT order."""
+    payload = json.dumps({'c': doc['created_at'].isoformat(), 'i': str(doc['_id'])})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_list_cursor(token):
+    """Turn a cursor back into a filter for the rows that follow it. Raises ValueError."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        created_at = datetime.datetime.fromisoformat(payload['c'])
+        last_id = ObjectId(payload['i'])
+    except (KeyError, TypeError, ValueError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+    return {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': created_at, '_id': {'$lt': last_id}}
+    ]}
+
 @document_read_blueprint.route("/", methods=['GET'])
 @jwt_required()
 def list_documents():
     try:
-        user_id_obj = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id_obj})
+        user = get_current_user()
         if not user: 
             return jsonify({"error": "User not found"}), 404
         
@@ -24,47 +64,64 @@ def list_documents():
         limit = int(request.args.get('limit', 10))
         search_query = request.args.get('search', '')
         skip = (page - 1) * limit
+        # Cursor mode is opt-in: pass `cursor` (empty for the first page)
+        cursor_token = request.args.get('cursor')
+        cursor_mode = cursor_token is not None
+        with_total = request.args.get('with_total', 'false').lower() == 'true'
         
-        query = {}
-        if search_query:
-            query['$or'] = [
-                {'revisions.filename': {'$regex': search_query, '$options': 'i'}},
-                {'doc_number': {'$regex': search_query, '$options': 'i'}}
-            ]
-        
-        pipeline = [
-            {'$sort': {'major_version': -1}},
-            {'$group': {'_id': '$lineage_id', 'latest_doc': {'$first': '$$ROOT'}}},
-            {'$replaceRoot': {'newRoot': '$latest_doc'}},
-            {'$match': query},
-            {'$sort': {'created_at': -1}}
-        ]
-
-        total_documents = len(list(db.documents.aggregate(pipeline)))
-        paginated_pipeline = pipeline + [{'$skip': skip}, {'$limit': limit}]
-        documents_cursor = db.documents.aggregate(paginated_pipeline)
-        
-        documents_list = []
-        for doc in documents_cursor:
-            active_rev = doc.get('revisions', [])[doc.get('active_revision', 0)]
-            
-            # Get author username if not present
-            author_username = doc.get('author_username')
-            if not author_username:
-                author = db.users.find_one({'_id': doc.get('author_id')})
-                author_username = author['username'] if author else 'Unknown'
-            
-            documents_list.append({
-                'id': str(doc.get('_id')),
-                'doc_number': doc.get('doc_number', 'N/A'), 
-                'filename': active_rev.get('filename', 'Unknown'),
-                'status': doc.get('status', 'Draft'),
-                'author_username': author_username,
-                'qc_due_date': doc.get('qc_due_date'),
-                'review_due_date': doc.get('review_due_date'),
-                'approval_due_date': doc.get('approver', {}).get('due_date')
-            })
+        query = {'is_latest': True}
+        search_match, search_terms = search_filter(search_query)
+        if search_match:
+            query.update(search_match)
+
+        if cursor_mode:
+            page_query = dict(query)
+            if cursor_token:
+                try:
+                    page_query = {'$and': [query, decode_list_cursor(cursor_token)]}
+                except ValueError:
+                    return jsonify({"error": "Invalid cursor"}), 400
+            # Fetch one extra row to learn whether another page exists
+            documents = list(db.documents.find(page_query, LIST_PROJECTION).sort(LIST_SORT).limit(limit + 1))
+            has_more = len(documents) > limit
+            documents = documents[:limit]
+        elif search_match:
+            # Best matches first; cursor mode keeps date order so its cursors stay stable
+            documents = list(db.documents.aggregate([
+                {'$match': query},
+                relevance_stage(search_terms),
+                {'$sort': {'_score': -1, 'created_at': -1, '_id': -1}},
+                {'$skip': skip},
+                {'$limit': limit},
+                {'$project': LIST_PROJECTION}
+            ]))
+        else:
+            documents = list(
+                db.documents.find(query, LIST_PROJECTION)
+                .sort(LIST_SORT)
+                .skip(skip)
+                .limit(limit)
+            )
+
+        # Resolve missing author usernames in one round trip
+        missing_author_ids = {doc.get('author_id') for doc in documents if not doc.get('author_username')}
+        author_names = {}
+        if missing_author_ids:
+            for author in db.users.find({'_id': {'$in': list(missing_author_ids)}}, {'username': 1}):
+                author_names[author['_id']] = author['username']
+
+        documents_list = LIST_SCHEMA.dump_many(documents, {'author_names': author_names})
 
+        if cursor_mode:
+            response = {
+                'documents': documents_list,
+                'next_cursor': encode_list_cursor(documents[-1]) if has_more else None
+            }
+            if with_total:
+                response['totalPages'] = (db.documents.count_documents(query) + limit - 1) // limit
+            return jsonify(response), 200
+
+        total_documents = db.documents.count_documents(query)
         return jsonify({
             'documents': documents_list,
             'totalPages': (total_documents + limit - 1) // limit,
@@ -83,7 +140,7 @@ def list_documents():
 def get_document_details(doc_id):
     try:
         doc_id_obj = ObjectId(doc_id)
-        doc_metadata = db.documents.find_one({'_id': doc_id_obj})
+        doc_metadata = db.documents.find_one({'_id': doc_id_obj}, route_projection())
         if not doc_metadata:
             return jsonify({"error": "Document not found"}), 404
         
@@ -91,100 +148,27 @@ def get_document_details(doc_id):
         revisions = doc_metadata.get('revisions', [])
         if not revisions:
             return jsonify({"error": "Document has no revisions"}), 400
-            
-        active_rev_index = doc_metadata.get('active_revision', 0)
-        if active_rev_index >= len(revisions):
-            active_rev_index = len(revisions) - 1
-        active_rev = revisions[active_rev_index]
-
-        response_data = {
-            "id": str(doc_metadata.get('_id')),
-            "doc_number": doc_metadata.get('doc_number'),
-            "filename": active_rev.get('filename'),
-            "uploadDate": doc_metadata.get('created_at').isoformat() if doc_metadata.get('created_at') else None,
-            "status": doc_metadata.get('status'),
-            "version": f"{doc_metadata.get('major_version', 0)}.{doc_metadata.get('minor_version', 0)}",
-            "major_version": doc_metadata.get('major_version', 0),
-            "minor_version": doc_metadata.get('minor_version', 0),
-            "author_username": doc_metadata.get('author_username', 'Unknown'),
-            "author_id": str(doc_metadata.get('author_id')) if doc_metadata.get('author_id') else None,
-            "lineage_id": doc_metadata.get('lineage_id'),
-            "tmf_metadata": doc_metadata.get('tmf_metadata', {}),
-            "current_stage": doc_metadata.get('current_stage')
-        }
-        
-        # ✅ QC REVIEWERS - SAFE CONVERSION
-        if 'qc_reviewers' in doc_metadata and doc_metadata['qc_reviewers']:
-            qc_reviewers = []
-            for reviewer in doc_metadata['qc_reviewers']:
-                if 'user_id' in reviewer and reviewer['user_id']:
-                    qc_reviewers.append({
-                        'user_id': str(reviewer['user_id']),
-                        'status': reviewer.get('status', 'Pending'),
-                        'reviewed_at': reviewer['reviewed_at'].isoformat() if reviewer.get('reviewed_at') else None,
-                        'comment': reviewer.get('comment', '')
-                    })
-            response_data['qc_reviewers'] = qc_reviewers
-        else:
-            response_data['qc_reviewers'] = []
-        
-        # ✅ TECHNICAL REVIEWERS - SAFE CONVERSION
-        if 'reviewers' in doc_metadata and doc_metadata['reviewers']:
-            reviewers = []
-            for reviewer in doc_metadata['reviewers']:
-                if 'user_id' in reviewer and reviewer['user_id']:
-                    reviewers.append({
-                        'user_id': str(reviewer['user_id']),
-                        'status': reviewer.get('status', 'Pending'),
-                        'reviewed_at': reviewer['reviewed_at'].isoformat() if reviewer.get('reviewed_at') else None,
-                        'comment': reviewer.get('comment', '')
-                    })
-            response_data['reviewers'] = reviewers
-        else:
-            response_data['reviewers'] = []
-        
-        # ✅ APPROVER - SAFE CONVERSION
-        if 'approver' in doc_metadata and doc_metadata['approver'] and isinstance(doc_metadata['approver'], dict):
-            approver = doc_metadata['approver']
-            if 'user_id' in approver and approver['user_id']:
-                response_data['approver'] = {
-                    'user_id': str(approver['user_id']),
-                    'status': approver.get('status', 'Pending'),
-                    'approved_at': approver['approved_at'].isoformat() if approver.get('approved_at') else None,
-                    'comment': approver.get('comment', ''),
-                    'due_date': approver.get('due_date')
-                }
-            else:
-                response_data['approver'] = {}
-        else:
-            response_data['approver'] = {}
-        
-        # Due dates
-        response_data['qc_due_date'] = doc_metadata.get('qc_due_date')
-        response_data['review_due_date'] = doc_metadata.get('review_due_date')
-        response_data['approval_due_date'] = doc_metadata.get('approval_due_date')
 
-        
-        # ✅ SIGNATURE INFO - SAFE ACCESS
-        if 'signature' in doc_metadata and doc_metadata.get('signature'):
-            response_data['signature'] = doc_metadata['signature']
-            response_data['signed_at'] = doc_metadata['signed_at'].isoformat() if doc_metadata.get('signed_at') else None
-            response_data['signed_by_username'] = doc_metadata.get('signed_by_username', 'Unknown')
-            response_data['signed_by_id'] = str(doc_metadata['signed_by_id']) if doc_metadata.get('signed_by_id') else None
-
-        # ✅ HISTORY - SAFE CONVERSION
-        history_list = []
-        for entry in doc_metadata.get('history', []):
-            if entry.get('timestamp'):
-                history_list.append({
-                    "action": entry.get('action', ''),
-                    "user": entry.get('user_username', 'Unknown'),
-                    "timestamp": entry['timestamp'].isoformat(),
-                    "details": entry.get('details', '')
-                })
-        response_data['history'] = history_list
-
-        return jsonify(response_data), 200
+        response_data = DOCUMENT_DETAIL_SCHEMA.dump(doc_metadata)
+        if doc_metadata.get('signature'):
+            response_data.update(SIGNATURE_SCHEMA.dump(doc_metadata))
+        # Only the most recent entries live on the document; older ones are paged from /history.
+        # A full list may be the whole trail, so count the events, stopping one past the list
+        recent = len(doc_metadata.get('history', []))
+        response_data['history_has_more'] = recent >= RECENT_HISTORY_SIZE and db.audit_events.count_documents(
+            {'document_id': doc_id_obj}, limit=recent + 1
+        ) > recent
+
+        # The revision changes with every update, so it validates the whole response
+        etag = revision_etag(response_data['rev'])
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(response_data)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
         
     except InvalidId:
         return jsonify({"error": "Invalid document ID format"}), 400
@@ -196,44 +180,123 @@ def get_document_details(doc_id):
 
     
 
+def file_etag(revision):
+    """Strong validator for a revision's file: its SHA-256, or the GridFS id for older uploads.
+
+    GridFS files are never rewritten, so either identifies the exact bytes.
+    """
+    return revision.get('sha256') or str(revision['file_id'])
+
+
 @document_read_blueprint.route("/<doc_id>/preview", methods=['GET'])
 @jwt_required()
 def preview_document(doc_id):
-    # This route remains the same, but the logic is now fully correct in context.
+    """Stream the active revision with ETag/Last-Modified validators and byte-range support.
+
+    Range requests seek inside the GridFS file, so only the chunks covering the
+    requested bytes are read. A matching If-None-Match or If-Modified-Since
+    gets 304, and If-Range is honoured.
+    """
     try:
-        doc_metadata = db.documents.find_one({'_id': ObjectId(doc_id)})
+        doc_metadata = db.documents.find_one({'_id': ObjectId(doc_id)}, route_projection())
         if not doc_metadata:
             return jsonify({"error": "Document metadata not found"}), 404
         
         active_rev = doc_metadata.get('revisions', [])[doc_metadata.get('active_revision', 0)]
-        file_id_obj = active_rev.get('file_id')
+        etag = file_etag(active_rev)
 
-        grid_out = fs.get(file_id_obj)
-        return send_file(
+        # Revalidation of a cached copy needs nothing from GridFS
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        grid_out = fs.get(active_rev.get('file_id'))
+        response = send_file(
             grid_out,
-            mimetype=grid_out.contentType,
-            download_name=grid_out.filename
+            mimetype=grid_out.content_type,
+            download_name=grid_out.filename,
+            etag=etag,
+            last_modified=grid_out.upload_date,
+            conditional=False
         )
+        # send_file cannot size a file object; GridFS knows the length, which enables ranges
+        response.content_length = grid_out.length
+        response.cache_control.private = True
+        try:
+            return response.make_conditional(request, accept_ranges=True, complete_length=grid_out.length)
+        except RequestedRangeNotSatisfiable:
+            grid_out.close()
+            raise
     except NoFile:
         return jsonify({"error": "File data not found in GridFS"}), 404
     except (InvalidId, IndexError):
         return jsonify({"error": "Invalid ID format or revision not found"}), 400
 
 
+HISTORY_PAGE_LIMIT = 100
+
+
+def encode_history_cursor(event):
+    """Opaque cursor pointing just after `event` in newest-first order."""
+    payload = json.dumps({'t': event['timestamp'].isoformat(), 'i': str(event['_id'])})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_history_cursor(token):
+    """(timestamp, _id) of the last event seen. Raises ValueError."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return datetime.datetime.fromisoformat(payload['t']), ObjectId(payload['i'])
+    except (KeyError, TypeError, ValueError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+@document_read_blueprint.route("/<doc_id>/history", methods=['GET'])
+@jwt_required()
+def get_document_history(doc_id):
+    """Full audit trail, newest first, `limit` events per page; pass `next_cursor` back as `cursor`."""
+    try:
+        limit = min(max(request.args.get('limit', 50, type=int), 1), HISTORY_PAGE_LIMIT)
+        before = decode_history_cursor(request.args['cursor']) if request.args.get('cursor') else None
+
+        events = history_page(db, ObjectId(doc_id), limit + 1, before)
+        has_more = len(events) > limit
+        events = events[:limit]
+
+        return jsonify({
+            'events': AUDIT_EVENT_SCHEMA.dump_many(events),
+            'next_cursor': encode_history_cursor(events[-1]) if has_more else None
+        }), 200
+    except (InvalidId, ValueError):
+        return jsonify({"error": "Invalid document ID or cursor"}), 400
+    except Exception as e:
+        print(f"Error in get_document_history: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@document_read_blueprint.route("/<doc_id>/history/verify", methods=['GET'])
+@jwt_required()
+def verify_document_history(doc_id):
+    """Re-check the document's whole audit hash chain."""
+    try:
+        result = verify_document_chain(db, ObjectId(doc_id))
+        return jsonify(result), 200
+    except InvalidId:
+        return jsonify({"error": "Invalid document ID"}), 400
+    except Exception as e:
+        print(f"Error in verify_document_history: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @document_read_blueprint.route("/lineage/<lineage_id>", methods=['GET'])
 @jwt_required()
 def get_document_lineage(lineage_id):
     try:
-        lineage_cursor = db.documents.find({'lineage_id': lineage_id}).sort('major_version', -1)
-        version_history = []
-        for doc in lineage_cursor:
-            version_history.append({
-                'id': str(doc['_id']),
-                'version': f"{doc.get('major_version')}.{doc.get('minor_version')}",
-                'status': doc.get('status'),
-                'uploadDate': doc.get('created_at').isoformat()
-            })
-        return jsonify(version_history), 200
+        lineage_cursor = db.documents.find({'lineage_id': lineage_id}, route_projection()).sort('major_version', -1)
+        return jsonify(LINEAGE_VERSION_SCHEMA.dump_many(lineage_cursor)), 200
     except Exception as e:
         print(f"Error in get_document_lineage: {e}")
         return jsonify({"error": "AnF internal server error occurred"}), 500
\ No newline at end of file
@@ -0,0 +1,65 @@
+# backend/app/document_revisions.py
+
+"""
+Optimistic concurrency for documents.
+
+Every document carries `_rev`, a counter that update_with_history increments
+on each change a user makes. Any other write that changes a field the detail
+response renders must bump it too (migrate_history does), or clients keep
+revalidating a stale copy. Bookkeeping writes such as `is_latest` or the
+search backfill touch no rendered field and leave it alone. Documents start
+at 0.
+
+Detail responses send the counter as `rev` and as the ETag `"rev-<n>"`.
+Task rows and write responses also carry `rev`. A write endpoint given that
+ETag in If-Match only updates the document while it is still at that
+revision. A client acting on a stale copy gets 409 with the document's
+current state, including the new `rev` to retry with, instead of
+overwriting a change it never saw:
+
+    POST /api/documents/<id>/recall
+    If-Match: "rev-7"
+
+Without If-Match, writes go ahead at any revision; the transition's status
+and guard checks still apply.
+"""
+
+from flask import request
+
+ETAG_PREFIX = 'rev-'
+
+
+def revision_etag(rev):
+    return f"{ETAG_PREFIX}{rev}"
+
+
+def if_match_revisions():
+    """Revisions the request's If-Match header accepts, or None when it accepts any.
+
+    Weak or unrecognised tags can never match, so a header made only of those
+    yields an empty list and the write conflicts.
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    revisions = []
+    for tag in if_match.as_set():
+        number = tag[len(ETAG_PREFIX):]
+        if tag.startswith(ETAG_PREFIX) and number.isdigit():
+            revisions.append(int(number))
+    return revisions
+
+
+def revision_filter(revisions):
+    """Query condition matching documents at one of `revisions`."""
+    return {'_rev': revisions[0] if len(revisions) == 1 else {'$in': list(revisions)}}
+
+
+def is_stale(doc, revisions):
+    """True if `revisions` were given and the document is at none of them."""
+    return revisions is not None and doc.get('_rev', 0) not in revisions
+
+
+def backfill_revisions(db):
+    """Start documents written before `_rev` existed at revision 0. Safe to run repeatedly."""
+    return db.documents.update_many({'_rev': {'$exists': False}}, {'$set': {'_rev': 0}}).modified_count
@@ -4,15 +4,17 @@ import datetime
 import uuid
 from flask import Blueprint, request, jsonify
 from . import db
+from .current_user import get_current_user
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import gridfs
 from bson.objectid import ObjectId
+from .search_index import build_search_fields, document_search_texts
+from .file_storage import store_upload, release_file
+from .audit_log import insert_with_history
+from .serializers import TASK_SCHEMA
 
 # --- Blueprint for document creation and basic data ---
 document_blueprint = Blueprint('documents', __name__)
 
-fs = gridfs.GridFS(db)
-
 def get_next_sequence(name):
     ret = db.counters.find_one_and_update(
         {'_id': name}, {'$inc': {'seq': 1}},
@@ -31,7 +33,7 @@ def upload_document():
 
     try:
         user_id_str = get_jwt_identity()
-        user = db.users.find_one({'_id': ObjectId(user_id_str)})
+        user = get_current_user()
         if not user:
             return jsonify({"error": "Authenticated user not found"}), 404
 
@@ -44,246 +46,153 @@ def upload_document():
             "tmf_artifact": request.form.get("tmf_artifact", '')
         }
 
-        file_id = fs.put(file, filename=file.filename, contentType=file.content_type)
-        doc_seq = get_next_sequence('document_id')
-        doc_number = f"REG-TMF-{doc_seq:05d}"
+        stored = store_upload(file)
+        try:
+            doc_seq = get_next_sequence('document_id')
+            doc_number = f"REG-TMF-{doc_seq:05d}"
 
-        first_revision = {
-            "revision_number": 0, "file_id": file_id, "filename": file.filename,
-            "author_comment": request.form.get('comment', 'Initial version.'),
-            "uploaded_at": datetime.datetime.now(datetime.timezone.utc)
-        }
+            first_revision = {
+                "revision_number": 0, "file_id": stored['file_id'], "filename": file.filename,
+                "size": stored['size'], "sha256": stored['sha256'],
+                "author_comment": request.form.get('comment', 'Initial version.'),
+                "uploaded_at": datetime.datetime.now(datetime.timezone.utc)
+            }
 
-        document_metadata = {
-            "doc_number": doc_number, "major_version": 0, "minor_version": 1,
-            "lineage_id": str(uuid.uuid4()), "status": "Draft",
-            "author_id": ObjectId(user_id_str), "author_username": user.get('username'),
-            "created_at": datetime.datetime.now(datetime.timezone.utc),
-            "tmf_metadata": tmf_metadata, "workflow": [], "revisions": [first_revision],
-            "active_revision": 0,
-            "workflow_config": {
-              "skip_qc": False,  # Default: QC required
-                "qc_required": True
-            },
-            "history": [{
-                "action": "Created", "user_id": ObjectId(user_id_str),
-                "user_username": user.get('username'),
-                "timestamp": datetime.datetime.now(datetime.timezone.utc),
-                "details": f"Document created: {file.filename} (v0.1)"
-            }]
-        }
+            document_metadata = {
+                "doc_number": doc_number, "major_version": 0, "minor_version": 1,
+                "lineage_id": str(uuid.uuid4()), "status": "Draft", "is_latest": True,
+                "author_id": ObjectId(user_id_str), "author_username": user.get('username'),
+                "created_at": datetime.datetime.now(datetime.timezone.utc),
+                "tmf_metadata": tmf_metadata, "workflow": [], "revisions": [first_revision],
+                "active_revision": 0, "audit_migrated": True, "_rev": 0,
+                "workflow_config": {
+                  "skip_qc": False,  # Default: QC required
+                    "qc_required": True
+                },
+                "history": [{
+                    "action": "Created", "user_id": ObjectId(user_id_str),
+                    "user_username": user.get('username'),
+                    "timestamp": datetime.datetime.now(datetime.timezone.utc),
+                    "details": f"Document created: {file.filename} (v0.1)"
+                }]
+            }
+
+            document_metadata.update(build_search_fields(*document_search_texts(document_metadata)))
+
+            insert_with_history(db, document_metadata)
+        except Exception:
+            # No document points at the file yet
+            release_file(stored['file_id'])
+            raise
 
-        db.documents.insert_one(document_metadata)
         return jsonify({"message": "Document uploaded", "doc_number": doc_number}), 201
 
     except Exception as e:
         print(f"Error in upload_document: {e}")
         return jsonify({"error": "An internal error occurred"}), 500
 
+# Fields the task list needs; history, revisions and signature material stay on the server
+TASK_PROJECTION = {
+    'doc_number': 1, 'status': 1, 'current_stage': 1, 'lineage_id': 1,
+    'major_version': 1, 'minor_version': 1, 'created_at': 1,
+    'author_id': 1, 'author_username': 1, 'tmf_metadata': 1,
+    'qc_reviewers': 1, 'reviewers': 1, 'approver': 1,
+    'qc_due_date': 1, 'review_due_date': 1,
+    'signed_at': 1, 'signed_by_id': 1, 'signed_by_username': 1, '_rev': 1,
+    'filename': {'$arrayElemAt': ['$revisions.filename', {'$ifNull': ['$active_revision', 0]}]},
+    'approval_due_date': {'$ifNull': ['$approver.due_date', '$approval_due_date']}
+}
+
+# Urgency buckets: 0 overdue, 1 due within two days, 2 later, 3 no due date
+URGENCY_OVERDUE, URGENCY_DUE_SOON, URGENCY_FUTURE, URGENCY_NONE = 0, 1, 2, 3
+
+TASK_PAGE_SIZE = 50
+TASK_PAGE_LIMIT = 100
+
+
+def build_task_match(user):
+    """Everything waiting on this user; Admins oversee all documents."""
+    if user.get('role') == 'Admin':
+        return {}
+    user_id = user['_id']
+    return {'$or': [
+        {'status': 'In QC', 'qc_reviewers': {'$elemMatch': {'user_id': user_id, 'status': 'Pending'}}},
+        {'status': 'In Review', 'reviewers': {'$elemMatch': {'user_id': user_id, 'status': 'Pending'}}},
+        {'status': 'Pending Approval', 'approver.user_id': user_id, 'approver.status': 'Pending'},
+        {'author_id': user_id, 'status': {'$in': ['Draft', 'QC Complete', 'Review Complete']}}
+    ]}
+
+
+def build_task_pipeline(user, now, skip=0, limit=TASK_PAGE_SIZE):
+    """One aggregation: match, slim projection, urgency bucket, sort and page.
+
+    The total is counted separately, so no stage ever holds more than a page.
+    """
+    soon = now + datetime.timedelta(days=2)
+
+    return [
+        {'$match': build_task_match(user)},
+        {'$project': TASK_PROJECTION},
+        {'$addFields': {'due_date': {'$switch': {
+            'branches': [
+                {'case': {'$eq': ['$status', 'In QC']}, 'then': '$qc_due_date'},
+                {'case': {'$eq': ['$status', 'In Review']}, 'then': '$review_due_date'},
+                {'case': {'$eq': ['$status', 'Pending Approval']}, 'then': '$approval_due_date'}
+            ],
+            'default': None
+        }}}},
+        {'$addFields': {'due_at': {'$dateFromString': {
+            'dateString': '$due_date', 'onError': None, 'onNull': None
+        }}}},
+        {'$addFields': {'urgency': {'$switch': {
+            'branches': [
+                {'case': {'$eq': [{'$ifNull': ['$due_at', None]}, None]}, 'then': URGENCY_NONE},
+                {'case': {'$lt': ['$due_at', now]}, 'then': URGENCY_OVERDUE},
+                {'case': {'$lt': ['$due_at', soon]}, 'then': URGENCY_DUE_SOON}
+            ],
+            'default': URGENCY_FUTURE
+        }}}},
+        {'$sort': {'urgency': 1, 'due_date': 1, '_id': 1}},
+        {'$project': {'due_at': 0}},
+        {'$skip': skip},
+        {'$limit': limit}
+    ]
+
+
 @document_blueprint.route("/my-tasks", methods=['GET'])
 @jwt_required()
 def get_my_tasks():
-    """Get documents assigned to current user for review (or all documents for Admin)"""
+    """Get documents assigned to current user for review (or all documents for Admin).
+
+    Sorted most urgent first, `limit` (default TASK_PAGE_SIZE, at most
+    TASK_PAGE_LIMIT) per `page`. The unpaged total is returned in the
+    X-Total-Count header.
+    """
     try:
-        user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
-        
-        documents = []
-        
-        # ✅ ADMIN SEES ALL DOCUMENTS (oversight role)
-        if user.get('role') == 'Admin':
-            all_docs = list(db.documents.find({}))
-            documents = all_docs
-        else:
-            # Regular users: only assigned documents
-            qc_docs = list(db.documents.find({
-                'status': 'In QC',
-                'qc_reviewers': {
-                    '$elemMatch': {
-                        'user_id': user_id,
-                        'status': 'Pending'
-                    }
-                }
-            }))
-            
-            review_docs = list(db.documents.find({
-                'status': 'In Review',
-                'reviewers': {
-                    '$elemMatch': {
-                        'user_id': user_id,
-                        'status': 'Pending'
-                    }
-                }
-            }))
-            
-            approval_docs = list(db.documents.find({
-                'status': 'Pending Approval',
-                'approver.user_id': user_id,
-                'approver.status': 'Pending'
-            }))
-            
-            draft_docs = list(db.documents.find({
-                'author_id': user_id,
-                'status': {'$in': ['Draft', 'QC Complete', 'Review Complete']}
-            }))
-            
-            all_docs = qc_docs + review_docs + approval_docs + draft_docs
-            
-            # Remove duplicates
-            seen_ids = set()
-            unique_docs = []
-            for doc in all_docs:
-                doc_id = str(doc['_id'])
-                if doc_id not in seen_ids:
-                    seen_ids.add(doc_id)
-                    unique_docs.append(doc)
-            
-            documents = unique_docs
-        
-        # ✅ FORMAT RESPONSE - Convert ALL ObjectIds to strings
-        for doc in documents:
-            # Convert document ID
-            doc['id'] = str(doc['_id'])
-            del doc['_id']
-            
-            # ✅ FIX: Store original author_id ObjectId before converting
-            original_author_id = doc.get('author_id')
-            
-            # Convert author_id
-            if 'author_id' in doc and doc['author_id']:
-                doc['author_id'] = str(doc['author_id'])
-                if 'author_username' not in doc:
-                    # Use original ObjectId, not converted string
-                    author = db.users.find_one({'_id': original_author_id})
-                    doc['author_username'] = author['username'] if author else 'Unknown'
-            
-            # Ensure doc_number exists
-            if 'doc_number' not in doc:
-                doc['doc_number'] = 'N/A'
-            
-            # Build version string
-            major = doc.get('major_version', 1)
-            minor = doc.get('minor_version', 0)
-            doc['version'] = f"{major}.{minor}"
-            
-            # Get filename from revisions
-            if 'revisions' in doc and len(doc['revisions']) > 0:
-                active_rev_idx = doc.get('active_revision', 0)
-                doc['filename'] = doc['revisions'][active_rev_idx].get('filename', 'Unknown')
-            
-            # Due date fields (already ISO strings, no conversion needed)
-            doc['qc_due_date'] = doc.get('qc_due_date')
-            doc['review_due_date'] = doc.get('review_due_date')
-            if 'approver' in doc and doc['approver']:
-                doc['approval_due_date'] = doc['approver'].get('due_date')
-            else:
-                doc['approval_due_date'] = None
-            
-            # ✅ Convert QC reviewers
-            if 'qc_reviewers' in doc:
-                for reviewer in doc['qc_reviewers']:
-                    if 'user_id' in reviewer and isinstance(reviewer['user_id'], ObjectId):
-                        reviewer['user_id'] = str(reviewer['user_id'])
-                    if reviewer.get('reviewed_at') and hasattr(reviewer['reviewed_at'], 'isoformat'):
-                        reviewer['reviewed_at'] = reviewer['reviewed_at'].isoformat()
-            
-            # ✅ Convert technical reviewers
-            if 'reviewers' in doc:
-                for reviewer in doc['reviewers']:
-                    if 'user_id' in reviewer and isinstance(reviewer['user_id'], ObjectId):
-                        reviewer['user_id'] = str(reviewer['user_id'])
-                    if reviewer.get('reviewed_at') and hasattr(reviewer['reviewed_at'], 'isoformat'):
-                        reviewer['reviewed_at'] = reviewer['reviewed_at'].isoformat()
-            
-            # ✅ Convert approver
-            if 'approver' in doc and doc['approver']:
-                if 'user_id' in doc['approver'] and isinstance(doc['approver']['user_id'], ObjectId):
-                    doc['approver']['user_id'] = str(doc['approver']['user_id'])
-                if doc['approver'].get('approved_at') and hasattr(doc['approver'].get('approved_at'), 'isoformat'):
-                    doc['approver']['approved_at'] = doc['approver']['approved_at'].isoformat()
-            
-            # ✅ Convert signed_by_id (CRITICAL FIX FOR APPROVED DOCUMENTS)
-            if 'signed_by_id' in doc and isinstance(doc['signed_by_id'], ObjectId):
-                doc['signed_by_id'] = str(doc['signed_by_id'])
-            
-            # ✅ Convert withdrawn_by_user_id
-            if 'withdrawn_by_user_id' in doc and isinstance(doc['withdrawn_by_user_id'], ObjectId):
-                doc['withdrawn_by_user_id'] = str(doc['withdrawn_by_user_id'])
-            
-            # ✅ Convert archived_by_user_id
-            if 'archived_by_user_id' in doc and isinstance(doc['archived_by_user_id'], ObjectId):
-                doc['archived_by_user_id'] = str(doc['archived_by_user_id'])
-            
-            # ✅ Convert obsolete_by_user_id
-            if 'obsolete_by_user_id' in doc and isinstance(doc['obsolete_by_user_id'], ObjectId):
-                doc['obsolete_by_user_id'] = str(doc['obsolete_by_user_id'])
-            
-            # ✅ Convert history
-            if 'history' in doc:
-                for entry in doc['history']:
-                    if 'user_id' in entry and isinstance(entry['user_id'], ObjectId):
-                        entry['user_id'] = str(entry['user_id'])
-                    if 'timestamp' in entry and hasattr(entry['timestamp'], 'isoformat'):
-                        entry['timestamp'] = entry['timestamp'].isoformat()
-            
-            # Convert dates
-            if 'created_at' in doc and hasattr(doc['created_at'], 'isoformat'):
-                doc['created_at'] = doc['created_at'].isoformat()
-            if 'signed_at' in doc and hasattr(doc['signed_at'], 'isoformat'):
-                doc['signed_at'] = doc['signed_at'].isoformat()
-            if 'withdrawn_at' in doc and hasattr(doc['withdrawn_at'], 'isoformat'):
-                doc['withdrawn_at'] = doc['withdrawn_at'].isoformat()
-            if 'archived_at' in doc and hasattr(doc['archived_at'], 'isoformat'):
-                doc['archived_at'] = doc['archived_at'].isoformat()
-            if 'obsolete_at' in doc and hasattr(doc['obsolete_at'], 'isoformat'):
-                doc['obsolete_at'] = doc['obsolete_at'].isoformat()
-            
-            # ✅ Convert revisions
-            if 'revisions' in doc:
-                for rev in doc['revisions']:
-                    if 'file_id' in rev and isinstance(rev['file_id'], ObjectId):
-                        rev['file_id'] = str(rev['file_id'])
-                    if 'uploaded_by_id' in rev and isinstance(rev['uploaded_by_id'], ObjectId):
-                        rev['uploaded_by_id'] = str(rev['uploaded_by_id'])
-                    if 'uploaded_at' in rev and hasattr(rev['uploaded_at'], 'isoformat'):
-                        rev['uploaded_at'] = rev['uploaded_at'].isoformat()
-        
-        # ✅ SORT DOCUMENTS BY DUE DATE (MOST URGENT FIRST)
-        def get_sort_key(doc):
-            status = doc.get('status', '')
-            due_date = None
-            
-            if status == 'In QC':
-                due_date = doc.get('qc_due_date')
-            elif status == 'In Review':
-                due_date = doc.get('review_due_date')
-            elif status == 'Pending Approval':
-                due_date = doc.get('approval_due_date')
-            
-            if not due_date:
-                return (3, "9999-12-31")
-            
-            from datetime import datetime
-            try:
-                due = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                now = datetime.now(due.tzinfo) if due.tzinfo else datetime.now()
-                days_diff = (due - now).days
-                
-                if days_diff < 0:
-                    return (0, due_date)  # Overdue
-                elif days_diff <= 1:
-                    return (1, due_date)  # Due soon
-                else:
-                    return (2, due_date)  # Future
-            except:
-                return (3, "9999-12-31")
-        
-        documents.sort(key=get_sort_key)
 
-        return jsonify(documents), 200
+        limit = min(max(request.args.get('limit', TASK_PAGE_SIZE, type=int), 1), TASK_PAGE_LIMIT)
+        page = max(request.args.get('page', 1, type=int), 1)
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        documents = list(db.documents.aggregate(build_task_pipeline(user, now, (page - 1) * limit, limit)))
+        total = db.documents.count_documents(build_task_match(user))
+
+        # Older documents may lack author_username; resolve them in one query
+        missing_author_ids = list({doc.get('author_id') for doc in documents if not doc.get('author_username')})
+        author_names = {}
+        if missing_author_ids:
+            for author in db.users.find({'_id': {'$in': missing_author_ids}}, {'username': 1}):
+                author_names[author['_id']] = author['username']
+
+        tasks = TASK_SCHEMA.dump_many(documents, {'author_names': author_names})
+
+        response = jsonify(tasks)
+        response.headers['X-Total-Count'] = str(total)
+        return response, 200
         
     except Exception as e:
         print(f"Error in get_my_tasks: {e}")
@@ -3,10 +3,23 @@
 import datetime
 from flask import Blueprint, jsonify, request
 from . import db
+from .current_user import get_current_user
+from .document_heads import refresh_lineage_head
+from .search_index import build_search_fields, document_search_texts, search_terms_stage, search_terms_update
+from .audit_log import insert_with_history, update_with_history
+from .file_storage import store_upload, release_file, upload_precheck
+from .projections import route_projection, AMENDMENT_CONFLICT_PROJECTION, DOCUMENT_STATE_PROJECTION
+from .document_revisions import if_match_revisions, is_stale
+from .transactions import is_chain_position_conflict, run_in_transaction
+from .workflow_transitions import (
+    LINEAGE_CONFLICT_MESSAGE, RACE_MESSAGE, TRANSITIONS, TransitionRejected, apply_transition,
+    check_transition, conflict, literal, review_update
+)
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson.objectid import ObjectId
-from .crypto_utils import sign_data, verify_signature
-from .email_service import send_workflow_notification
+from pymongo.errors import DuplicateKeyError
+from .crypto_utils import hash_stream, sign_digest, verify_digest
+from .email_service import email_configured, send_workflow_notifications
 import gridfs
 
 
@@ -14,9 +27,44 @@ document_workflow_blueprint = Blueprint('document_workflow', __name__)
 fs = gridfs.GridFS(db)
 
 
-def is_admin_or_author(user, doc):
-    """Check if user is admin or document author"""
-    return user['role'] == 'Admin' or doc['author_id'] == user['_id']
+def notify_assignees(assignee_ids, doc, status, workflow_type, sender_name):
+    """Email everyone assigned in one workflow transition: one users query, one send batch"""
+    if not email_configured():
+        print("⚠️ Email not configured - skipping notifications")
+        return
+    try:
+        recipients = db.users.find(
+            {'_id': {'$in': [ObjectId(assignee_id) for assignee_id in assignee_ids]}},
+            {'email': 1, 'username': 1}
+        )
+        send_workflow_notifications(
+            recipients=list(recipients),
+            document_info={
+                'name': doc.get('doc_number', 'Document'),
+                'id': str(doc['_id']),
+                'status': status
+            },
+            workflow_type=workflow_type,
+            sender_name=sender_name
+        )
+    except Exception as email_error:
+        print(f"⚠️ Failed to send {workflow_type} emails: {email_error}")
+
+
+def transition_allowed(name):
+    """Upload precheck: answer 404/403/400/409 before storing the body of a transition the user cannot make."""
+    def check(doc_id):
+        try:
+            user = get_current_user()
+            if not user:
+                return jsonify({"error": "Document or user not found"}), 404
+            check_transition(db, name, ObjectId(doc_id), user, expected_rev=if_match_revisions())
+        except TransitionRejected as e:
+            return jsonify(e.body), e.status_code
+        except Exception as e:
+            print(f"Error checking {name}: {e}")
+            return jsonify({"error": str(e)}), 500
+    return check
 
 
 @document_workflow_blueprint.route("/<doc_id>/submit-qc", methods=['POST'])
@@ -25,23 +73,17 @@ def submit_for_qc(doc_id):
     """Author submits document to QC reviewers"""
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
         
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
-            
-        if not is_admin_or_author(user, doc):
-            return jsonify({"error": "Only author or admin can submit"}), 403
-            
-        if doc['status'] != 'Draft':
-            return jsonify({"error": "Only draft documents can be submitted to QC"}), 400
         
         data = request.get_json()
         qc_reviewer_ids = data.get('qc_reviewers', [])
         due_date = data.get('due_date')
         
         if not qc_reviewer_ids:
+            check_transition(db, 'submit_qc', ObjectId(doc_id), user)
             return jsonify({"error": "At least one QC reviewer must be selected"}), 400
         
         qc_reviewers = []
@@ -53,11 +95,9 @@ def submit_for_qc(doc_id):
                 'comment': ''
             })
         
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
+        doc = apply_transition(
+            db, 'submit_qc', ObjectId(doc_id), user,
             {'$set': {
-                'status': 'In QC',
-                'current_stage': 'QC',
                 'qc_reviewers': qc_reviewers,
                 'qc_due_date': due_date
             },
@@ -69,30 +109,17 @@ def submit_for_qc(doc_id):
                     'timestamp': datetime.datetime.now(datetime.timezone.utc),
                     'details': f"Submitted to {len(qc_reviewer_ids)} QC reviewer(s)"
                 }
-            }}
+            }},
+            expected_rev=if_match_revisions()
         )
         
         # ✅ SEND EMAIL NOTIFICATIONS TO ALL QC REVIEWERS
-        for reviewer_id in qc_reviewer_ids:
-            try:
-                reviewer = db.users.find_one({'_id': ObjectId(reviewer_id)})
-                if reviewer and reviewer.get('email'):
-                    send_workflow_notification(
-                        recipient_email=reviewer['email'],
-                        recipient_name=reviewer['username'],
-                        document_info={
-                            'name': doc.get('doc_number', 'Document'),
-                            'id': str(doc['_id']),
-                            'status': 'In QC'
-                        },
-                        workflow_type='QC Review',
-                        sender_name=user['username']
-                    )
-            except Exception as email_error:
-                print(f"⚠️ Failed to send email to reviewer {reviewer_id}: {email_error}")
+        notify_assignees(qc_reviewer_ids, doc, 'In QC', 'QC Review', user['username'])
         
-        return jsonify({"message": "Document submitted to QC successfully"}), 200
+        return jsonify({"message": "Document submitted to QC successfully", "rev": doc['_rev']}), 200
         
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in submit_for_qc: {e}")
         return jsonify({"error": str(e)}), 500
@@ -104,23 +131,17 @@ def submit_for_review_direct(doc_id):
     """Author submits draft document directly to technical reviewers (skip QC)"""
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
         
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
-            
-        if not is_admin_or_author(user, doc):
-            return jsonify({"error": "Only author or admin can submit"}), 403
-            
-        if doc['status'] != 'Draft':
-            return jsonify({"error": "Only draft documents can be submitted"}), 400
         
         data = request.get_json()
         reviewer_ids = data.get('reviewers', [])
         due_date = data.get('due_date')
         
         if not reviewer_ids:
+            check_transition(db, 'submit_review_direct', ObjectId(doc_id), user)
             return jsonify({"error": "At least one reviewer must be selected"}), 400
         
         reviewers = []
@@ -132,11 +153,9 @@ def submit_for_review_direct(doc_id):
                 'comment': ''
             })
         
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
+        doc = apply_transition(
+            db, 'submit_review_direct', ObjectId(doc_id), user,
             {'$set': {
-                'status': 'In Review',
-                'current_stage': 'Technical Review',
                 'reviewers': reviewers,
                 'review_due_date': due_date,
                 'qc_skipped': True
@@ -149,29 +168,16 @@ def submit_for_review_direct(doc_id):
                     'timestamp': datetime.datetime.now(datetime.timezone.utc),
                     'details': f"Low-risk document - QC skipped. Submitted to {len(reviewer_ids)} reviewer(s)"
                 }
-            }}
+            }},
+            expected_rev=if_match_revisions()
         )
         
-        for reviewer_id in reviewer_ids:
-            try:
-                reviewer = db.users.find_one({'_id': ObjectId(reviewer_id)})
-                if reviewer and reviewer.get('email'):
-                    send_workflow_notification(
-                        recipient_email=reviewer['email'],
-                        recipient_name=reviewer['username'],
-                        document_info={
-                            'name': doc.get('doc_number', 'Document'),
-                            'id': str(doc['_id']),
-                            'status': 'In Review'
-                        },
-                        workflow_type='Technical Review',
-                        sender_name=user['username']
-                    )
-            except Exception as email_error:
-                print(f"⚠️ Failed to send email to reviewer {reviewer_id}: {email_error}")
+        notify_assignees(reviewer_ids, doc, 'In Review', 'Technical Review', user['username'])
         
-        return jsonify({"message": "Document submitted for technical review (QC skipped)"}), 200
+        return jsonify({"message": "Document submitted for technical review (QC skipped)", "rev": doc['_rev']}), 200
         
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in submit_for_review_direct: {e}")
         return jsonify({"error": str(e)}), 500
@@ -180,85 +186,29 @@ def submit_for_review_direct(doc_id):
 @jwt_required()
 def qc_review(doc_id):
     try:
-        user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
 
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
 
-        if doc['status'] != 'In QC':
-            return jsonify({"error": "Document is not in QC stage"}), 400
-
         data = request.get_json()
         decision = data.get('decision')  # 'Pass' or 'Fail'
         comment = data.get('comment', '')
 
         if decision not in ['Pass', 'Fail']:
+            check_transition(db, 'qc_review', ObjectId(doc_id), user, guard=False)
             return jsonify({"error": "Invalid decision"}), 400
 
-        qc_reviewers = doc.get('qc_reviewers', [])
-        reviewer_idx = next((i for i, r in enumerate(qc_reviewers) if r['user_id'] == user_id), None)
-
-        if reviewer_idx is None:
-            if user['role'] == 'Admin':
-                qc_reviewers.append({
-                    'user_id': user_id,
-                    'status': 'Pending',
-                    'reviewed_at': None,
-                    'comment': ''
-                })
-                reviewer_idx = len(qc_reviewers) - 1
-            else:
-                return jsonify({"error": "You are not assigned as QC reviewer"}), 403
-
-        qc_reviewers[reviewer_idx] = {
-            'user_id': user_id,
-            'status': decision,
-            'reviewed_at': datetime.datetime.now(datetime.timezone.utc),
-            'comment': comment
-        }
-
-        if user['role'] == 'Admin':
-            if decision == 'Fail':
-                new_status = 'QC Rejected'
-                action_text = f"QC Rejected by Admin {user['username']}"
-            else:
-                new_status = 'QC Complete'
-                action_text = f"QC Passed by Admin {user['username']}"
-        else:
-            any_failed = any(r['status'] == 'Fail' for r in qc_reviewers)
-            all_done = all(r['status'] != 'Pending' for r in qc_reviewers)
-
-            if any_failed:
-                new_status = 'QC Rejected'
-                action_text = f"QC Rejected by {user['username']}"
-            elif all_done:
-                new_status = 'QC Complete'
-                action_text = "QC Review Completed - All Passed"
-            else:
-                new_status = 'In QC'
-                action_text = f"QC {decision} by {user['username']}"
-
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
-            {'$set': {
-                'status': new_status,
-                'qc_reviewers': qc_reviewers
-            },
-            '$push': {
-                'history': {
-                    'action': action_text,
-                    'user_id': user_id,
-                    'user_username': user['username'],
-                    'timestamp': datetime.datetime.now(datetime.timezone.utc),
-                    'details': comment
-                }
-            }}
+        # One pipeline records the decision and derives the status from every reviewer's
+        pipeline, history = review_update('qc_review', user, decision, comment)
+        doc = apply_transition(
+            db, 'qc_review', ObjectId(doc_id), user, pipeline, history, expected_rev=if_match_revisions()
         )
 
-        return jsonify({"message": f"QC Review: {decision}"}), 200
+        return jsonify({"message": f"QC Review: {decision}", "rev": doc['_rev']}), 200
 
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in qc_review: {e}")
         return jsonify({"error": str(e)}), 500
@@ -269,182 +219,131 @@ def qc_review(doc_id):
 def technical_review(doc_id):
     """Technical reviewer approves or requests changes"""
     try:
-        user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
         
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
         
-        if doc['status'] != 'In Review':
-            return jsonify({"error": "Document is not in review"}), 400
-        
         data = request.get_json()
         decision = data.get('decision')  # 'Approved' or 'RequestChanges'
         comment = data.get('comment', '')
         
         if decision not in ['Approved', 'RequestChanges']:
+            check_transition(db, 'technical_review', ObjectId(doc_id), user, guard=False)
             return jsonify({"error": "Invalid decision. Must be 'Approved' or 'RequestChanges'"}), 400
         
         if decision == 'RequestChanges' and not comment:
+            check_transition(db, 'technical_review', ObjectId(doc_id), user, guard=False)
             return jsonify({"error": "Comments are required when requesting changes"}), 400
 
-        # Get reviewers array
-        reviewers = doc.get('reviewers', [])
-        reviewer_idx = next((i for i, r in enumerate(reviewers) if r['user_id'] == user_id), None)
-        
-        # Check if user is Admin
-        is_admin = user['role'] == 'Admin'
-        
-        # If not in reviewers list
-        if reviewer_idx is None:
-            if is_admin:
-                # Admin can review even if not assigned
-                reviewers.append({
-                    'user_id': user_id,
-                    'status': decision,
-                    'reviewed_at': datetime.datetime.now(datetime.timezone.utc),
-                    'comment': comment
-                })
-                reviewer_idx = len(reviewers) - 1
-            else:
-                return jsonify({"error": "You are not assigned as a reviewer"}), 403
-        else:
-            # Update existing reviewer
-            reviewers[reviewer_idx] = {
-                'user_id': user_id,
-                'status': decision,
-                'reviewed_at': datetime.datetime.now(datetime.timezone.utc),
-                'comment': comment
-            }
-        
-        # ✅ KEY LOGIC: Admin decision is FINAL
-        if is_admin:
-            # Admin's decision overrides everything
-            if decision == 'Approved':
-                new_status = 'Review Complete'
-                action_text = f"Technical Review - Admin {user['username']} Approved (Final)"
-            else:  # RequestChanges
-                new_status = 'Under Revision'
-                action_text = f"Technical Review - Admin {user['username']} Requested Changes (Final)"
-        else:
-            # Regular reviewer: Check all reviewers' status
-            any_changes_requested = any(r['status'] == 'RequestChanges' for r in reviewers)
-            all_approved = all(r['status'] == 'Approved' for r in reviewers)
-            
-            if any_changes_requested:
-                new_status = 'Under Revision'
-                action_text = f"Technical Review - Changes Requested by {user['username']}"
-            elif all_approved:
-                new_status = 'Review Complete'
-                action_text = "Technical Review Completed - All Reviewers Approved"
-            else:
-                new_status = 'In Review'  # Still waiting for other reviewers
-                action_text = f"Technical Review - Approved by {user['username']}"
-        
-        # Update document in database
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
-            {'$set': {
-                'status': new_status,
-                'reviewers': reviewers
-            },
-            '$push': {
-                'history': {
-                    'action': action_text,
-                    'user_id': user_id,
-                    'user_username': user['username'],
-                    'timestamp': datetime.datetime.now(datetime.timezone.utc),
-                    'details': comment
-                }
-            }}
+        # ✅ Admin decision is FINAL; otherwise all reviewers must approve (see REVIEW_STAGES)
+        pipeline, history = review_update('technical_review', user, decision, comment)
+        doc = apply_transition(
+            db, 'technical_review', ObjectId(doc_id), user, pipeline, history, expected_rev=if_match_revisions()
         )
         
         if decision == 'Approved':
-            return jsonify({"message": "Technical review approved"}), 200
+            return jsonify({"message": "Technical review approved", "rev": doc['_rev']}), 200
         else:
-            return jsonify({"message": "Changes requested - document returned to author"}), 200
+            return jsonify({"message": "Changes requested - document returned to author", "rev": doc['_rev']}), 200
             
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in technical_review: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+# "<major>.<minor>" of the document being updated, inside an update pipeline
+VERSION_EXPRESSION = {'$concat': [{'$toString': '$major_version'}, '.', {'$toString': '$minor_version'}]}
+
+
 @document_workflow_blueprint.route("/<doc_id>/upload-corrected-file", methods=['POST'])
 @jwt_required()
+@upload_precheck(transition_allowed('upload_corrected_file'))
 def upload_corrected_file(doc_id):
     """Upload corrected file after reviewer requests changes - ✅ GOES BACK TO ALL REVIEWERS"""
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
         
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
         
-        if doc['status'] != 'Under Revision':
-            return jsonify({"error": "Document is not under revision"}), 400
-        
-        if doc['author_id'] != user_id:
-            return jsonify({"error": "Only the document author can upload corrections"}), 403
+        # transition_allowed ran before the upload was stored; the update below re-checks atomically
+        expected_rev = if_match_revisions()
         
         file = request.files.get('file')
         if not file:
             return jsonify({"error": "No file provided"}), 400
         
         # Store new file in GridFS
-        file_id = fs.put(file, filename=file.filename, content_type=file.content_type)
-        
-        # ✅ KEEP: Increment minor version (as per your requirement)
-        new_minor_version = doc.get('minor_version', 0) + 1
-        
-        # Add new revision
-        new_revision = {
-            'file_id': file_id,
-            'filename': file.filename,
-            'uploaded_by_id': user_id,
-            'uploaded_by_username': user['username'],
-            'uploaded_at': datetime.datetime.now(datetime.timezone.utc),
-            'version': f"{doc['major_version']}.{new_minor_version}",
-            'change_description': 'Corrections after reviewer feedback'
-        }
+        stored = store_upload(file)
+        try:
+            new_revision = literal({
+                'file_id': stored['file_id'],
+                'filename': file.filename,
+                'size': stored['size'],
+                'sha256': stored['sha256'],
+                'uploaded_by_id': user_id,
+                'uploaded_by_username': user['username'],
+                'uploaded_at': datetime.datetime.now(datetime.timezone.utc),
+                'change_description': 'Corrections after reviewer feedback'
+            })
         
-        # ✅ FIX: Reset ALL reviewers to 'Pending'
-        reviewers = doc.get('reviewers', [])
-        for reviewer in reviewers:
-            reviewer['status'] = 'Pending'
-            reviewer['reviewed_at'] = None
-            # Optionally preserve old comments for reference
-            if 'comment' in reviewer and reviewer['comment']:
-                reviewer['previous_comment'] = reviewer['comment']
-            reviewer['comment'] = ''
-        
-        # Update document - back to "In Review" with ALL reviewers reset
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
-            {'$set': {
-                'status': 'In Review',
-                'minor_version': new_minor_version,
-                'active_revision': len(doc['revisions']),
-                'reviewers': reviewers  # ✅ ALL reviewers reset
-            },
-            '$push': {
-                'revisions': new_revision,
-                'history': {
+            # ✅ KEEP: Increment minor version, and reset ALL reviewers to 'Pending',
+            # keeping their last comment for reference
+            pipeline = [
+                {'$set': {
+                    'minor_version': {'$add': [{'$ifNull': ['$minor_version', 0]}, 1]},
+                    'active_revision': {'$size': {'$ifNull': ['$revisions', []]}},
+                    'reviewers': {'$map': {'input': {'$ifNull': ['$reviewers', []]}, 'as': 'reviewer', 'in': {
+                        'user_id': '$$reviewer.user_id',
+                        'status': 'Pending',
+                        'reviewed_at': None,
+                        'comment': '',
+                        'previous_comment': {'$cond': [
+                            {'$ne': [{'$ifNull': ['$$reviewer.comment', '']}, '']},
+                            '$$reviewer.comment',
+                            '$$reviewer.previous_comment'
+                        ]}
+                    }}}
+                }},
+                {'$set': {'revisions': {'$concatArrays': [
+                    {'$ifNull': ['$revisions', []]},
+                    [{**new_revision, 'version': VERSION_EXPRESSION}]
+                ]}}},
+                search_terms_stage(file.filename)
+            ]
+            history = {
+                **literal({
                     'action': 'Corrected File Uploaded',
                     'user_id': user_id,
                     'user_username': user['username'],
-                    'timestamp': datetime.datetime.now(datetime.timezone.utc),
-                    'details': f'Version {doc["major_version"]}.{new_minor_version} uploaded - All reviewers notified for re-review'
-                }
-            }}
-        )
+                    'timestamp': datetime.datetime.now(datetime.timezone.utc)
+                }),
+                'details': {'$concat': ['Version ', VERSION_EXPRESSION, ' uploaded - All reviewers notified for re-review']}
+            }
+        
+            # Update document - back to "In Review" with ALL reviewers reset
+            doc = apply_transition(
+                db, 'upload_corrected_file', ObjectId(doc_id), user, pipeline, history,
+                projection={'major_version': 1, 'minor_version': 1},
+                expected_rev=expected_rev
+            )
+        except Exception:
+            # The revision never landed, so nothing refers to the file
+            release_file(stored['file_id'])
+            raise
         
         return jsonify({
             "message": "Corrected file uploaded - returned to ALL reviewers",
-            "version": f"{doc['major_version']}.{new_minor_version}"
+            "version": f"{doc['major_version']}.{doc['minor_version']}",
+            "rev": doc['_rev']
         }), 200
         
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error uploading corrected file: {e}")
         import traceback
@@ -458,37 +357,31 @@ def final_approval(doc_id):
     """Final approval with digital signature - ✅ ONLY 2 OPTIONS: Approved or Rejected"""
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        # Signing needs the private key, which the cached user never carries
+        user = get_current_user(include_secrets=True)
         
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
         
-        if doc['status'] != 'Pending Approval':
-            return jsonify({"error": "Document is not pending approval"}), 400
-        
-        approver_data = doc.get('approver', {})
-        if str(approver_data.get('user_id')) != str(user_id) and user['role'] != 'Admin':
-            return jsonify({"error": "You are not the assigned approver"}), 403
-        
         data = request.get_json()
         decision = data.get('decision')
         comment = data.get('comment', '')
         
         # ✅ FIX: Only allow 2 options
         if decision not in ['Approved', 'Rejected']:
+            check_transition(db, 'approve', ObjectId(doc_id), user)
             return jsonify({"error": "Invalid decision. Must be 'Approved' or 'Rejected'"}), 400
         
         # ✅ Handle Reject (back to Draft - full cycle)
         if decision == 'Rejected':
-            db.documents.update_one(
-                {'_id': ObjectId(doc_id)},
+            doc = apply_transition(
+                db, 'reject_approval', ObjectId(doc_id), user,
                 {'$set': {
-                    'status': 'Approval Rejected',
                     'approver.status': 'Rejected',
                     'approver.comment': comment,
                     'approver.approved_at': datetime.datetime.now(datetime.timezone.utc)
                 },
+                '$addToSet': search_terms_update(comment),
                 '$push': {
                     'history': {
                         'action': 'Final Approval Rejected',
@@ -497,9 +390,13 @@ def final_approval(doc_id):
                         'timestamp': datetime.datetime.now(datetime.timezone.utc),
                         'details': comment
                     }
-                }}
+                }},
+                expected_rev=if_match_revisions()
             )
-            return jsonify({"message": "Document rejected - must go through full cycle again"}), 200
+            return jsonify({"message": "Document rejected - must go through full cycle again", "rev": doc['_rev']}), 200
+        
+        # Signing reads the file, so check first; the update below re-checks atomically
+        doc = check_transition(db, 'approve', ObjectId(doc_id), user, route_projection(), if_match_revisions())
         
         # ✅ APPROVED - Apply digital signature
         try:
@@ -514,11 +411,9 @@ def final_approval(doc_id):
             
             active_rev = revisions[active_rev_index]
             
-            # Get file from GridFS
-            file_data = fs.get(active_rev['file_id']).read()
-            
-            # Sign with user's private key
-            signature = sign_data(user['private_key'], file_data)
+            # Hash the GridFS file chunk by chunk, then sign the digest with the user's private key
+            file_hash = hash_stream(fs.get(active_rev['file_id']))
+            signature = sign_digest(user['private_key'], file_hash)
             
         except Exception as sig_error:
             print(f"Signature error: {sig_error}")
@@ -532,8 +427,8 @@ def final_approval(doc_id):
         
         # Update document to Approved status with signature
         update_fields = {
-            'status': 'Approved',
             'signature': signature,
+            'signed_sha256': file_hash.hexdigest(),
             'signed_by_id': user_id,
             'signed_by_username': user['username'],
             'signed_by_public_key': user['public_key'],
@@ -545,31 +440,15 @@ def final_approval(doc_id):
             'approver.approved_at': datetime.datetime.now(datetime.timezone.utc)
         }
         
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
-            {'$set': update_fields,
-            '$push': {
-                'history': {
-                    'action': 'Document Approved & Signed',
-                    'user_id': user_id,
-                    'user_username': user['username'],
-                    'timestamp': datetime.datetime.now(datetime.timezone.utc),
-                    'details': f"Document digitally signed. Version updated to {new_major_version}.{new_minor_version}. {comment}"
-                }
-            }}
-        )
-        
-        # ✅ KEEP: If this is an amendment, mark the original document as Superseded
-        if 'amended_from' in doc and doc['amended_from']:
-            try:
-                original_doc_id = ObjectId(doc['amended_from'])
-                original_doc = db.documents.find_one({'_id': original_doc_id})
-                
-                if original_doc:
-                    db.documents.update_one(
-                        {'_id': original_doc_id},
+        def approve_in_lineage(session):
+            # Builds its updates afresh: the transaction may run this more than once
+            # ✅ KEEP: If this is an amendment, mark the original document as Superseded.
+            # First, so the lineage never has two Approved versions, even without a transaction
+            if doc.get('amended_from'):
+                try:
+                    apply_transition(
+                        db, 'supersede', ObjectId(doc['amended_from']), user,
                         {'$set': {
-                            'status': 'Superseded',
                             'superseded_by': str(doc['_id']),
                             'superseded_at': datetime.datetime.now(datetime.timezone.utc)
                         },
@@ -581,16 +460,52 @@ def final_approval(doc_id):
                                 'timestamp': datetime.datetime.now(datetime.timezone.utc),
                                 'details': f"Superseded by approved amendment v{new_major_version}.{new_minor_version}"
                             }
-                        }}
+                        }},
+                        session=session
                     )
-            except Exception as supersede_error:
-                print(f"Warning: Could not supersede original document: {supersede_error}")
+                except TransitionRejected as e:
+                    # An original that is no longer Approved has nothing to supersede
+                    if e.status_code == 409:
+                        raise
+                    print(f"Warning: Could not supersede original document: {e.message}")
+
+            # Only written if nothing changed since the file was signed
+            approved = apply_transition(
+                db, 'approve', ObjectId(doc_id), user,
+                {'$set': dict(update_fields),
+                '$addToSet': search_terms_update(comment),
+                '$push': {
+                    'history': {
+                        'action': 'Document Approved & Signed',
+                        'user_id': user_id,
+                        'user_username': user['username'],
+                        'timestamp': datetime.datetime.now(datetime.timezone.utc),
+                        'details': f"Document digitally signed. Version updated to {new_major_version}.{new_minor_version}. {comment}"
+                    }
+                }},
+                expected_rev=[doc['_rev']],
+                session=session
+            )
+            refresh_lineage_head(db, doc.get('lineage_id'), session)
+            return approved
+
+        try:
+            approved = run_in_transaction(db, approve_in_lineage)
+        except DuplicateKeyError as e:
+            if is_chain_position_conflict(e):
+                raise
+            # The one-Approved-version-per-lineage index caught a concurrent approval
+            current = db.documents.find_one({'_id': ObjectId(doc_id)}, DOCUMENT_STATE_PROJECTION)
+            return jsonify(conflict(current, LINEAGE_CONFLICT_MESSAGE).body), 409
         
         return jsonify({
             "message": "Document approved and signed successfully",
-            "version": f"{new_major_version}.{new_minor_version}"
+            "version": f"{new_major_version}.{new_minor_version}",
+            "rev": approved['_rev']
         }), 200
         
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in final_approval: {e}")
         import traceback
@@ -602,17 +517,25 @@ def final_approval(doc_id):
 @jwt_required()
 def verify_doc_signature(doc_id):
     try:
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        doc = db.documents.find_one({'_id': ObjectId(doc_id)}, route_projection())
         if not doc or 'signature' not in doc:
             return jsonify({"error": "Document or signature not found"}), 404
         
-        signed_by_user = db.users.find_one({'username': doc['signed_by_username']})
+        signer_query = {'_id': doc['signed_by_id']} if doc.get('signed_by_id') else {'username': doc['signed_by_username']}
+        signed_by_user = db.users.find_one(signer_query, {'public_key': 1})
+        if not signed_by_user:
+            return jsonify({"error": "Signer not found"}), 404
+
         active_rev = doc['revisions'][doc.get('active_revision', 0)]
-        file_data = fs.get(active_rev['file_id']).read()
+        file_hash = hash_stream(fs.get(active_rev['file_id']))
         
-        is_valid = verify_signature(signed_by_user['public_key'], file_data, doc['signature'])
+        is_valid = verify_digest(signed_by_user['public_key'], file_hash, doc['signature'])
         
-        return jsonify({"verified": is_valid}), 200
+        return jsonify({
+            "verified": is_valid,
+            "sha256": file_hash.hexdigest(),
+            "signed_sha256": doc.get('signed_sha256')
+        }), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -620,21 +543,18 @@ def verify_doc_signature(doc_id):
 
 @document_workflow_blueprint.route("/<doc_id>/upload-revision", methods=['POST'])
 @jwt_required()
+@upload_precheck(transition_allowed('upload_revision'))
 def upload_revised_file(doc_id):
     """Author uploads a revised file after QC/Review/Approval rejection"""
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
         
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
-            
-        if not is_admin_or_author(user, doc):
-            return jsonify({"error": "Only author or admin can upload revisions"}), 403
-            
-        if doc['status'] not in ['QC Rejected', 'Review Rejected', 'Approval Rejected']:
-            return jsonify({"error": "Only rejected documents can have revisions uploaded"}), 400
+        
+        # transition_allowed ran before the upload was stored; the update below re-checks atomically
+        expected_rev = if_match_revisions()
         
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
@@ -643,42 +563,60 @@ def upload_revised_file(doc_id):
         if file.filename == '':
             return jsonify({"error": "No file selected"}), 400
         
-        file_id = fs.put(file, filename=file.filename, contentType=file.content_type)
-        
-        new_minor = doc.get('minor_version', 1) + 1
-        
-        new_revision = {
-            "revision_number": len(doc.get('revisions', [])),
-            "file_id": file_id,
-            "filename": file.filename,
-            "author_comment": request.form.get('comment', 'Revised after rejection'),
-            "uploaded_at": datetime.datetime.now(datetime.timezone.utc)
-        }
+        stored = store_upload(file)
+        try:
+            author_comment = request.form.get('comment', 'Revised after rejection')
+            new_revision = literal({
+                "file_id": stored['file_id'],
+                "filename": file.filename,
+                "size": stored['size'],
+                "sha256": stored['sha256'],
+                "author_comment": author_comment,
+                "uploaded_at": datetime.datetime.now(datetime.timezone.utc)
+            })
         
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
-            {'$set': {
-                'status': 'Draft',
-                'minor_version': new_minor,
-                'active_revision': new_revision['revision_number']
-            },
-            '$push': {
-                'revisions': new_revision,
-                'history': {
+            # The new revision's number is the current revision count
+            pipeline = [
+                {'$set': {
+                    'minor_version': {'$add': [{'$ifNull': ['$minor_version', 1]}, 1]},
+                    'active_revision': {'$size': {'$ifNull': ['$revisions', []]}}
+                }},
+                {'$set': {'revisions': {'$concatArrays': [
+                    {'$ifNull': ['$revisions', []]},
+                    [{'revision_number': '$active_revision', **new_revision}]
+                ]}}},
+                search_terms_stage(file.filename, author_comment)
+            ]
+            history = {
+                **literal({
                     'action': 'Revision Uploaded',
                     'user_id': user_id,
                     'user_username': user['username'],
-                    'timestamp': datetime.datetime.now(datetime.timezone.utc),
-                    'details': f"Uploaded revised file (v0.{new_minor}): {file.filename}"
-                }
-            }}
-        )
+                    'timestamp': datetime.datetime.now(datetime.timezone.utc)
+                }),
+                'details': {'$concat': [
+                    'Uploaded revised file (v0.', {'$toString': '$minor_version'}, '): ', {'$literal': file.filename}
+                ]}
+            }
+        
+            doc = apply_transition(
+                db, 'upload_revision', ObjectId(doc_id), user, pipeline, history,
+                projection={'minor_version': 1},
+                expected_rev=expected_rev
+            )
+        except Exception:
+            # The revision never landed, so nothing refers to the file
+            release_file(stored['file_id'])
+            raise
         
         return jsonify({
             "message": "Revised file uploaded successfully",
-            "new_version": f"0.{new_minor}"
+            "new_version": f"0.{doc['minor_version']}",
+            "rev": doc['_rev']
         }), 200
         
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in upload_revised_file: {e}")
         return jsonify({"error": str(e)}), 500
@@ -690,49 +628,23 @@ def recall_document(doc_id):
     """Author recalls document from QC/Review/Approval stages"""
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
         
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
-            
-        if not is_admin_or_author(user, doc):
-            return jsonify({"error": "Only author or admin can recall documents"}), 403
-            
-        if doc['status'] not in ['In QC', 'In Review', 'Pending Approval']:
-            return jsonify({"error": "Can only recall documents in QC, Review, or Approval stages"}), 400
-        
-        data = request.get_json()
-        reason = data.get('reason', 'Recalled by author')
         
+        # Where a recall returns to depends on the stage it is recalled from
+        doc = check_transition(db, 'recall', ObjectId(doc_id), user, expected_rev=if_match_revisions())
         current_status = doc['status']
+        new_status = TRANSITIONS['recall'].target(current_status)
         
-        if current_status == 'In QC':
-            new_status = 'Draft'
-            clear_data = {
-                'qc_reviewers': [],
-                'reviewers': [],
-                'approver': {}
-            }
-        elif current_status == 'In Review':
-            new_status = 'QC Complete'
-            clear_data = {
-                'reviewers': [],
-                'approver': {}
-            }
-        elif current_status == 'Pending Approval':
-            new_status = 'Review Complete'
-            clear_data = {
-                'approver': {}
-            }
+        data = request.get_json()
+        reason = data.get('reason', 'Recalled by author')
         
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
-            {'$set': {
-                'status': new_status,
-                **clear_data
-            },
-            '$push': {
+        # Assignments of the stages being left are cleared by the transition
+        doc = apply_transition(
+            db, 'recall', ObjectId(doc_id), user,
+            {'$push': {
                 'history': {
                     'action': 'Document Recalled',
                     'user_id': user_id,
@@ -740,11 +652,15 @@ def recall_document(doc_id):
                     'timestamp': datetime.datetime.now(datetime.timezone.utc),
                     'details': f"{reason} (returned to {new_status})"
                 }
-            }}
+            }},
+            from_state=current_status,
+            expected_rev=[doc['_rev']]
         )
         
-        return jsonify({"message": "Document recalled successfully", "new_status": new_status}), 200
+        return jsonify({"message": "Document recalled successfully", "new_status": new_status, "rev": doc['_rev']}), 200
         
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in recall_document: {e}")
         return jsonify({"error": str(e)}), 500
@@ -755,25 +671,15 @@ def recall_document(doc_id):
 def archive_document(doc_id):
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
 
-        if not user or not doc:
+        if not user:
             return jsonify({"error": "User or document not found"}), 404
 
-        # Check if user is an Archivist or Admin
-        if user['role'] not in ['Archivist', 'Admin']:
-            return jsonify({"error": "You do not have permission to archive documents"}), 403
-
-        # Only documents in Approved or Superseded can be archived
-        if doc['status'] not in ['Approved', 'Superseded']:
-            return jsonify({"error": "Only Approved or Superseded documents can be archived"}), 400
-
-        # Update status to Archived
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
+        # Archivist or Admin; only Approved or Superseded documents (see TRANSITIONS)
+        doc = apply_transition(
+            db, 'archive', ObjectId(doc_id), user,
             {'$set': {
-                'status': 'Archived',
                 'archived_at': datetime.datetime.now(datetime.timezone.utc),
                 'archived_by_user_id': user_id,
                 'archived_by_username': user['username']
@@ -786,11 +692,14 @@ def archive_document(doc_id):
                     'timestamp': datetime.datetime.now(datetime.timezone.utc),
                     'details': 'Document archived by user'
                  }
-             }}
+             }},
+            expected_rev=if_match_revisions()
         )
 
-        return jsonify({"message": "Document archived successfully"}), 200
+        return jsonify({"message": "Document archived successfully", "rev": doc['_rev']}), 200
 
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in archive_document: {e}")
         return jsonify({"error": str(e)}), 500
@@ -802,12 +711,16 @@ def create_amendment(doc_id):
     """Create amendment of approved document - Only one amendment allowed at a time"""
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        original_doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
+        original_doc = db.documents.find_one({'_id': ObjectId(doc_id)}, route_projection())
 
         if not original_doc or not user:
             return jsonify({"error": "Document or user not found"}), 404
 
+        # With If-Match, only amend the version the client last saw
+        if is_stale(original_doc, if_match_revisions()):
+            return jsonify(conflict(original_doc).body), 409
+
         # Only approved documents can be amended
         if original_doc['status'] != 'Approved':
             return jsonify({"error": "Only approved documents can be amended"}), 400
@@ -816,7 +729,7 @@ def create_amendment(doc_id):
         existing_amendment = db.documents.find_one({
             'amended_from': str(original_doc['_id']),
             'status': {'$in': ['Draft', 'In QC', 'QC Complete', 'In Review', 'Review Complete', 'Pending Approval']}
-        })
+        }, AMENDMENT_CONFLICT_PROJECTION)
 
         if existing_amendment:
             return jsonify({
@@ -840,10 +753,8 @@ def create_amendment(doc_id):
             return jsonify({"error": "No file selected"}), 400
 
         # Store file in GridFS
-        file_id = fs.put(
+        stored = store_upload(
             file,
-            filename=file.filename,
-            content_type=file.content_type,
             uploaded_by=user_id,
             uploaded_at=datetime.datetime.now(datetime.timezone.utc)
         )
@@ -865,8 +776,10 @@ def create_amendment(doc_id):
             'approver': {},
             'revisions': [{
                 'revision_number': 0,
-                'file_id': file_id,
+                'file_id': stored['file_id'],
                 'filename': file.filename,
+                'size': stored['size'],
+                'sha256': stored['sha256'],
                 'uploaded_by_id': user_id,
                 'uploaded_by_username': user['username'],
                 'uploaded_at': datetime.datetime.now(datetime.timezone.utc)
@@ -880,34 +793,59 @@ def create_amendment(doc_id):
                 'details': f"Amendment from v{original_doc['major_version']}.{original_doc.get('minor_version', 0)} - Reason: {reason}"
             }],
             'amendment_reason': reason,
-            'amended_from': str(original_doc['_id'])  # Reference to original
+            'amended_from': str(original_doc['_id']),  # Reference to original
+            'is_latest': False,
+            'audit_migrated': True,
+            '_rev': 0
         }
 
-        # Insert new document
-        result = db.documents.insert_one(new_doc)
-
-        # Add history to original document
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
-            {
-                '$push': {
-                    'history': {
-                        'action': 'Amended',
-                        'user_id': user_id,
-                        'user_username': user['username'],
-                        'timestamp': datetime.datetime.now(datetime.timezone.utc),
-                        'details': f'Amendment created - New draft v{new_doc["major_version"]}.{new_doc["minor_version"]}. Reason: {reason}'
+        new_doc.update(build_search_fields(*document_search_texts(new_doc)))
+
+        def amend_in_lineage(session):
+            # Record the amendment on the original first, and only while it is still the
+            # Approved revision read above: of two concurrent amendments, one loses here
+            original = update_with_history(
+                db,
+                {'_id': original_doc['_id'], 'status': 'Approved', '_rev': original_doc.get('_rev', 0)},
+                {
+                    '$push': {
+                        'history': {
+                            'action': 'Amended',
+                            'user_id': user_id,
+                            'user_username': user['username'],
+                            'timestamp': datetime.datetime.now(datetime.timezone.utc),
+                            'details': f'Amendment created - New draft v{new_doc["major_version"]}.{new_doc["minor_version"]}. Reason: {reason}'
+                        }
                     }
-                }
-            }
-        )
+                },
+                session=session
+            )
+            if original is None:
+                current = db.documents.find_one({'_id': original_doc['_id']}, DOCUMENT_STATE_PROJECTION, session=session)
+                if current is None:
+                    raise TransitionRejected("Document or user not found", 404)
+                if current['status'] != 'Approved':
+                    raise TransitionRejected("Only approved documents can be amended", 400)
+                raise conflict(current, RACE_MESSAGE)
+
+            # Insert new document
+            insert_with_history(db, new_doc, session)
+            refresh_lineage_head(db, new_doc['lineage_id'], session)
+
+        try:
+            run_in_transaction(db, amend_in_lineage)
+        except Exception:
+            release_file(stored['file_id'])
+            raise
 
         return jsonify({
             "message": "Amendment created successfully",
-            "new_document_id": str(result.inserted_id),
+            "new_document_id": str(new_doc['_id']),
             "new_version": f"{new_doc['major_version']}.{new_doc['minor_version']}"
         }), 201
 
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in create_amendment: {e}")
         import traceback
@@ -919,7 +857,7 @@ def create_amendment(doc_id):
 def can_amend_document(doc_id):
     """Check if a document can be amended (no amendment in progress)"""
     try:
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        doc = db.documents.find_one({'_id': ObjectId(doc_id)}, route_projection())
         
         if not doc:
             return jsonify({"error": "Document not found"}), 404
@@ -935,7 +873,7 @@ def can_amend_document(doc_id):
         existing_amendment = db.documents.find_one({
             'amended_from': str(doc['_id']),
             'status': {'$in': ['Draft', 'In QC', 'QC Complete', 'In Review', 'Review Complete', 'Pending Approval']}
-        })
+        }, AMENDMENT_CONFLICT_PROJECTION)
         
         if existing_amendment:
             return jsonify({
@@ -961,23 +899,17 @@ def submit_for_review(doc_id):
     """After QC is approved, submit to technical reviewers"""
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
         
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
-            
-        if not is_admin_or_author(user, doc):
-            return jsonify({"error": "Only author or admin can submit"}), 403
-            
-        if doc['status'] != 'QC Complete':
-            return jsonify({"error": "Only QC Complete documents can be submitted for review"}), 400
         
         data = request.get_json()
         reviewer_ids = data.get('reviewers', [])
         due_date = data.get('due_date')
         
         if not reviewer_ids:
+            check_transition(db, 'submit_review', ObjectId(doc_id), user)
             return jsonify({"error": "At least one reviewer must be selected"}), 400
         
         reviewers = []
@@ -989,11 +921,9 @@ def submit_for_review(doc_id):
                 'comment': ''
             })
         
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
+        doc = apply_transition(
+            db, 'submit_review', ObjectId(doc_id), user,
             {'$set': {
-                'status': 'In Review',
-                'current_stage': 'Technical Review',
                 'reviewers': reviewers,
                 'review_due_date': due_date
             },
@@ -1005,29 +935,16 @@ def submit_for_review(doc_id):
                     'timestamp': datetime.datetime.now(datetime.timezone.utc),
                     'details': f"Submitted to {len(reviewer_ids)} technical reviewer(s)"
                 }
-            }}
+            }},
+            expected_rev=if_match_revisions()
         )
         
-        for reviewer_id in reviewer_ids:
-            try:
-                reviewer = db.users.find_one({'_id': ObjectId(reviewer_id)})
-                if reviewer and reviewer.get('email'):
-                    send_workflow_notification(
-                        recipient_email=reviewer['email'],
-                        recipient_name=reviewer['username'],
-                        document_info={
-                            'name': doc.get('doc_number', 'Document'),
-                            'id': str(doc['_id']),
-                            'status': 'In Review'
-                        },
-                        workflow_type='Technical Review',
-                        sender_name=user['username']
-                    )
-            except Exception as email_error:
-                print(f"⚠️ Failed to send email to reviewer {reviewer_id}: {email_error}")
+        notify_assignees(reviewer_ids, doc, 'In Review', 'Technical Review', user['username'])
         
-        return jsonify({"message": "Document submitted for technical review"}), 200
+        return jsonify({"message": "Document submitted for technical review", "rev": doc['_rev']}), 200
         
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in submit_for_review: {e}")
         return jsonify({"error": str(e)}), 500
@@ -1039,23 +956,17 @@ def submit_for_approval(doc_id):
     """After technical review, submit for approval"""
     try:
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
-        doc = db.documents.find_one({'_id': ObjectId(doc_id)})
+        user = get_current_user()
         
-        if not doc or not user:
+        if not user:
             return jsonify({"error": "Document or user not found"}), 404
-            
-        if not is_admin_or_author(user, doc):
-            return jsonify({"error": "Only author or admin can submit"}), 403
-            
-        if doc['status'] != 'Review Complete':
-            return jsonify({"error": "Only reviewed documents can be submitted for approval"}), 400
         
         data = request.get_json()
         approver_id = data.get('approver')
         due_date = data.get('due_date')
         
         if not approver_id:
+            check_transition(db, 'submit_approval', ObjectId(doc_id), user)
             return jsonify({"error": "At least one approver must be selected"}), 400
         
         approver = {
@@ -1065,11 +976,9 @@ def submit_for_approval(doc_id):
                 'comment': ''
         }
         
-        db.documents.update_one(
-            {'_id': ObjectId(doc_id)},
+        doc = apply_transition(
+            db, 'submit_approval', ObjectId(doc_id), user,
             {'$set': {
-                'status': 'Pending Approval',
-                'current_stage': 'Approval',
                 'approver': approver,
                 'approval_due_date': due_date
             },
@@ -1081,29 +990,17 @@ def submit_for_approval(doc_id):
                     'timestamp': datetime.datetime.now(datetime.timezone.utc),
                     'details': f"Submitted to approver for final approval"
                 }
-            }}
+            }},
+            expected_rev=if_match_revisions()
         )
         
         # ✅ SEND EMAIL TO ALL APPROVERS
-        try:
-            approver = db.users.find_one({'_id': ObjectId(approver_id)})
-            if approver and approver.get('email'):
-                send_workflow_notification(
-                    recipient_email=approver['email'],
-                    recipient_name=approver['username'],
-                    document_info={
-                        'name': doc.get('doc_number', 'Document'),
-                        'id': str(doc['_id']),
-                        'status': 'Pending Approval'
-                    },
-                    workflow_type='Approval',
-                    sender_name=user['username']
-                )
-        except Exception as email_error:
-            print(f"⚠️ Failed to send email to approver {approver_id}: {email_error}")
-        
-        return jsonify({"message": "Document submitted for approval"}), 200
+        notify_assignees([approver_id], doc, 'Pending Approval', 'Approval', user['username'])
+        
+        return jsonify({"message": "Document submitted for approval", "rev": doc['_rev']}), 200
         
+    except TransitionRejected as e:
+        return jsonify(e.body), e.status_code
     except Exception as e:
         print(f"Error in submit_for_approval: {e}")
         return jsonify({"error": str(e)}), 500
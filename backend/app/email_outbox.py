@@ -0,0 +1,204 @@
+# backend/app/email_outbox.py
+
+"""
+Durable email outbox with a fixed-size worker pool.
+
+Messages are written to the `email_outbox` collection first and delivered by a
+small pool of background threads, so an assignment burst costs a few inserts
+instead of one thread and one SMTP session per email. Each worker claims a
+batch, sends it over a single SMTP connection, and records the outcome:
+
+    pending --claim--> sending --ok--> sent
+                          |
+                          +--error--> pending (retry with exponential backoff)
+                                      dead    (after EMAIL_MAX_ATTEMPTS)
+
+A claim is a lease: messages left in `sending` by a crashed worker become
+claimable again once `locked_until` passes.
+
+Delivery goes through `mail.connect()` unless the app config sets
+EMAIL_TRANSPORT to a zero-argument callable returning a context manager with
+`send(msg)`; tests can use that, or point MAIL_SERVER/MAIL_PORT at a local
+SMTP stand-in.
+"""
+
+import datetime
+import threading
+from flask import current_app
+from flask_mail import Message
+from pymongo import ASCENDING, ReturnDocument
+
+DEFAULT_WORKERS = 2
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE_SECONDS = 30
+MAX_RETRY_DELAY_SECONDS = 60 * 60
+LEASE_SECONDS = 5 * 60
+POLL_INTERVAL_SECONDS = 10
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def retry_delay(attempts, base_seconds=DEFAULT_RETRY_BASE_SECONDS):
+    """Backoff before the next attempt after `attempts` failures."""
+    return datetime.timedelta(seconds=min(base_seconds * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY_SECONDS))
+
+
+def message_to_record(msg):
+    now = _now()
+    return {
+        'subject': msg.subject,
+        'sender': msg.sender,
+        'recipients': list(msg.recipients),
+        'html': msg.html,
+        'body': msg.body,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+        'last_error': None
+    }
+
+
+def record_to_message(record):
+    return Message(
+        subject=record['subject'],
+        sender=record['sender'],
+        recipients=record['recipients'],
+        html=record.get('html'),
+        body=record.get('body')
+    )
+
+
+class EmailOutbox:
+    """Queue writer plus the per-process pool of delivery threads."""
+
+    def __init__(self):
+        self.app = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('EMAIL_WORKERS', DEFAULT_WORKERS)
+        app.config.setdefault('EMAIL_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        app.config.setdefault('EMAIL_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+        app.config.setdefault('EMAIL_RETRY_BASE_SECONDS', DEFAULT_RETRY_BASE_SECONDS)
+        app.config.setdefault('EMAIL_TRANSPORT', None)
+
+    @property
+    def collection(self):
+        from . import db
+        return db.email_outbox
+
+    def enqueue(self, messages):
+        """Persist messages for delivery and wake the pool. Returns the number queued."""
+        records = [message_to_record(msg) for msg in messages]
+        if not records:
+            return 0
+        self.collection.insert_many(records)
+        self.ensure_workers()
+        self._wakeup.set()
+        return len(records)
+
+    def ensure_workers(self):
+        """Start the pool on first use, so CLI commands and the gunicorn master never spawn threads."""
+        with self._lock:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            for index in range(len(self._workers), self.app.config['EMAIL_WORKERS']):
+                worker = threading.Thread(target=self._run, name=f"email-outbox-{index}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    delivered = self.process_batch()
+                except Exception as e:
+                    print(f"❌ Email outbox worker error: {str(e)}")
+                    delivered = 0
+                if not delivered:
+                    self._wakeup.wait(POLL_INTERVAL_SECONDS)
+                    self._wakeup.clear()
+
+    def claim_batch(self):
+        """Atomically lease up to EMAIL_BATCH_SIZE due messages."""
+        now = _now()
+        lease = {'status': 'sending', 'locked_until': now + datetime.timedelta(seconds=LEASE_SECONDS)}
+        claimable = {'$or': [
+            {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+            {'status': 'sending', 'locked_until': {'$lte': now}}
+        ]}
+        batch = []
+        for _ in range(current_app.config['EMAIL_BATCH_SIZE']):
+            record = self.collection.find_one_and_update(
+                claimable,
+                {'$set': lease, '$inc': {'attempts': 1}},
+                sort=[('next_attempt_at', ASCENDING)],
+                return_document=ReturnDocument.AFTER
+            )
+            if record is None:
+                break
+            batch.append(record)
+        return batch
+
+    def _connect(self):
+        transport = current_app.config.get('EMAIL_TRANSPORT')
+        if transport:
+            return transport()
+        from .email_service import mail
+        return mail.connect()
+
+    def process_batch(self):
+        """Deliver one claimed batch over a single connection. Returns the number sent."""
+        batch = self.claim_batch()
+        if not batch:
+            return 0
+
+        sent = 0
+        # Records whose outcome is settled, so a failing connection never re-queues a sent message
+        handled = set()
+        try:
+            with self._connect() as connection:
+                for record in batch:
+                    try:
+                        connection.send(record_to_message(record))
+                    except Exception as e:
+                        handled.add(record['_id'])
+                        self._mark_failed(record, e)
+                        continue
+                    handled.add(record['_id'])
+                    self._mark_sent(record)
+                    sent += 1
+                    print(f"✅ Email sent successfully to {record['recipients']}")
+        except Exception as e:
+            # The connection itself failed: every message not yet tried is retried
+            for record in batch:
+                if record['_id'] not in handled:
+                    self._mark_failed(record, e)
+        return sent
+
+    def _mark_sent(self, record):
+        self.collection.update_one(
+            {'_id': record['_id']},
+            {'$set': {'status': 'sent', 'sent_at': _now(), 'last_error': None},
+             '$unset': {'locked_until': ''}}
+        )
+
+    def _mark_failed(self, record, error):
+        config = current_app.config
+        if record['attempts'] >= config['EMAIL_MAX_ATTEMPTS']:
+            update = {'status': 'dead', 'last_error': str(error), 'dead_at': _now()}
+            print(f"❌ Email to {record['recipients']} moved to dead letters: {str(error)}")
+        else:
+            delay = retry_delay(record['attempts'], config['EMAIL_RETRY_BASE_SECONDS'])
+            update = {'status': 'pending', 'last_error': str(error), 'next_attempt_at': _now() + delay}
+            print(f"⚠️ Email to {record['recipients']} failed, retrying in {int(delay.total_seconds())}s: {str(error)}")
+        self.collection.update_one({'_id': record['_id']}, {'$set': update, '$unset': {'locked_until': ''}})
+
+
+outbox = EmailOutbox()
@@ -0,0 +1,112 @@
+# backend/app/email_templates.py
+
+"""
+Pre-compiled Jinja templates for notification emails.
+
+Templates under app/templates/email are loaded and compiled once when the app
+starts, and the config values they need (sender, frontend URL, demo routing)
+are read at the same time. Building a message is then a render of an
+already-compiled template, and a batch of recipients shares one context.
+Every template has an .html and a .txt variant; the text becomes the plain
+alternative part.
+"""
+
+import os
+from datetime import datetime
+from flask_mail import Message
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+TEMPLATE_NAMES = ('workflow_notification', 'share_notification')
+
+
+class EmailTemplates:
+    """Compiled templates plus the config snapshot they render with."""
+
+    def __init__(self):
+        self.templates = {}
+        self.settings = {}
+
+    def init_app(self, app):
+        env = Environment(
+            loader=FileSystemLoader(os.path.join(app.root_path, 'templates', 'email')),
+            autoescape=select_autoescape(['html']),
+            trim_blocks=True,
+            lstrip_blocks=True
+        )
+        self.templates = {
+            (name, extension): env.get_template(f"{name}.{extension}")
+            for name in TEMPLATE_NAMES
+            for extension in ('html', 'txt')
+        }
+        self.settings = {
+            'sender': app.config.get('MAIL_USERNAME'),
+            'frontend_url': app.config.get('FRONTEND_URL', 'http://localhost:3000').rstrip('/'),
+            'demo_mode': str(app.config.get('DEMO_MODE', 'false')).lower() == 'true',
+            'demo_email': app.config.get('DEMO_EMAIL')
+        }
+
+    def render(self, name, **context):
+        """Returns (html, text) for one template."""
+        return (
+            self.templates[(name, 'html')].render(**context),
+            self.templates[(name, 'txt')].render(**context)
+        )
+
+    def _route(self, recipient_email, demo_routing):
+        """Demo mode sends everything to DEMO_EMAIL; returns (delivery address, demo notice on?)."""
+        demo_email = self.settings['demo_email']
+        if demo_routing and self.settings['demo_mode'] and demo_email:
+            print(f"🎬 DEMO MODE: Routing email from {recipient_email} to {demo_email}")
+            return demo_email, True
+        return recipient_email, False
+
+    def workflow_messages(self, recipients, document_info, workflow_type, sender_name):
+        """Render one assignment email per recipient, sharing the batch context."""
+        shared = {
+            'document': document_info,
+            'workflow_type': workflow_type,
+            'sender_name': sender_name,
+            'frontend_url': self.settings['frontend_url'],
+            'today': datetime.now().strftime('%B %d, %Y')
+        }
+        subject = f"Document Assigned for {workflow_type} - RegDoc TMF"
+
+        messages = []
+        for recipient in recipients:
+            deliver_to, demo_notice = self._route(recipient['email'], demo_routing=True)
+            html, text = self.render(
+                'workflow_notification',
+                recipient_name=recipient.get('username', ''),
+                original_recipient=recipient['email'],
+                demo_mode=demo_notice,
+                **shared
+            )
+            messages.append(Message(
+                subject=subject,
+                sender=self.settings['sender'],
+                recipients=[deliver_to],
+                html=html,
+                body=text
+            ))
+        return messages
+
+    def share_message(self, recipient_email, document_info, sender_name, custom_message=None):
+        html, text = self.render(
+            'share_notification',
+            document=document_info,
+            sender_name=sender_name,
+            custom_message=custom_message,
+            frontend_url=self.settings['frontend_url'],
+            today=datetime.now().strftime('%B %d, %Y'),
+            demo_mode=False
+        )
+        return Message(
+            subject="Document Shared with You - RegDoc TMF",
+            sender=self.settings['sender'],
+            recipients=[recipient_email],
+            html=html,
+            body=text
+        )
+
+
+email_templates = EmailTemplates()
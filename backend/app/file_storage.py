@@ -0,0 +1,197 @@
+# backend/app/file_storage.py
+
+"""
+Streaming uploads into GridFS.
+
+The app's request class hands Werkzeug's multipart parser a GridFS writer
+instead of a spooled temporary file, so the body is written to `fs.chunks` as
+it arrives. Memory per upload is bounded by one GridFS chunk, and the SHA-256
+is computed in the same pass. Uploads larger than MAX_UPLOAD_BYTES are
+rejected with 413 as soon as they cross the limit.
+
+Multipart bodies are parsed in a before_request hook after the JWT check,
+so unauthenticated clients never reach GridFS. A limit error then becomes a
+413 response instead of surfacing inside a route's try/except.
+
+The body is therefore stored before the view runs, and a view that rejects
+the request afterwards has still paid for every chunk write. Views whose
+checks need no form data register them with `@upload_precheck(check)`. The
+hook calls `check(**view_args)` before it reads the body, and a response
+returned from it is sent instead. Views without a precheck store the body
+first.
+
+Views that parse an upload themselves instead of storing it (e.g. a CSV
+import) opt out with `@spooled_upload` and get Werkzeug's usual spooled file.
+
+Routes call `store_upload(file)` to keep the upload. Any upload a route does
+not keep is aborted and its chunks removed when the request closes.
+
+Storage is content-addressed. Each GridFS file records its `sha256` and a
+`refcount` of the revisions pointing at it. When a committed upload's digest
+matches a live file, the new chunks are dropped and the existing file gains a
+reference, so re-uploading the same PDF adds nothing to `fs.chunks`.
+`release_file` drops one reference and deletes the file when none remain.
+Files stored before refcounting have no `refcount` and count as referenced
+once.
+"""
+
+import hashlib
+import gridfs
+from pymongo import ReturnDocument
+from flask import Request, current_app, request
+from flask_jwt_extended import verify_jwt_in_request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+DEFAULT_MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+COPY_CHUNK_SIZE = 256 * 1024
+
+
+def _db():
+    from . import db
+    return db
+
+
+class GridFSUploadStream:
+    """Write-only stream: GridFS chunks plus running size and SHA-256."""
+
+    def __init__(self, filename=None, content_type=None, max_bytes=None):
+        self.filename = filename
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.committed = False
+        self._digest = hashlib.sha256()
+        self.file_id = None
+        self._grid_in = gridfs.GridFS(_db()).new_file(filename=filename, contentType=content_type)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge(f"File exceeds the maximum upload size of {self.max_bytes} bytes")
+        self._digest.update(data)
+        self._grid_in.write(data)
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        # The multipart parser rewinds every file part; the data is already in GridFS
+        return 0
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def commit(self, **attributes):
+        """Keep the upload, reusing a stored file with the same bytes.
+
+        Returns the fields a revision records. `attributes` are only written
+        when a new GridFS file is created.
+        """
+        if not self.committed:
+            existing = _db().fs.files.find_one_and_update(
+                {'sha256': self.sha256, 'refcount': {'$gt': 0}},
+                {'$inc': {'refcount': 1}},
+                projection={'_id': 1}
+            )
+            if existing:
+                self._grid_in.abort()
+                self.file_id = existing['_id']
+            else:
+                self._grid_in.sha256 = self.sha256
+                self._grid_in.refcount = 1
+                for name, value in attributes.items():
+                    setattr(self._grid_in, name, value)
+                self._grid_in.close()
+                self.file_id = self._grid_in._id
+            self.committed = True
+        return {'file_id': self.file_id, 'size': self.size, 'sha256': self.sha256}
+
+    def close(self):
+        if not self.committed and not self._grid_in.closed:
+            self._grid_in.abort()
+
+
+class StreamingUploadRequest(Request):
+    """Request whose multipart file parts stream straight into GridFS."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        view = current_app.view_functions.get(self.endpoint)
+        if getattr(view, 'spooled_upload', False):
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return GridFSUploadStream(
+            filename=filename,
+            content_type=content_type,
+            max_bytes=current_app.config['MAX_UPLOAD_BYTES']
+        )
+
+
+def spooled_upload(view):
+    """Mark a view whose multipart files should be spooled by Werkzeug rather than streamed to GridFS."""
+    view.spooled_upload = True
+    return view
+
+
+def store_upload(file, **attributes):
+    """Keep an uploaded FileStorage in GridFS. Returns {'file_id', 'size', 'sha256'}.
+
+    Files that did not come through the streaming parser are copied in
+    COPY_CHUNK_SIZE pieces, so they get the same digest and size limit.
+    """
+    stream = file.stream
+    if not isinstance(stream, GridFSUploadStream):
+        stream = GridFSUploadStream(
+            filename=file.filename,
+            content_type=file.content_type,
+            max_bytes=current_app.config['MAX_UPLOAD_BYTES']
+        )
+        for chunk in iter(lambda: file.read(COPY_CHUNK_SIZE), b''):
+            stream.write(chunk)
+    return stream.commit(**attributes)
+
+
+def release_file(file_id):
+    """Drop one revision's reference to a stored file. Returns True if the file was deleted.
+
+    The delete is conditional on the count still being zero, and uploads only
+    reuse files with a positive count, so a concurrent re-upload can never be
+    handed a file that is about to disappear.
+    """
+    db = _db()
+    remaining = db.fs.files.find_one_and_update(
+        {'_id': file_id},
+        {'$inc': {'refcount': -1}},
+        projection={'refcount': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if remaining is None or remaining['refcount'] > 0:
+        return False
+    if db.fs.files.delete_one({'_id': file_id, 'refcount': {'$lte': 0}}).deleted_count:
+        db.fs.chunks.delete_many({'files_id': file_id})
+        return True
+    return False
+
+
+def upload_precheck(check):
+    """Run `check(**view_args)` before the multipart body is read; a response it returns ends the request."""
+    def decorate(view):
+        view.upload_precheck = check
+        return view
+    return decorate
+
+
+def parse_multipart_uploads():
+    """Authenticate and run the view's precheck, then stream the multipart body into GridFS."""
+    if request.mimetype == 'multipart/form-data':
+        verify_jwt_in_request()
+        check = getattr(current_app.view_functions.get(request.endpoint), 'upload_precheck', None)
+        if check is not None:
+            response = check(**(request.view_args or {}))
+            if response is not None:
+                return response
+        request.files
+
+
+def init_app(app):
+    app.config.setdefault('MAX_UPLOAD_BYTES', DEFAULT_MAX_UPLOAD_BYTES)
+    app.request_class = StreamingUploadRequest
+    app.before_request(parse_multipart_uploads)
@@ -0,0 +1,172 @@
+# backend/app/indexes.py
+
+"""
+Declared MongoDB indexes for the query shapes the routes actually run.
+
+`ensure_indexes` is idempotent and runs from create_app; the same operations
+are available from the command line:
+
+    flask --app run indexes ensure
+    flask --app run indexes report
+
+Index names are left to MongoDB's defaults (e.g. `author_id_1_status_1`) so a
+declaration always matches an index created earlier from the same keys.
+"""
+
+import click
+from flask.cli import AppGroup
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+INDEXES = {
+    'documents': [
+        # get_my_tasks: one branch of the $or per workflow role
+        IndexModel([('status', ASCENDING), ('qc_reviewers.user_id', ASCENDING), ('qc_reviewers.status', ASCENDING)]),
+        IndexModel([('status', ASCENDING), ('reviewers.user_id', ASCENDING), ('reviewers.status', ASCENDING)]),
+        IndexModel([('approver.user_id', ASCENDING), ('approver.status', ASCENDING), ('status', ASCENDING)]),
+        IndexModel([('author_id', ASCENDING), ('status', ASCENDING)]),
+        # can_amend_document / create_amendment: amendment in progress?
+        IndexModel([('amended_from', ASCENDING), ('status', ASCENDING)]),
+        # At most one Approved version per lineage; approving an amendment supersedes the original first
+        IndexModel([('lineage_id', ASCENDING)], unique=True,
+                   partialFilterExpression={'status': 'Approved', 'lineage_id': {'$exists': True}}),
+        # get_document_lineage and lineage head refresh
+        IndexModel([('lineage_id', ASCENDING), ('major_version', DESCENDING),
+                    ('minor_version', DESCENDING), ('created_at', DESCENDING)]),
+        # list_documents: page/cursor mode and search
+        IndexModel([('is_latest', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('is_latest', ASCENDING), ('search_prefixes', ASCENDING)]),
+        # verify_chains: documents whose audit event is still pending (standalone servers)
+        IndexModel([('audit_pending.event_id', ASCENDING)], sparse=True),
+        # get_approved_documents
+        IndexModel([('status', ASCENDING), ('signed_at', DESCENDING)]),
+    ],
+    'users': [
+        IndexModel([('email', ASCENDING)], unique=True),
+        IndexModel([('role', ASCENDING)]),
+    ],
+    'email_outbox': [
+        # Worker claims: due pending messages, then expired leases
+        IndexModel([('status', ASCENDING), ('next_attempt_at', ASCENDING)]),
+        IndexModel([('status', ASCENDING), ('locked_until', ASCENDING)]),
+        # Delivered messages expire after 30 days; dead letters are kept
+        IndexModel([('sent_at', ASCENDING)], expireAfterSeconds=30 * 24 * 60 * 60),
+    ],
+    'audit_events': [
+        # Paged document history, newest first
+        IndexModel([('document_id', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)]),
+        # migrate_history upserts legacy entries by position
+        IndexModel([('document_id', ASCENDING), ('legacy_index', ASCENDING)], unique=True,
+                   partialFilterExpression={'legacy_index': {'$exists': True}}),
+        # One event per chain position; also serves tip lookups and verification
+        IndexModel([('document_id', ASCENDING), ('seq', ASCENDING)], unique=True,
+                   partialFilterExpression={'seq': {'$exists': True}}),
+    ],
+    'audit_checkpoints': [
+        IndexModel([('status', ASCENDING), ('started_at', DESCENDING)]),
+    ],
+    'audit_chain_heads': [
+        IndexModel([('broken', ASCENDING)]),
+    ],
+    'signature_audits': [
+        IndexModel([('created_at', DESCENDING)]),
+    ],
+    'signature_audit_results': [
+        # One result per document per job: re-running a batch after a restart overwrites it
+        IndexModel([('job_id', ASCENDING), ('document_id', ASCENDING)], unique=True),
+        IndexModel([('job_id', ASCENDING), ('status', ASCENDING), ('document_id', ASCENDING)]),
+    ],
+    'login_attempts': [
+        # Counter documents disappear when their window ends
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    'keypair_pool': [
+        # Oldest keypair is handed out first
+        IndexModel([('created_at', ASCENDING)]),
+    ],
+    'fs.files': [
+        # Content-addressed uploads: find a live file with the same bytes
+        IndexModel([('sha256', ASCENDING), ('refcount', ASCENDING)]),
+    ],
+    'integration_log': [
+        IndexModel([('pushed_at', DESCENDING)]),
+        IndexModel([('document_id', ASCENDING), ('pushed_at', DESCENDING)]),
+    ],
+}
+
+
+def _index_name(model):
+    return model.document['name']
+
+
+def ensure_indexes(db):
+    """Create every declared index that does not exist yet.
+
+    Returns {collection: [created or confirmed index names]}. A failing index
+    (e.g. a unique index over existing duplicates) is reported and skipped so
+    it cannot block startup.
+    """
+    created = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        try:
+            created[collection_name] = collection.create_indexes(models)
+        except OperationFailure:
+            created[collection_name] = []
+            for model in models:
+                try:
+                    created[collection_name].extend(collection.create_indexes([model]))
+                except OperationFailure as e:
+                    print(f"⚠️ Could not create index {_index_name(model)} on {collection_name}: {e}")
+    return created
+
+
+def _index_usage(collection):
+    """{index name: ops since server start}, or None where $indexStats is unavailable."""
+    try:
+        return {stat['name']: stat['accesses']['ops'] for stat in collection.aggregate([{'$indexStats': {}}])}
+    except (OperationFailure, NotImplementedError):
+        return None
+
+
+def index_report(db):
+    """Compare declared indexes with what exists on the server.
+
+    For each collection: `missing` (declared, not present), `undeclared`
+    (present, not declared) and `unused` (present, zero accesses since the
+    server last started, per $indexStats).
+    """
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        declared = {_index_name(model) for model in models}
+        existing = set(collection.index_information()) - {'_id_'}
+        usage = _index_usage(collection)
+
+        report[collection_name] = {
+            'missing': sorted(declared - existing),
+            'undeclared': sorted(existing - declared),
+            'unused': sorted(name for name in existing if usage is not None and usage.get(name) == 0),
+        }
+    return report
+
+
+indexes_cli = AppGroup('indexes', help="Manage MongoDB indexes.")
+
+
+@indexes_cli.command('ensure')
+def ensure_indexes_command():
+    """Create any missing declared indexes."""
+    from . import db
+    for collection_name, names in ensure_indexes(db).items():
+        click.echo(f"{collection_name}: {', '.join(names) or 'no indexes created'}")
+
+
+@indexes_cli.command('report')
+def index_report_command():
+    """List missing, undeclared and unused indexes."""
+    from . import db
+    for collection_name, entry in index_report(db).items():
+        click.echo(f"{collection_name}:")
+        for label in ('missing', 'undeclared', 'unused'):
+            click.echo(f"  {label}: {', '.join(entry[label]) or '-'}")
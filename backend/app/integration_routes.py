@@ -4,6 +4,9 @@ import datetime
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson.objectid import ObjectId
+from .current_user import get_current_user
+from .projections import route_projection
+from .serializers import APPROVED_DOCUMENT_SCHEMA
 
 integration_blueprint = Blueprint('integration', __name__)
 
@@ -44,7 +47,7 @@ def get_available_systems(doc_id):
         except:
             return jsonify({"error": "Invalid document ID format"}), 400
         
-        doc = db.documents.find_one({'_id': doc_object_id})
+        doc = db.documents.find_one({'_id': doc_object_id}, route_projection())
         
         if not doc:
             return jsonify({"error": "Document not found"}), 404
@@ -106,7 +109,7 @@ def push_to_system():
         db = get_db()
         
         user_id = ObjectId(get_jwt_identity())
-        user = db.users.find_one({'_id': user_id})
+        user = get_current_user()
         
         data = request.json
         doc_id = data.get('document_id')
@@ -121,7 +124,7 @@ def push_to_system():
         except:
             return jsonify({"error": "Invalid document ID format"}), 400
         
-        doc = db.documents.find_one({'_id': doc_object_id})
+        doc = db.documents.find_one({'_id': doc_object_id}, route_projection())
         
         if not doc:
             return jsonify({"error": "Document not found"}), 404
@@ -186,7 +189,7 @@ def get_approved_documents():
     
     return jsonify({
         "total": len(docs),
-        "documents": docs
+        "documents": APPROVED_DOCUMENT_SCHEMA.dump_many(docs)
     }), 200
 
 
@@ -0,0 +1,164 @@
+# backend/app/keypair_pool.py
+
+"""
+Pre-generated RSA keypairs for new accounts.
+
+Generating a 2048-bit key takes hundreds of milliseconds of CPU, so
+registration draws a ready keypair from the `keypair_pool` collection instead.
+Each keypair is claimed with find_one_and_delete and handed out exactly once,
+even across gunicorn workers. Drawing below the low-water mark wakes a filler
+thread, which generates replacements on a small process pool; the web
+worker's own CPU is never used for generation unless the pool is empty, in
+which case `acquire` falls back to generating synchronously.
+
+The pool can also be topped up ahead of an onboarding wave:
+
+    flask --app run keypool fill
+    flask --app run keypool status
+"""
+
+import datetime
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import click
+from flask.cli import AppGroup
+from pymongo import ASCENDING
+from .crypto_utils import generate_keys
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_POOL_WORKERS = 1
+POLL_INTERVAL_SECONDS = 60
+
+
+def _generate_keypair(_=None):
+    return generate_keys()
+
+
+class KeypairPool:
+    """Stored keypairs plus this process's filler thread and generation pool."""
+
+    def __init__(self):
+        self.app = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._filler = None
+        self._executor = None
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('KEYPAIR_POOL_SIZE', DEFAULT_POOL_SIZE)
+        app.config.setdefault('KEYPAIR_POOL_WORKERS', DEFAULT_POOL_WORKERS)
+
+    @property
+    def collection(self):
+        from . import db
+        return db.keypair_pool
+
+    @property
+    def target_size(self):
+        return self.app.config['KEYPAIR_POOL_SIZE']
+
+    def available(self):
+        return self.collection.count_documents({})
+
+    def _claim(self):
+        keypair = self.collection.find_one_and_delete({}, sort=[('created_at', ASCENDING)])
+        return (keypair['private_key'], keypair['public_key']) if keypair else None
+
+    def acquire(self):
+        """One (private_key_pem, public_key_pem); generated on the spot if the pool is empty."""
+        keypair = self._claim()
+        self.request_refill()
+        if keypair is None:
+            print("⚠️ Keypair pool empty, generating synchronously")
+            keypair = generate_keys()
+        return keypair
+
+    def acquire_many(self, count):
+        """`count` keypairs: pooled ones first, the shortfall generated in parallel."""
+        keypairs = []
+        while len(keypairs) < count:
+            keypair = self._claim()
+            if keypair is None:
+                break
+            keypairs.append(keypair)
+        self.request_refill()
+
+        shortfall = count - len(keypairs)
+        if shortfall:
+            print(f"⚠️ Keypair pool short by {shortfall}, generating on the process pool")
+            keypairs.extend(self._get_executor().map(_generate_keypair, range(shortfall)))
+        return keypairs
+
+    def give_back(self, keypair):
+        """Return an acquired keypair that was never stored on an account, e.g. after a failed insert."""
+        private_key, public_key = keypair
+        self.collection.insert_one({
+            'private_key': private_key, 'public_key': public_key,
+            'created_at': datetime.datetime.now(datetime.timezone.utc)
+        })
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.app.config['KEYPAIR_POOL_WORKERS'],
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def fill(self, target=None):
+        """Generate keypairs until the pool holds `target` (default KEYPAIR_POOL_SIZE). Returns the number added."""
+        missing = (target or self.target_size) - self.available()
+        if missing <= 0:
+            return 0
+        now = datetime.datetime.now(datetime.timezone.utc)
+        documents = [
+            {'private_key': private_key, 'public_key': public_key, 'created_at': now}
+            for private_key, public_key in self._get_executor().map(_generate_keypair, range(missing))
+        ]
+        self.collection.insert_many(documents)
+        return len(documents)
+
+    def request_refill(self):
+        """Wake the filler (starting it on first use) if the pool is below half its target."""
+        if self.available() >= self.target_size // 2:
+            return
+        with self._lock:
+            if self._filler is None or not self._filler.is_alive():
+                self._filler = threading.Thread(target=self._run, name="keypair-pool-filler", daemon=True)
+                self._filler.start()
+        self._wakeup.set()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    added = self.fill()
+                    if added:
+                        print(f"🔑 Keypair pool refilled with {added} keypair(s)")
+                except Exception as e:
+                    print(f"❌ Keypair pool filler error: {str(e)}")
+                self._wakeup.wait(POLL_INTERVAL_SECONDS)
+                self._wakeup.clear()
+
+
+keypair_pool = KeypairPool()
+
+
+keypool_cli = AppGroup('keypool', help="Manage the pre-generated RSA keypair pool.")
+
+
+@keypool_cli.command('fill')
+@click.option('--size', type=int, default=None, help="Target pool size (default KEYPAIR_POOL_SIZE).")
+def fill_command(size):
+    """Generate keypairs until the pool is full."""
+    added = keypair_pool.fill(size)
+    click.echo(f"Added {added} keypair(s); {keypair_pool.available()} available")
+
+
+@keypool_cli.command('status')
+def status_command():
+    """Show how many keypairs are ready."""
+    click.echo(f"{keypair_pool.available()} of {keypair_pool.target_size} keypair(s) available")
@@ -0,0 +1,66 @@
+# backend/app/login_throttle.py
+
+"""
+Failed-login counters per account and per client IP.
+
+Each counter is one document per fixed window in `login_attempts`, named by
+its key and window, e.g. `account:alice@site.org:1932`. The document carries
+an `expires_at` at the window's end, and a TTL index removes it. The login
+route checks both counters before touching bcrypt, so once a limit is reached
+further guesses cost one indexed read instead of a bcrypt round. A successful
+login clears the account counter; the IP counter runs out with its window.
+"""
+
+import datetime
+import math
+from pymongo import UpdateOne
+
+DEFAULT_WINDOW_SECONDS = 15 * 60
+DEFAULT_MAX_ACCOUNT_FAILURES = 5
+DEFAULT_MAX_IP_FAILURES = 50
+
+
+def _settings(config):
+    return (
+        config.get('LOGIN_ATTEMPT_WINDOW_SECONDS', DEFAULT_WINDOW_SECONDS),
+        config.get('LOGIN_MAX_ACCOUNT_FAILURES', DEFAULT_MAX_ACCOUNT_FAILURES),
+        config.get('LOGIN_MAX_IP_FAILURES', DEFAULT_MAX_IP_FAILURES)
+    )
+
+
+def _window(window_seconds):
+    """(window number, seconds until it ends)"""
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    number = int(now // window_seconds)
+    return number, math.ceil((number + 1) * window_seconds - now)
+
+
+def _keys(email, ip, number):
+    return f"account:{email}:{number}", f"ip:{ip}:{number}"
+
+
+def retry_after(db, config, email, ip):
+    """Seconds until this email/IP may try again, or None if neither limit is reached."""
+    window_seconds, max_account, max_ip = _settings(config)
+    number, remaining = _window(window_seconds)
+    account_key, ip_key = _keys(email, ip, number)
+    counts = {doc['_id']: doc['failures'] for doc in db.login_attempts.find({'_id': {'$in': [account_key, ip_key]}})}
+    if counts.get(account_key, 0) >= max_account or counts.get(ip_key, 0) >= max_ip:
+        return remaining
+    return None
+
+
+def record_failure(db, config, email, ip):
+    window_seconds, _, _ = _settings(config)
+    number, _ = _window(window_seconds)
+    expires_at = datetime.datetime.fromtimestamp((number + 1) * window_seconds, datetime.timezone.utc)
+    db.login_attempts.bulk_write([
+        UpdateOne({'_id': key}, {'$inc': {'failures': 1}, '$setOnInsert': {'expires_at': expires_at}}, upsert=True)
+        for key in _keys(email, ip, number)
+    ], ordered=False)
+
+
+def clear_account(db, config, email):
+    window_seconds, _, _ = _settings(config)
+    number, _ = _window(window_seconds)
+    db.login_attempts.delete_one({'_id': _keys(email, None, number)[0]})
@@ -0,0 +1,117 @@
+# backend/app/password_hashing.py
+
+"""
+bcrypt on a process pool.
+
+bcrypt is deliberately slow. Hashing a few hundred imported passwords on the
+request thread would hold a gunicorn worker for minutes, so batches go to a
+small spawn-context process pool instead. Pool workers are configured with the
+same rounds, prefix and long-password handling as the app's Bcrypt extension,
+so their hashes are interchangeable with `bcrypt.generate_password_hash`.
+
+Login checks run on a pool of their own (PASSWORD_CHECK_WORKERS), so a bulk
+import queued on the hashing pool can never hold them up. The check pool admits
+at most PASSWORD_CHECK_MAX_PENDING checks per process at a time (queued plus
+running). Past that, `check` raises
+PasswordHasherBusy straight away, and the login route answers 429 instead of
+piling requests up behind bcrypt.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from flask_bcrypt import Bcrypt
+
+DEFAULT_WORKERS = 2
+DEFAULT_CHECK_WORKERS = 2
+DEFAULT_MAX_PENDING_CHECKS = 16
+CHECK_TIMEOUT_SECONDS = 10
+
+
+class PasswordHasherBusy(Exception):
+    """The check queue is full, or a check did not finish in time."""
+
+
+_worker_bcrypt = None
+
+
+def _init_worker(log_rounds, prefix, handle_long_passwords):
+    global _worker_bcrypt
+    _worker_bcrypt = Bcrypt()
+    _worker_bcrypt._log_rounds = log_rounds
+    _worker_bcrypt._prefix = prefix
+    _worker_bcrypt._handle_long_passwords = handle_long_passwords
+
+
+def _hash_password(password):
+    return _worker_bcrypt.generate_password_hash(password).decode('utf-8')
+
+
+def _check_password(pw_hash, password):
+    return _worker_bcrypt.check_password_hash(pw_hash, password)
+
+
+class PasswordHasher:
+    """Lazily started process pools for bcrypt work: one for bulk hashing, one for login checks."""
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._executors = {}
+        self._check_slots = None
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS)
+        app.config.setdefault('PASSWORD_CHECK_WORKERS', DEFAULT_CHECK_WORKERS)
+        app.config.setdefault('PASSWORD_CHECK_MAX_PENDING', DEFAULT_MAX_PENDING_CHECKS)
+        self._check_slots = threading.BoundedSemaphore(app.config['PASSWORD_CHECK_MAX_PENDING'])
+
+    def _get_executor(self, workers_setting):
+        with self._lock:
+            if workers_setting not in self._executors:
+                config = self.app.config
+                self._executors[workers_setting] = ProcessPoolExecutor(
+                    max_workers=config[workers_setting],
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(
+                        config.get('BCRYPT_LOG_ROUNDS', 12),
+                        config.get('BCRYPT_HASH_PREFIX', '2b'),
+                        config.get('BCRYPT_HANDLE_LONG_PASSWORDS', False)
+                    )
+                )
+            return self._executors[workers_setting]
+
+    def shutdown(self):
+        """Stop both pools; they start again on next use."""
+        with self._lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown()
+
+    def hash_many(self, passwords):
+        """bcrypt hashes (as str) for `passwords`, in order, computed in parallel."""
+        if not passwords:
+            return []
+        chunksize = max(len(passwords) // (self.app.config['PASSWORD_HASH_WORKERS'] * 4), 1)
+        return list(self._get_executor('PASSWORD_HASH_WORKERS').map(_hash_password, passwords, chunksize=chunksize))
+
+    def check(self, pw_hash, password, timeout=CHECK_TIMEOUT_SECONDS):
+        """bcrypt.check_password_hash on the check pool. Raises PasswordHasherBusy when the queue is full."""
+        if not self._check_slots.acquire(blocking=False):
+            raise PasswordHasherBusy("Too many password checks in progress")
+        try:
+            future = self._get_executor('PASSWORD_CHECK_WORKERS').submit(_check_password, pw_hash, password)
+        except Exception:
+            self._check_slots.release()
+            raise
+        # The slot stays taken until the worker is actually done, even if we stop waiting
+        future.add_done_callback(lambda _: self._check_slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise PasswordHasherBusy("Password check timed out")
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,126 @@
+# backend/app/projections.py
+
+"""
+Which document fields each route reads.
+
+A document carries its history, every revision, reviewer arrays, the
+signature and search terms, but most handlers only check a status and an
+author. Handlers pass `route_projection()` to find_one, which looks up the
+current endpoint in ROUTE_PROJECTIONS. When a handler starts reading another
+field, add the field here. Endpoints without an entry still get the whole
+document.
+
+Set PROJECTION_INSTRUMENTATION=1 to log how many BSON bytes MongoDB returned
+for each request, by endpoint. This helps when sizing a new projection:
+
+    📏 POST document_workflow.qc_review: 1.4 KB in 3 replies
+"""
+
+import bson
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+# Where a document stands, for 409 responses (DOCUMENT_STATE_SCHEMA)
+DOCUMENT_STATE_PROJECTION = {
+    'status': 1, 'current_stage': 1, 'major_version': 1, 'minor_version': 1, '_rev': 1
+}
+
+# An in-progress amendment that blocks a new one
+AMENDMENT_CONFLICT_PROJECTION = {'major_version': 1, 'minor_version': 1, 'status': 1}
+
+# Fields copied from an approved document into its amendment
+AMEND_SOURCE_PROJECTION = {
+    'status': 1, 'current_stage': 1, 'doc_number': 1, 'lineage_id': 1,
+    'major_version': 1, 'minor_version': 1, 'tmf_metadata': 1, '_rev': 1
+}
+
+# Projecting one small key of each revision keeps the array length for len()
+REVISION_COUNT = 'revisions.file_id'
+
+ROUTE_PROJECTIONS = {
+    'document_read.get_document_details': {
+        'doc_number': 1, 'status': 1, 'current_stage': 1, 'lineage_id': 1,
+        'major_version': 1, 'minor_version': 1, 'created_at': 1,
+        'author_id': 1, 'author_username': 1, 'tmf_metadata': 1,
+        'active_revision': 1, 'revisions.filename': 1,
+        'qc_reviewers': 1, 'reviewers': 1, 'approver': 1,
+        'qc_due_date': 1, 'review_due_date': 1, 'approval_due_date': 1,
+        'signature': 1, 'signed_at': 1, 'signed_by_id': 1, 'signed_by_username': 1,
+        'history': 1, '_rev': 1
+    },
+    'document_read.preview_document': {
+        'active_revision': 1, 'revisions.file_id': 1, 'revisions.sha256': 1
+    },
+    'document_read.get_document_lineage': {
+        'major_version': 1, 'minor_version': 1, 'status': 1, 'created_at': 1
+    },
+
+    # Transitions check status and guards in their update filter (workflow_transitions);
+    # this is the read done before signing
+    'document_workflow.final_approval': {
+        'status': 1, 'approver.user_id': 1, 'major_version': 1, 'lineage_id': 1,
+        'amended_from': 1, 'active_revision': 1, REVISION_COUNT: 1
+    },
+    'document_workflow.verify_doc_signature': {
+        'signature': 1, 'signed_sha256': 1, 'signed_by_id': 1, 'signed_by_username': 1,
+        'active_revision': 1, 'revisions.file_id': 1
+    },
+    'document_workflow.create_amendment': AMEND_SOURCE_PROJECTION,
+    'document_workflow.can_amend_document': {'status': 1},
+
+    'document_lifecycle.create_amendment': AMEND_SOURCE_PROJECTION,
+    'document_lifecycle.can_amend_document': {'status': 1},
+    'document_lifecycle.delete_document': {
+        'status': 1, 'current_stage': 1, 'author_id': 1, 'doc_number': 1, 'lineage_id': 1,
+        'major_version': 1, 'minor_version': 1, '_rev': 1,
+        'revisions.filename': 1, 'revisions.file_id': 1
+    },
+
+    'integration.get_available_systems': {
+        'status': 1, 'doc_number': 1, 'major_version': 1, 'minor_version': 1,
+        'tmf_metadata.tmf_zone': 1
+    },
+    'integration.push_to_system': {
+        'status': 1, 'doc_number': 1, 'major_version': 1, 'minor_version': 1
+    },
+}
+
+
+def route_projection():
+    """The projection registered for the current endpoint, or None for the whole document."""
+    return ROUTE_PROJECTIONS.get(request.endpoint)
+
+
+def _format_bytes(size):
+    return f"{size / 1024:.1f} KB" if size >= 1024 else f"{size} B"
+
+
+class ReplySizeListener(monitoring.CommandListener):
+    """Adds up the encoded size of MongoDB replies on the request's `g`."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if not has_request_context():
+            return
+        g.mongo_reply_bytes = g.get('mongo_reply_bytes', 0) + len(bson.encode(event.reply))
+        g.mongo_replies = g.get('mongo_replies', 0) + 1
+
+    def failed(self, event):
+        pass
+
+
+def log_reply_size(response):
+    if g.get('mongo_replies'):
+        print(f"📏 {request.method} {request.endpoint or request.path}: "
+              f"{_format_bytes(g.mongo_reply_bytes)} in {g.mongo_replies} replies")
+    return response
+
+
+def event_listeners(app):
+    """Listeners to pass to MongoClient; empty unless PROJECTION_INSTRUMENTATION is on."""
+    if not app.config.get('PROJECTION_INSTRUMENTATION'):
+        return []
+    app.after_request(log_reply_size)
+    return [ReplySizeListener()]
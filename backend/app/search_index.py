@@ -0,0 +1,114 @@
+# backend/app/search_index.py
+
+"""
+Inverted search index for documents, maintained on write.
+
+Each document carries two multikey arrays:
+  - search_terms:    normalised tokens, used for relevance ranking
+  - search_prefixes: every prefix of those tokens, used for matching
+
+A query matches when every query token is a prefix of some indexed token, so
+"prot 0001" finds "Protocol_v2.pdf" / "REG-TMF-00012" through the
+(is_latest, search_prefixes) index instead of a regex scan. Prefixes start at
+MIN_PREFIX_LENGTH characters, so shorter query tokens are ignored: the first
+keystroke leaves the list unfiltered rather than matching only 1-character
+terms. The arrays only
+ever grow (filenames, comments and reasons are append-only), so writers add
+to them with $addToSet (or $setUnion in update pipelines) in the same update
+that records the new text.
+"""
+
+import re
+
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 20
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+TMF_SEARCH_FIELDS = ('study_id', 'country', 'site_id', 'tmf_zone', 'tmf_section', 'tmf_artifact')
+
+
+def tokenize(*texts):
+    """Lower-cased alphanumeric tokens of all non-empty texts."""
+    tokens = set()
+    for text in texts:
+        if text:
+            tokens.update(TOKEN_PATTERN.findall(str(text).lower()))
+    return tokens
+
+
+def _prefixes(token):
+    if len(token) < MIN_PREFIX_LENGTH:
+        return {token}
+    return {token[:i] for i in range(MIN_PREFIX_LENGTH, min(len(token), MAX_PREFIX_LENGTH) + 1)}
+
+
+def build_search_fields(*texts):
+    """Search arrays for a new document, to merge into its insert."""
+    terms = tokenize(*texts)
+    prefixes = set()
+    for token in terms:
+        prefixes.update(_prefixes(token))
+    return {'search_terms': sorted(terms), 'search_prefixes': sorted(prefixes)}
+
+
+def search_terms_update(*texts):
+    """`$addToSet` body that adds new text to an existing document's index."""
+    fields = build_search_fields(*texts)
+    return {name: {'$each': values} for name, values in fields.items()}
+
+
+def search_terms_stage(*texts):
+    """The same additions as search_terms_update, as a `$set` stage for update pipelines."""
+    fields = build_search_fields(*texts)
+    return {'$set': {
+        name: {'$setUnion': [{'$ifNull': [f'${name}', []]}, values]}
+        for name, values in fields.items()
+    }}
+
+
+def document_search_texts(doc):
+    """Every searchable piece of text on a stored document.
+
+    Comments are taken from the reviewer/approver entries and reasons rather
+    than from `history`, whose generated details would only add noise.
+    """
+    texts = [doc.get('doc_number')]
+    tmf_metadata = doc.get('tmf_metadata') or {}
+    texts.extend(tmf_metadata.get(field) for field in TMF_SEARCH_FIELDS)
+    for revision in doc.get('revisions', []):
+        texts.extend([revision.get('filename'), revision.get('author_comment')])
+    for reviewer in doc.get('qc_reviewers', []) + doc.get('reviewers', []):
+        texts.extend([reviewer.get('comment'), reviewer.get('previous_comment')])
+    texts.append((doc.get('approver') or {}).get('comment'))
+    texts.extend([doc.get('amendment_reason'), doc.get('withdrawal_reason'), doc.get('obsolescence_reason')])
+    return texts
+
+
+def search_filter(search_query):
+    """Returns (filter, query_terms) for a search string, or (None, []) if it has no searchable tokens."""
+    terms = {token for token in tokenize(search_query) if len(token) >= MIN_PREFIX_LENGTH}
+    if not terms:
+        return None, []
+    prefixes = [token[:MAX_PREFIX_LENGTH] for token in terms]
+    return {'search_prefixes': {'$all': prefixes}}, sorted(terms)
+
+
+def relevance_stage(query_terms):
+    """`$addFields` stage scoring documents by how many query tokens match a whole term."""
+    return {'$addFields': {'_score': {'$size': {'$filter': {
+        'input': query_terms,
+        'cond': {'$in': ['$$this', {'$ifNull': ['$search_terms', []]}]}
+    }}}}}
+
+
+def backfill_search_index(db):
+    """Index documents written before the search arrays existed. Safe to run repeatedly."""
+    count = 0
+    for doc in db.documents.find({'search_prefixes': {'$exists': False}}):
+        db.documents.update_one(
+            {'_id': doc['_id']},
+            {'$set': build_search_fields(*document_search_texts(doc))}
+        )
+        count += 1
+    return count
@@ -0,0 +1,352 @@
+# backend/app/serializers.py
+
+"""
+Response shapes for documents, users and audit entries.
+
+A Schema lists its output keys once. Each key maps to a Field: the source key
+to read, a converter for the value, and what to do when the key is missing.
+The schema is compiled into a dump function when it is defined, so dumping a
+few thousand task rows runs prepared readers. It does not re-inspect every
+value with isinstance/hasattr chains.
+
+    TASK_SCHEMA.dump_many(documents, {'author_names': author_names})
+
+`init_app` swaps Flask's JSON provider for one backed by orjson when that
+package is installed. The output is the same JSON as before: sorted keys,
+and RFC 822 dates for any datetime that reaches the encoder raw.
+"""
+
+import datetime
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional speedup; the stdlib provider is used without it
+    orjson = None
+
+_MISSING = object()
+
+
+def to_str_id(value):
+    return str(value) if value.__class__ is ObjectId else value
+
+
+def to_iso(value):
+    return value.isoformat() if isinstance(value, datetime.date) else value
+
+
+class Field:
+    """One output key.
+
+    source   key to read (defaults to the output key)
+    convert  applied to present, non-None values
+    default  used when the source key is missing
+    optional leave the output key out when the source key is missing
+    compute  `compute(obj, context)` builds the value instead of reading a key
+    """
+
+    __slots__ = ('source', 'convert', 'default', 'optional', 'compute')
+
+    def __init__(self, source=None, convert=None, default=None, optional=False, compute=None):
+        self.source = source
+        self.convert = convert
+        self.default = default
+        self.optional = optional
+        self.compute = compute
+
+
+def _reader(key, field):
+    """`read(obj, context)` for a key that is always in the output."""
+    if field.compute is not None:
+        return field.compute
+    source, convert, default = field.source or key, field.convert, field.default
+    if convert is None:
+        return lambda obj, context: obj.get(source, default)
+
+    def read(obj, context):
+        value = obj.get(source, _MISSING)
+        if value is _MISSING:
+            return default
+        return value if value is None else convert(value)
+    return read
+
+
+class Schema:
+    """An ordered set of Fields, compiled once into a dump function.
+
+    Each field's options are resolved into a reader closure when the schema
+    is defined, so dumping a row only calls one prepared reader per key.
+    """
+
+    def __init__(self, fields):
+        self.fields = dict(fields)
+        self.dump = self._compile()
+
+    def extend(self, fields):
+        """A new schema with these fields added or replaced."""
+        return Schema({**self.fields, **fields})
+
+    def _compile(self):
+        # Always-present keys come first, in order; optional ones are added after them
+        readers = [(key, _reader(key, field)) for key, field in self.fields.items()
+                   if field.compute is not None or not field.optional]
+        optional = [(key, field.source or key, field.convert) for key, field in self.fields.items()
+                    if field.compute is None and field.optional]
+
+        def dump(obj, context=None):
+            out = {key: read(obj, context) for key, read in readers}
+            for key, source, convert in optional:
+                value = obj.get(source, _MISSING)
+                if value is not _MISSING:
+                    out[key] = value if value is None or convert is None else convert(value)
+            return out
+        return dump
+
+    def dump_many(self, objs, context=None):
+        dump = self.dump
+        return [dump(obj, context) for obj in objs]
+
+
+def nested(schema, required=None):
+    """Converter for an embedded document; `{}` unless it has the `required` key."""
+    dump = schema.dump
+
+    def convert(value):
+        if not value or (required and not value.get(required)):
+            return {}
+        return dump(value)
+    return convert
+
+
+def many(schema, required=None):
+    """Converter for an array of embedded documents, skipping ones without the `required` key."""
+    dump = schema.dump
+
+    def convert(values):
+        return [dump(value) for value in values if not required or value.get(required)]
+    return convert
+
+
+def _active_revision(doc):
+    revisions = doc.get('revisions') or [{}]
+    index = doc.get('active_revision', 0)
+    return revisions[min(index, len(revisions) - 1)]
+
+
+def _author_username(doc, context):
+    author_names = (context or {}).get('author_names', {})
+    return doc.get('author_username') or author_names.get(doc.get('author_id'), 'Unknown')
+
+
+# --- Embedded documents ---
+
+REVIEWER_SCHEMA = Schema({
+    'user_id': Field(convert=to_str_id),
+    'status': Field(default='Pending'),
+    'reviewed_at': Field(convert=to_iso),
+    'comment': Field(default='')
+})
+
+APPROVER_SCHEMA = Schema({
+    'user_id': Field(convert=to_str_id),
+    'status': Field(default='Pending'),
+    'approved_at': Field(convert=to_iso),
+    'comment': Field(default=''),
+    'due_date': Field()
+})
+
+REVISION_SCHEMA = Schema({
+    'revision_number': Field(),
+    'file_id': Field(convert=to_str_id),
+    'filename': Field(),
+    'size': Field(optional=True),
+    'sha256': Field(optional=True),
+    'author_comment': Field(optional=True),
+    'uploaded_by_id': Field(convert=to_str_id, optional=True),
+    'uploaded_by_username': Field(optional=True),
+    'uploaded_at': Field(convert=to_iso)
+})
+
+# History entries on the document and rows of audit_events share one shape
+AUDIT_ENTRY_SCHEMA = Schema({
+    'action': Field(default=''),
+    'user': Field('user_username', default='Unknown'),
+    'timestamp': Field(convert=to_iso),
+    'details': Field(default='')
+})
+
+AUDIT_EVENT_SCHEMA = AUDIT_ENTRY_SCHEMA.extend({
+    'seq': Field(),
+    'hash': Field()
+})
+
+
+def dump_history(entries):
+    """Document history for detail views; entries without a timestamp are skipped."""
+    dump = AUDIT_ENTRY_SCHEMA.dump
+    return [dump(entry) for entry in entries if entry.get('timestamp')]
+
+
+# --- Documents ---
+
+# Rows of the task list, from build_task_pipeline. Keys the pipeline did not
+# project (missing on older documents) are left out, as before.
+TASK_SCHEMA = Schema({
+    'id': Field('_id', convert=str),
+    'doc_number': Field(default='N/A'),
+    'filename': Field(default='Unknown'),
+    'status': Field(optional=True),
+    'current_stage': Field(optional=True),
+    'lineage_id': Field(optional=True),
+    'major_version': Field(optional=True),
+    'minor_version': Field(optional=True),
+    'version': Field(compute=lambda doc, _: f"{doc.get('major_version', 1)}.{doc.get('minor_version', 0)}"),
+    'created_at': Field(convert=to_iso, optional=True),
+    'author_id': Field(convert=to_str_id),
+    'author_username': Field(compute=_author_username),
+    'tmf_metadata': Field(optional=True),
+    'qc_reviewers': Field(convert=many(REVIEWER_SCHEMA, required='user_id'), optional=True),
+    'reviewers': Field(convert=many(REVIEWER_SCHEMA, required='user_id'), optional=True),
+    'approver': Field(convert=nested(APPROVER_SCHEMA, required='user_id'), optional=True),
+    'qc_due_date': Field(),
+    'review_due_date': Field(),
+    'approval_due_date': Field(),
+    'due_date': Field(optional=True),
+    'urgency': Field(optional=True),
+    'signed_at': Field(convert=to_iso, optional=True),
+    'signed_by_id': Field(convert=to_str_id, optional=True),
+    'signed_by_username': Field(optional=True),
+    'rev': Field('_rev', optional=True)
+})
+
+# Rows of the library table, from LIST_PROJECTION
+LIST_SCHEMA = Schema({
+    'id': Field('_id', convert=str),
+    'doc_number': Field(default='N/A'),
+    'filename': Field(compute=lambda doc, _: _active_revision(doc).get('filename', 'Unknown')),
+    'status': Field(default='Draft'),
+    'author_username': Field(compute=_author_username),
+    'qc_due_date': Field(),
+    'review_due_date': Field(),
+    'approval_due_date': Field(compute=lambda doc, _: (doc.get('approver') or {}).get('due_date'))
+})
+
+DOCUMENT_DETAIL_SCHEMA = Schema({
+    'id': Field('_id', convert=str),
+    'doc_number': Field(),
+    'filename': Field(compute=lambda doc, _: _active_revision(doc).get('filename')),
+    'uploadDate': Field('created_at', convert=to_iso),
+    'status': Field(),
+    'version': Field(compute=lambda doc, _: f"{doc.get('major_version', 0)}.{doc.get('minor_version', 0)}"),
+    'major_version': Field(default=0),
+    'minor_version': Field(default=0),
+    'author_username': Field(default='Unknown'),
+    'author_id': Field(convert=to_str_id),
+    'lineage_id': Field(),
+    'tmf_metadata': Field(default={}),
+    'current_stage': Field(),
+    'qc_reviewers': Field(convert=many(REVIEWER_SCHEMA, required='user_id'), default=[]),
+    'reviewers': Field(convert=many(REVIEWER_SCHEMA, required='user_id'), default=[]),
+    'approver': Field(convert=nested(APPROVER_SCHEMA, required='user_id'), default={}),
+    'qc_due_date': Field(),
+    'review_due_date': Field(),
+    'approval_due_date': Field(),
+    'history': Field(convert=dump_history, default=[]),
+    'rev': Field('_rev', default=0)
+})
+
+# Where a document stands, returned with 409 so the client can retry from it
+DOCUMENT_STATE_SCHEMA = Schema({
+    'id': Field('_id', convert=str),
+    'status': Field(),
+    'current_stage': Field(),
+    'version': Field(compute=lambda doc, _: f"{doc.get('major_version', 0)}.{doc.get('minor_version', 0)}"),
+    'rev': Field('_rev', default=0)
+})
+
+# Only present once the document is signed
+SIGNATURE_SCHEMA = Schema({
+    'signature': Field(),
+    'signed_at': Field(convert=to_iso),
+    'signed_by_username': Field(default='Unknown'),
+    'signed_by_id': Field(convert=to_str_id)
+})
+
+LINEAGE_VERSION_SCHEMA = Schema({
+    'id': Field('_id', convert=str),
+    'version': Field(compute=lambda doc, _: f"{doc.get('major_version')}.{doc.get('minor_version')}"),
+    'status': Field(),
+    'uploadDate': Field('created_at', convert=to_iso)
+})
+
+# Approved documents for external systems (integration API)
+APPROVED_DOCUMENT_SCHEMA = Schema({
+    'doc_number': Field(),
+    'major_version': Field(),
+    'minor_version': Field(),
+    'tmf_metadata': Field(default={}),
+    'signed_at': Field(convert=to_iso),
+    'signed_by_username': Field(),
+    'revisions': Field(convert=many(REVISION_SCHEMA), default=[])
+})
+
+
+# --- Users ---
+
+USER_SCHEMA = Schema({
+    'id': Field('_id', convert=str),
+    'username': Field(),
+    'email': Field(),
+    'role': Field(),
+    'created_at': Field(convert=to_iso)
+})
+
+USER_SUMMARY_SCHEMA = Schema({
+    'id': Field('_id', convert=str),
+    'username': Field()
+})
+
+
+# --- JSON provider ---
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with orjson doing the encoding and decoding.
+
+    Datetimes are passed through to Flask's `default`, so anything not
+    already converted by a schema still becomes an HTTP date as before.
+    """
+
+    def _options(self, indent=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        indent = kwargs.pop('indent', None)
+        kwargs.pop('separators', None)
+        if kwargs:
+            # Options orjson has no equivalent for (cls=..., custom default, ...)
+            return super().dumps(obj, indent=indent, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options(bool(indent))).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    if orjson is None:
+        print("ℹ️ orjson not installed, using the standard JSON provider")
+        return
+    app.json = OrjsonProvider(app)
@@ -0,0 +1,363 @@
+# backend/app/signature_audit.py
+
+"""
+Bulk signature verification for inspection readiness.
+
+A job selects signed documents by study, TMF zone and signing date, walks them
+in `_id` order, and verifies each one on a process pool. Each pool worker
+opens its own MongoDB connection, stream-hashes the GridFS file and checks the
+signature with crypto_utils, so file bytes never pass through the web
+process.
+
+Results go to `signature_audit_results`, one per (job, document). After every
+batch the job records its checkpoint (`last_document_id`) and counters in a
+single update, so a job that stopped (crash, deploy, failure) resumes after
+its last completed batch without double counting. Jobs are run in a
+background thread from the API, or in the foreground from the CLI:
+
+    flask --app run signature-audit run --study-id STUDY-001
+    flask --app run signature-audit resume <job_id>
+"""
+
+import datetime
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import click
+import gridfs
+from bson.objectid import ObjectId
+from flask import current_app
+from flask.cli import AppGroup
+from gridfs.errors import NoFile
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.server_api import ServerApi
+from .crypto_utils import hash_stream, verify_digest
+
+DEFAULT_WORKERS = 2
+BATCH_SIZE = 50
+STALE_AFTER_SECONDS = 10 * 60
+
+RESULT_STATUSES = ('valid', 'invalid', 'error')
+
+AUDIT_PROJECTION = {
+    'doc_number': 1, 'signature': 1, 'signed_sha256': 1, 'signed_at': 1,
+    'signed_by_id': 1, 'signed_by_username': 1,
+    'active_revision': 1, 'revisions.file_id': 1,
+    'tmf_metadata.study_id': 1, 'tmf_metadata.tmf_zone': 1
+}
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _parse_date(value, field):
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"{field} must be an ISO 8601 date")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def parse_audit_filters(data):
+    """Validated job filters from request/CLI input. Raises ValueError on bad dates."""
+    filters = {
+        'study_id': (data.get('study_id') or '').strip() or None,
+        'tmf_zone': (data.get('tmf_zone') or '').strip() or None,
+        'signed_from': None,
+        'signed_to': None
+    }
+    for field in ('signed_from', 'signed_to'):
+        if data.get(field):
+            filters[field] = _parse_date(data[field], field)
+    return filters
+
+
+def build_audit_query(filters):
+    """Signed documents matching the job filters. A zone matches by prefix, so "02" finds "02 - Central"."""
+    query = {'signature': {'$exists': True}}
+    if filters.get('study_id'):
+        query['tmf_metadata.study_id'] = filters['study_id']
+    if filters.get('tmf_zone'):
+        query['tmf_metadata.tmf_zone'] = {'$regex': f"^{re.escape(filters['tmf_zone'])}"}
+    signed_at = {}
+    if filters.get('signed_from'):
+        signed_at['$gte'] = filters['signed_from']
+    if filters.get('signed_to'):
+        signed_at['$lte'] = filters['signed_to']
+    if signed_at:
+        query['signed_at'] = signed_at
+    return query
+
+
+def check_signature(db, task):
+    """Stream-hash one document's file and verify its signature. Returns a result record."""
+    result = {'sha256': None, 'error': None}
+    try:
+        file_hash = hash_stream(gridfs.GridFS(db).get(task['file_id']))
+        result['sha256'] = file_hash.hexdigest()
+        valid = verify_digest(task['public_key'], file_hash, task['signature'])
+        result['status'] = 'valid' if valid else 'invalid'
+        if task.get('signed_sha256'):
+            result['digest_matches'] = task['signed_sha256'] == result['sha256']
+    except NoFile:
+        result.update(status='error', error='File not found in GridFS')
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    return result
+
+
+# --- Pool worker side: one MongoDB client per process ---
+
+_worker_db = None
+
+
+def _init_worker(mongo_uri, db_name):
+    global _worker_db
+    _worker_db = MongoClient(mongo_uri, server_api=ServerApi('1'))[db_name]
+
+
+def _check_signature_in_worker(task):
+    return check_signature(_worker_db, task)
+
+
+# --- Job lifecycle ---
+
+def create_job(db, filters, user):
+    now = _now()
+    job = {
+        'filters': filters,
+        'status': 'queued',
+        'created_by_id': user['_id'],
+        'created_by_username': user.get('username'),
+        'created_at': now,
+        'heartbeat_at': now,
+        'total': db.documents.count_documents(build_audit_query(filters)),
+        'processed': 0,
+        'counts': {status: 0 for status in RESULT_STATUSES},
+        'last_document_id': None,
+        'summary': None,
+        'error': None
+    }
+    job['_id'] = db.signature_audits.insert_one(job).inserted_id
+    return job
+
+
+def claim_job(db, job_id):
+    """Mark a job running unless another runner holds it. Returns the job or None."""
+    now = _now()
+    return db.signature_audits.find_one_and_update(
+        {'_id': job_id, '$or': [
+            {'status': {'$in': ['queued', 'failed']}},
+            {'status': 'running', 'heartbeat_at': {'$lt': now - datetime.timedelta(seconds=STALE_AFTER_SECONDS)}}
+        ]},
+        {'$set': {'status': 'running', 'heartbeat_at': now, 'error': None}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _batches(cursor, size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _prepare_tasks(db, batch, key_cache):
+    """Pair each document with its signer's public key; documents that cannot be checked get an error result."""
+    missing = {doc['signed_by_id'] for doc in batch if doc.get('signed_by_id') and doc['signed_by_id'] not in key_cache}
+    if missing:
+        for user in db.users.find({'_id': {'$in': list(missing)}}, {'public_key': 1}):
+            key_cache[user['_id']] = user.get('public_key')
+
+    tasks, errors = [], {}
+    for doc in batch:
+        public_key = key_cache.get(doc.get('signed_by_id'))
+        revisions = doc.get('revisions', [])
+        active_revision = doc.get('active_revision', 0)
+        if not public_key:
+            errors[doc['_id']] = {'status': 'error', 'sha256': None, 'error': 'Signer public key not found'}
+        elif active_revision >= len(revisions):
+            errors[doc['_id']] = {'status': 'error', 'sha256': None, 'error': 'Active revision not found'}
+        else:
+            tasks.append({
+                'document_id': doc['_id'],
+                'file_id': revisions[active_revision]['file_id'],
+                'signature': doc['signature'],
+                'signed_sha256': doc.get('signed_sha256'),
+                'public_key': public_key
+            })
+    return tasks, errors
+
+
+def _result_record(job_id, doc, result):
+    tmf_metadata = doc.get('tmf_metadata') or {}
+    return {
+        'job_id': job_id,
+        'document_id': doc['_id'],
+        'doc_number': doc.get('doc_number'),
+        'study_id': tmf_metadata.get('study_id'),
+        'tmf_zone': tmf_metadata.get('tmf_zone'),
+        'signed_by_username': doc.get('signed_by_username'),
+        'signed_at': doc.get('signed_at'),
+        'checked_at': _now(),
+        **result
+    }
+
+
+def build_summary(db, job_id):
+    """Totals by result status, plus per-study counts, from the stored results."""
+    summary = {'by_status': {status: 0 for status in RESULT_STATUSES}, 'by_study': {}, 'digest_mismatches': 0}
+    pipeline = [
+        {'$match': {'job_id': job_id}},
+        {'$group': {
+            '_id': {'study_id': '$study_id', 'status': '$status'},
+            'count': {'$sum': 1},
+            'digest_mismatches': {'$sum': {'$cond': [{'$eq': ['$digest_matches', False]}, 1, 0]}}
+        }}
+    ]
+    for row in db.signature_audit_results.aggregate(pipeline):
+        study_id = row['_id'].get('study_id') or 'Unspecified'
+        status = row['_id']['status']
+        summary['by_status'][status] = summary['by_status'].get(status, 0) + row['count']
+        summary['by_study'].setdefault(study_id, {s: 0 for s in RESULT_STATUSES})[status] = row['count']
+        summary['digest_mismatches'] += row['digest_mismatches']
+    summary['total'] = sum(summary['by_status'].values())
+    return summary
+
+
+def run_job(db, job_id, workers=None, progress=None):
+    """Process a claimed or claimable job to completion. Returns the final job, or None if it is held elsewhere."""
+    job = claim_job(db, job_id)
+    if job is None:
+        return None
+
+    config = current_app.config
+    workers = config.get('SIGNATURE_AUDIT_WORKERS', DEFAULT_WORKERS) if workers is None else workers
+    executor = None
+    if workers > 0:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(os.getenv('MONGO_URI'), db.name)
+        )
+
+    query = build_audit_query(job['filters'])
+    if job.get('last_document_id'):
+        query['_id'] = {'$gt': job['last_document_id']}
+
+    key_cache = {}
+    try:
+        cursor = db.documents.find(query, AUDIT_PROJECTION).sort('_id', 1).batch_size(BATCH_SIZE)
+        for batch in _batches(cursor, BATCH_SIZE):
+            tasks, results = _prepare_tasks(db, batch, key_cache)
+            if executor:
+                checked = executor.map(_check_signature_in_worker, tasks)
+            else:
+                checked = (check_signature(db, task) for task in tasks)
+            for task, result in zip(tasks, checked):
+                results[task['document_id']] = result
+
+            db.signature_audit_results.bulk_write([
+                UpdateOne(
+                    {'job_id': job_id, 'document_id': doc['_id']},
+                    {'$set': _result_record(job_id, doc, results[doc['_id']])},
+                    upsert=True
+                )
+                for doc in batch
+            ], ordered=False)
+
+            increments = {'processed': len(batch)}
+            for doc in batch:
+                key = f"counts.{results[doc['_id']]['status']}"
+                increments[key] = increments.get(key, 0) + 1
+            job = db.signature_audits.find_one_and_update(
+                {'_id': job_id},
+                {'$set': {'last_document_id': batch[-1]['_id'], 'heartbeat_at': _now()}, '$inc': increments},
+                return_document=ReturnDocument.AFTER
+            )
+            if progress:
+                progress(job)
+
+        return db.signature_audits.find_one_and_update(
+            {'_id': job_id},
+            {'$set': {'status': 'completed', 'finished_at': _now(), 'summary': build_summary(db, job_id)}},
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception as e:
+        print(f"❌ Signature audit {job_id} failed: {str(e)}")
+        db.signature_audits.update_one({'_id': job_id}, {'$set': {'status': 'failed', 'error': str(e)}})
+        raise
+    finally:
+        if executor:
+            executor.shutdown()
+
+
+def start_job_in_background(app, db, job_id):
+    """Run a job on a daemon thread so the request can return 202 immediately."""
+    def target():
+        with app.app_context():
+            try:
+                run_job(db, job_id)
+            except Exception:
+                pass  # recorded on the job as 'failed'; resumable from its checkpoint
+
+    thread = threading.Thread(target=target, name=f"signature-audit-{job_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+# --- CLI ---
+
+signature_audit_cli = AppGroup('signature-audit', help="Bulk signature verification jobs.")
+
+
+def _echo_progress(job):
+    click.echo(f"  {job['processed']}/{job['total']} checked "
+               f"(valid {job['counts']['valid']}, invalid {job['counts']['invalid']}, error {job['counts']['error']})")
+
+
+def _echo_summary(job):
+    if job is None:
+        click.echo("Job is already running elsewhere.")
+        return
+    summary = job['summary']
+    click.echo(f"Job {job['_id']} {job['status']}: {summary['total']} checked, "
+               f"{summary['by_status']['invalid']} invalid, {summary['by_status']['error']} errors")
+    for study_id, counts in sorted(summary['by_study'].items()):
+        click.echo(f"  {study_id}: " + ', '.join(f"{status} {counts[status]}" for status in RESULT_STATUSES))
+
+
+@signature_audit_cli.command('run')
+@click.option('--study-id')
+@click.option('--zone', 'tmf_zone')
+@click.option('--signed-from', help="ISO 8601 date")
+@click.option('--signed-to', help="ISO 8601 date")
+@click.option('--workers', type=int, default=None, help="Pool size; 0 verifies in this process.")
+def run_command(study_id, tmf_zone, signed_from, signed_to, workers):
+    """Create a verification job and run it in the foreground."""
+    from . import db
+    try:
+        filters = parse_audit_filters({'study_id': study_id, 'tmf_zone': tmf_zone,
+                                       'signed_from': signed_from, 'signed_to': signed_to})
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    job = create_job(db, filters, {'_id': None, 'username': 'cli'})
+    click.echo(f"Job {job['_id']}: {job['total']} signed document(s) to verify")
+    _echo_summary(run_job(db, job['_id'], workers=workers, progress=_echo_progress))
+
+
+@signature_audit_cli.command('resume')
+@click.argument('job_id')
+@click.option('--workers', type=int, default=None, help="Pool size; 0 verifies in this process.")
+def resume_command(job_id, workers):
+    """Continue a stopped job from its last checkpoint."""
+    from . import db
+    _echo_summary(run_job(db, ObjectId(job_id), workers=workers, progress=_echo_progress))
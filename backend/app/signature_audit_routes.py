@@ -0,0 +1,166 @@
+# backend/app/signature_audit_routes.py
+
+import datetime
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from . import db
+from .crypto_utils import key_cache_stats
+from .current_user import get_current_user
+from .decorators import admin_required
+from .signature_audit import create_job, parse_audit_filters, start_job_in_background, STALE_AFTER_SECONDS
+
+signature_audit_blueprint = Blueprint('signature_audit', __name__)
+
+RESULTS_PAGE_LIMIT = 100
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def format_job(job):
+    processed, total = job.get('processed', 0), job.get('total', 0)
+    filters = {key: _iso(value) for key, value in job.get('filters', {}).items()}
+    return {
+        'id': str(job['_id']),
+        'status': job['status'],
+        'filters': filters,
+        'total': total,
+        'processed': processed,
+        'progress': round(processed / total * 100, 1) if total else 100.0,
+        'counts': job.get('counts', {}),
+        'summary': job.get('summary'),
+        'error': job.get('error'),
+        'created_by': job.get('created_by_username'),
+        'created_at': _iso(job.get('created_at')),
+        'heartbeat_at': _iso(job.get('heartbeat_at')),
+        'finished_at': _iso(job.get('finished_at'))
+    }
+
+
+def format_result(result):
+    return {
+        'document_id': str(result['document_id']),
+        'doc_number': result.get('doc_number'),
+        'study_id': result.get('study_id'),
+        'tmf_zone': result.get('tmf_zone'),
+        'signed_by': result.get('signed_by_username'),
+        'signed_at': _iso(result.get('signed_at')),
+        'status': result['status'],
+        'sha256': result.get('sha256'),
+        'digest_matches': result.get('digest_matches'),
+        'error': result.get('error'),
+        'checked_at': _iso(result.get('checked_at'))
+    }
+
+
+@signature_audit_blueprint.route("", methods=['POST'])
+@jwt_required()
+@admin_required()
+def start_signature_audit():
+    """Start a bulk verification job; poll GET /<job_id> for progress."""
+    try:
+        user = get_current_user()
+        try:
+            filters = parse_audit_filters(request.get_json(silent=True) or {})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        job = create_job(db, filters, user)
+        start_job_in_background(current_app._get_current_object(), db, job['_id'])
+        return jsonify(format_job(job)), 202
+    except Exception as e:
+        print(f"Error in start_signature_audit: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@signature_audit_blueprint.route("", methods=['GET'])
+@jwt_required()
+@admin_required()
+def list_signature_audits():
+    try:
+        jobs = db.signature_audits.find({}).sort('created_at', -1).limit(50)
+        return jsonify([format_job(job) for job in jobs]), 200
+    except Exception as e:
+        print(f"Error in list_signature_audits: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@signature_audit_blueprint.route("/key-cache", methods=['GET'])
+@jwt_required()
+@admin_required()
+def get_key_cache_stats():
+    """Hit/miss counters of this worker process's parsed RSA key caches."""
+    return jsonify(key_cache_stats()), 200
+
+
+@signature_audit_blueprint.route("/<job_id>", methods=['GET'])
+@jwt_required()
+@admin_required()
+def get_signature_audit(job_id):
+    try:
+        job = db.signature_audits.find_one({'_id': ObjectId(job_id)})
+        if not job:
+            return jsonify({"error": "Audit job not found"}), 404
+        return jsonify(format_job(job)), 200
+    except InvalidId:
+        return jsonify({"error": "Invalid job ID format"}), 400
+    except Exception as e:
+        print(f"Error in get_signature_audit: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@signature_audit_blueprint.route("/<job_id>/results", methods=['GET'])
+@jwt_required()
+@admin_required()
+def get_signature_audit_results(job_id):
+    """Per-document results in document order, optionally filtered by ?status=valid|invalid|error."""
+    try:
+        query = {'job_id': ObjectId(job_id)}
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        page = max(request.args.get('page', 1, type=int), 1)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), RESULTS_PAGE_LIMIT)
+
+        total = db.signature_audit_results.count_documents(query)
+        results = (db.signature_audit_results.find(query)
+                   .sort('document_id', 1).skip((page - 1) * limit).limit(limit))
+        return jsonify({
+            'results': [format_result(result) for result in results],
+            'total': total,
+            'page': page,
+            'totalPages': (total + limit - 1) // limit
+        }), 200
+    except InvalidId:
+        return jsonify({"error": "Invalid job ID format"}), 400
+    except Exception as e:
+        print(f"Error in get_signature_audit_results: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@signature_audit_blueprint.route("/<job_id>/resume", methods=['POST'])
+@jwt_required()
+@admin_required()
+def resume_signature_audit(job_id):
+    """Continue a failed or stalled job from its last completed batch."""
+    try:
+        job = db.signature_audits.find_one({'_id': ObjectId(job_id)})
+        if not job:
+            return jsonify({"error": "Audit job not found"}), 404
+
+        stale_before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=STALE_AFTER_SECONDS)
+        heartbeat = job.get('heartbeat_at')
+        if heartbeat and heartbeat.tzinfo is None:
+            heartbeat = heartbeat.replace(tzinfo=datetime.timezone.utc)
+        if job['status'] == 'completed' or (job['status'] == 'running' and heartbeat and heartbeat > stale_before):
+            return jsonify({"error": f"Audit job is {job['status']}"}), 409
+
+        start_job_in_background(current_app._get_current_object(), db, job['_id'])
+        return jsonify(format_job(job)), 202
+    except InvalidId:
+        return jsonify({"error": "Invalid job ID format"}), 400
+    except Exception as e:
+        print(f"Error in resume_signature_audit: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,86 @@
+# backend/app/transactions.py
+
+"""
+Multi-document writes that must land together.
+
+Approving an amendment supersedes the original and approves the amendment.
+Creating one inserts the new draft and records the amendment on the original.
+Either half on its own leaves the lineage inconsistent. Every document change
+and its audit event are paired the same way (see audit_log). `run_in_transaction`
+runs such a write as one MongoDB transaction: other requests see all of it or
+none of it.
+
+Retry policy:
+  - Single writes outside a transaction are retried once by the driver
+    (retryWrites, on by default and set explicitly in create_app).
+  - A transaction runs with snapshot reads and a majority write concern.
+    pymongo's `with_transaction` re-runs the whole callback after a
+    TransientTransactionError, e.g. a write conflict with a concurrent
+    approval of the same lineage. It retries the commit after an
+    UnknownTransactionCommitResult. Both stop after 120 seconds.
+  - Inside a transaction, losing the race for an audit chain position is a
+    DuplicateKeyError, which the driver does not retry. The whole transaction
+    is re-run up to TRANSACTION_ATTEMPTS times.
+  - Anything else, including TransitionRejected, aborts the transaction and
+    is raised to the route.
+
+Callbacks may therefore run more than once. Slow or external work (storing an
+upload, signing) happens before the transaction, and callbacks only read and
+write the database through the session they are given.
+
+Whether the deployment has transactions is decided once per client, from
+its `hello` reply, and cached. A replica set in the middle of an election
+still has transactions: the driver waits for the new primary instead of the
+writes silently falling back to running one at a time.
+
+Standalone servers have no transactions. The callback then runs once with
+session None, and its writes land one at a time. Callbacks order their
+writes so that a failure part-way leaves the lineage safe, e.g. the original
+is superseded before the amendment is approved.
+"""
+
+from pymongo.errors import DuplicateKeyError
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import ReadPreference
+from pymongo.write_concern import WriteConcern
+
+TRANSACTION_ATTEMPTS = 3
+
+# Per client: True for replica sets and sharded clusters, from their `hello`
+_transaction_support = {}
+
+
+def is_chain_position_conflict(error):
+    """True if a DuplicateKeyError came from two audit events claiming the same (document_id, seq)."""
+    return 'seq' in ((error.details or {}).get('keyPattern') or {})
+
+
+def supports_transactions(client):
+    """True if the connected deployment is a replica set or sharded cluster.
+
+    Asks the server once; create_app does so at startup. Raises if the
+    deployment cannot be reached, rather than guessing.
+    """
+    if client not in _transaction_support:
+        hello = client.admin.command('hello')
+        _transaction_support[client] = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+    return _transaction_support[client]
+
+
+def run_in_transaction(db, callback):
+    """Run `callback(session)` in one transaction and return its result."""
+    if not supports_transactions(db.client):
+        return callback(None)
+
+    with db.client.start_session() as session:
+        for attempt in range(1, TRANSACTION_ATTEMPTS + 1):
+            try:
+                return session.with_transaction(
+                    callback,
+                    read_concern=ReadConcern('snapshot'),
+                    write_concern=WriteConcern('majority'),
+                    read_preference=ReadPreference.PRIMARY
+                )
+            except DuplicateKeyError as e:
+                if attempt == TRANSACTION_ATTEMPTS or not is_chain_position_conflict(e):
+                    raise
@@ -1,11 +1,19 @@
 # backend/app/user.py
 
+import datetime
 from flask import Blueprint, jsonify, request
 from . import db
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
 from .decorators import admin_required
+from .current_user import get_current_user, invalidate_user
+from .keypair_pool import keypair_pool
+from .password_hashing import password_hasher
+from .file_storage import spooled_upload
+from .user_import import read_import_rows, validate_import_rows
+from .serializers import USER_SCHEMA, USER_SUMMARY_SCHEMA
 
 user_blueprint = Blueprint('user', __name__)
 
@@ -15,14 +23,9 @@ ALLOWED_ROLES = ["Contributor", "QC", "Reviewer", "Approver", "Admin"]
 @user_blueprint.route("/profile", methods=['GET'])
 @jwt_required()
 def get_profile():
-    user_id = get_jwt_identity()
-    user = db.users.find_one({'_id': ObjectId(user_id)})
+    user = get_current_user()
     if user:
-        return jsonify({
-            "id": str(user['_id']), "username": user['username'],
-            "email": user['email'], "role": user['role'],
-            "created_at": user['created_at'].isoformat()
-        }), 200
+        return jsonify(USER_SCHEMA.dump(user)), 200
     else:
         return jsonify({"error": "User not found"}), 404
 
@@ -40,10 +43,7 @@ def get_users_by_role(role_name):
             {'role': role_name},
             {'_id': 1, 'username': 1}  # Projection to get only ID and username
         ))
-        for user in users:
-            user['id'] = str(user['_id'])
-            del user['_id']
-        return jsonify(users), 200
+        return jsonify(USER_SUMMARY_SCHEMA.dump_many(users)), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -56,11 +56,7 @@ def get_all_users_admin():
     try:
         projection = {'password': 0, 'private_key': 0, 'public_key': 0}
         all_users = list(users_collection.find({}, projection))
-        for user in all_users:
-            user['id'] = str(user['_id'])
-            del user['_id']
-            user['created_at'] = user['created_at'].isoformat()
-        return jsonify(all_users), 200
+        return jsonify(USER_SCHEMA.dump_many(all_users)), 200
     except Exception as e:
         return jsonify({"error": "An internal server error occurred"}), 500
 
@@ -85,8 +81,81 @@ def update_user_role(user_id):
             {'_id': user_id_obj},
             {'$set': {'role': new_role}}
         )
+        invalidate_user(user_id_obj)
         return jsonify({"message": f"User's role successfully updated to {new_role}"}), 200
     except InvalidId:
         return jsonify({"error": "Invalid user ID format"}), 400
     except Exception as e:
-        return jsonify({"error": "An internal server error occurred"}), 500
\ No newline at end of file
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+@user_blueprint.route("/import", methods=['POST'])
+@jwt_required()
+@admin_required()
+@spooled_upload
+def import_users():
+    """Bulk-create accounts from JSON or CSV and return one result line per input row.
+
+    Existing emails are found with a single $in query, passwords are hashed on
+    the bcrypt process pool, keypairs come from the pool, and the accounts are
+    written with one unordered insert_many.
+    """
+    users_collection = db.users
+    try:
+        rows = read_import_rows(request)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        candidates, results = validate_import_rows(rows, ALLOWED_ROLES)
+
+        existing = {
+            user['email'] for user in users_collection.find(
+                {'email': {'$in': [candidate['email'] for candidate in candidates]}}, {'email': 1}
+            )
+        }
+        new_users = []
+        for candidate in candidates:
+            if candidate['email'] in existing:
+                results.append({'row': candidate['row'], 'email': candidate['email'], 'status': 'skipped',
+                                'error': "User with this email already exists"})
+            else:
+                new_users.append(candidate)
+
+        hashes = password_hasher.hash_many([candidate['password'] for candidate in new_users])
+        keypairs = keypair_pool.acquire_many(len(new_users))
+        now = datetime.datetime.now(datetime.timezone.utc)
+        documents = [{
+            'email': candidate['email'],
+            'username': candidate['username'],
+            'password': password_hash,
+            'role': candidate['role'],
+            'created_at': now,
+            'private_key': private_key,
+            'public_key': public_key
+        } for candidate, password_hash, (private_key, public_key) in zip(new_users, hashes, keypairs)]
+
+        # Unordered: an email registered concurrently fails alone instead of stopping the batch
+        failed = {}
+        if documents:
+            try:
+                users_collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get('writeErrors', []):
+                    duplicate = error.get('code') == 11000
+                    failed[error['index']] = "User with this email already exists" if duplicate else error.get('errmsg')
+                    # Never stored on an account, so the keypair can go to the next user
+                    keypair_pool.give_back(keypairs[error['index']])
+
+        for index, (candidate, document) in enumerate(zip(new_users, documents)):
+            if index in failed:
+                results.append({'row': candidate['row'], 'email': candidate['email'], 'status': 'skipped', 'error': failed[index]})
+            else:
+                results.append({'row': candidate['row'], 'email': candidate['email'], 'status': 'created',
+                                'user_id': str(document['_id'])})
+
+        results.sort(key=lambda entry: entry['row'])
+        summary = {status: sum(1 for entry in results if entry['status'] == status) for status in ('created', 'skipped', 'error')}
+        return jsonify({"total": len(results), **summary, "results": results}), 200
+    except Exception as e:
+        print(f"Error in import_users: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
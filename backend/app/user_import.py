@@ -0,0 +1,85 @@
+# backend/app/user_import.py
+
+"""
+Parsing and validation for the admin bulk user import.
+
+Rows arrive as a JSON list (`{"users": [...]}` or a bare list), a `text/csv`
+body, or an uploaded .csv/.json file. CSV needs a header row with `email`,
+`username` and `password` columns; `role` is optional. Every row is reported
+back by its 1-based position in the input.
+"""
+
+import csv
+import io
+import json
+
+MAX_IMPORT_ROWS = 1000
+DEFAULT_ROLE = 'Contributor'
+
+
+def _rows_from_csv(text):
+    reader = csv.DictReader(io.StringIO(text.lstrip('\ufeff')))
+    missing = {'email', 'username', 'password'} - {name.strip().lower() for name in (reader.fieldnames or [])}
+    if missing:
+        raise ValueError(f"CSV header is missing: {', '.join(sorted(missing))}")
+    return [{(key or '').strip().lower(): value for key, value in row.items()} for row in reader]
+
+
+def _rows_from_json(payload):
+    rows = payload.get('users') if isinstance(payload, dict) else payload
+    if not isinstance(rows, list):
+        raise ValueError("Provide a 'users' list")
+    return rows
+
+
+def read_import_rows(request):
+    """Raw rows from the request. Raises ValueError for an unreadable or oversized payload."""
+    upload = request.files.get('file')
+    if upload is not None:
+        content = upload.read().decode('utf-8-sig')
+        if (upload.filename or '').lower().endswith('.json') or upload.mimetype == 'application/json':
+            rows = _rows_from_json(json.loads(content))
+        else:
+            rows = _rows_from_csv(content)
+    elif request.mimetype in ('text/csv', 'application/csv'):
+        rows = _rows_from_csv(request.get_data(as_text=True))
+    else:
+        payload = request.get_json(silent=True)
+        if payload is None:
+            raise ValueError("Send JSON, a text/csv body, or a .csv/.json file")
+        rows = _rows_from_json(payload)
+
+    if not rows:
+        raise ValueError("No users to import")
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise ValueError(f"At most {MAX_IMPORT_ROWS} users per import")
+    return rows
+
+
+def validate_import_rows(rows, allowed_roles):
+    """Split rows into (candidates, rejected).
+
+    Candidates are clean dicts carrying their `row` number; rejected entries are
+    finished report lines for malformed rows and repeats of an earlier row's email.
+    """
+    candidates, rejected, seen_emails = [], [], set()
+    for position, raw in enumerate(rows, start=1):
+        if not isinstance(raw, dict):
+            rejected.append({'row': position, 'email': None, 'status': 'error', 'error': "Row is not an object"})
+            continue
+
+        email = str(raw.get('email') or '').strip()
+        username = str(raw.get('username') or '').strip()
+        password = str(raw.get('password') or '')
+        role = str(raw.get('role') or '').strip() or DEFAULT_ROLE
+
+        if not email or not username or not password:
+            rejected.append({'row': position, 'email': email or None, 'status': 'error', 'error': "Missing required fields"})
+        elif role not in allowed_roles:
+            rejected.append({'row': position, 'email': email, 'status': 'error', 'error': f"Invalid role '{role}'"})
+        elif email in seen_emails:
+            rejected.append({'row': position, 'email': email, 'status': 'skipped', 'error': "Duplicate email in this import"})
+        else:
+            seen_emails.add(email)
+            candidates.append({'row': position, 'email': email, 'username': username, 'password': password, 'role': role})
+    return candidates, rejected
@@ -0,0 +1,407 @@
+# backend/app/workflow_transitions.py
+
+"""
+Document workflow as a state machine.
+
+TRANSITIONS lists every status change the routes make, with three parts:
+  - the states it may start from
+  - the state it ends in
+  - who may make it: a role check on the user, and a guard on the document
+
+Side effects are declared on the same entry: the `current_stage` entered and
+any fields reset on the way.
+
+`apply_transition` runs an entry as one conditional find_one_and_update. The
+filter repeats the checks: `{_id, status: {$in: from_states}}` plus the guard,
+such as `approver.user_id` for the approver. No request can change the
+document between the check and the write.
+
+Routes pass the revisions from If-Match (see document_revisions) as
+`expected_rev`. The filter then also requires the document's `_rev`.
+
+When nothing matches, one projected read works out why, so the response is
+the same 404/403/400 as before. A stale `expected_rev` gets 409. So does a
+document that passes every check on that read, because it was changed
+concurrently. Each 409 carries the document's current state.
+
+Review decisions change one entry of qc_reviewers/reviewers, and the new
+status depends on every entry. A positional `qc_reviewers.$` update cannot
+compute that status in the same write. `review_update` therefore builds an
+update pipeline instead:
+  - `$map` replaces the reviewer's own entry
+  - `$switch` picks the status from the resulting array
+Two reviewers deciding at once each apply their pipeline to the other's
+result, so neither decision is lost.
+"""
+
+import datetime
+from .audit_log import update_with_history
+from .document_revisions import is_stale, revision_filter
+from .projections import DOCUMENT_STATE_PROJECTION
+from .search_index import search_terms_stage
+from .serializers import DOCUMENT_STATE_SCHEMA
+
+STALE_MESSAGE = "The document has changed since you loaded it. Please reload it and try again."
+RACE_MESSAGE = "The document was changed by another request. Please reload it and try again."
+LINEAGE_CONFLICT_MESSAGE = "Another version of this document was approved meanwhile. Please reload it and try again."
+
+
+class TransitionRejected(Exception):
+    """A transition that is not allowed; routes return `body` with `status_code`.
+
+    Conflicts (409) also carry the document's `current` state.
+    """
+
+    def __init__(self, message, status_code, current=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.current = current
+
+    @property
+    def body(self):
+        body = {'error': self.message}
+        if self.current is not None:
+            body['current'] = self.current
+        return body
+
+
+def conflict(doc, message=STALE_MESSAGE):
+    """409 for a document that is not in the state the request expected."""
+    return TransitionRejected(message, 409, DOCUMENT_STATE_SCHEMA.dump(doc))
+
+
+class Guard:
+    """Who may make a transition: the user's id must be in `field` of the document.
+
+    Admins pass unless `admins=False`. `checked_first` says whether a failing
+    guard is reported before a wrong status, as each route always did.
+    """
+
+    def __init__(self, field=None, admins=True, checked_first=True):
+        self.field = field
+        self.admins = admins
+        self.checked_first = checked_first
+
+    def applies_to(self, user):
+        return self.field is not None and not (self.admins and user['role'] == 'Admin')
+
+    def condition(self, user):
+        return {self.field: user['_id']} if self.applies_to(user) else {}
+
+    def allows(self, doc, user):
+        return not self.applies_to(user) or user['_id'] in _values(doc, self.field)
+
+
+ANYONE = Guard()
+AUTHOR_OR_ADMIN = Guard('author_id')
+AUTHOR = Guard('author_id', admins=False, checked_first=False)
+QC_REVIEWER = Guard('qc_reviewers.user_id', checked_first=False)
+REVIEWER = Guard('reviewers.user_id', checked_first=False)
+APPROVER = Guard('approver.user_id', checked_first=False)
+
+
+class Transition:
+    """One entry of the state machine.
+
+    to_state   the new status; a dict maps each from-state to its own target;
+               None when the update derives it (reviews)
+    stage      `current_stage` to set
+    resets     fields to set per from-state, e.g. assignments dropped on recall
+    roles      user roles allowed at all, checked before the document is read
+    """
+
+    def __init__(self, from_states, to_state, guard=ANYONE, roles=None, stage=None, resets=None,
+                 forbidden="You do not have permission to do this",
+                 wrong_state="Documents with status '{status}' cannot do this",
+                 not_found="Document or user not found"):
+        self.from_states = tuple(from_states)
+        self.to_state = to_state
+        self.guard = guard
+        self.roles = roles
+        self.stage = stage
+        self.resets = resets or {}
+        self.forbidden = forbidden
+        self.wrong_state = wrong_state
+        self.not_found = not_found
+
+    def target(self, from_state):
+        if isinstance(self.to_state, dict):
+            return self.to_state[from_state]
+        return self.to_state
+
+    def effects(self, from_state=None):
+        """Fields the transition itself sets."""
+        fields = {}
+        target = self.target(from_state)
+        if target is not None:
+            fields['status'] = target
+        if self.stage is not None:
+            fields['current_stage'] = self.stage
+        fields.update(self.resets.get(from_state, {}))
+        return fields
+
+
+REJECTED_STATES = ('QC Rejected', 'Review Rejected', 'Approval Rejected')
+
+TRANSITIONS = {
+    'submit_qc': Transition(
+        ['Draft'], 'In QC', AUTHOR_OR_ADMIN, stage='QC',
+        forbidden="Only author or admin can submit",
+        wrong_state="Only draft documents can be submitted to QC"),
+    'submit_review_direct': Transition(
+        ['Draft'], 'In Review', AUTHOR_OR_ADMIN, stage='Technical Review',
+        forbidden="Only author or admin can submit",
+        wrong_state="Only draft documents can be submitted"),
+    'qc_review': Transition(
+        ['In QC'], None, QC_REVIEWER,
+        forbidden="You are not assigned as QC reviewer",
+        wrong_state="Document is not in QC stage"),
+    'submit_review': Transition(
+        ['QC Complete'], 'In Review', AUTHOR_OR_ADMIN, stage='Technical Review',
+        forbidden="Only author or admin can submit",
+        wrong_state="Only QC Complete documents can be submitted for review"),
+    'technical_review': Transition(
+        ['In Review'], None, REVIEWER,
+        forbidden="You are not assigned as a reviewer",
+        wrong_state="Document is not in review"),
+    'upload_corrected_file': Transition(
+        ['Under Revision'], 'In Review', AUTHOR,
+        forbidden="Only the document author can upload corrections",
+        wrong_state="Document is not under revision"),
+    'submit_approval': Transition(
+        ['Review Complete'], 'Pending Approval', AUTHOR_OR_ADMIN, stage='Approval',
+        forbidden="Only author or admin can submit",
+        wrong_state="Only reviewed documents can be submitted for approval"),
+    'approve': Transition(
+        ['Pending Approval'], 'Approved', APPROVER,
+        forbidden="You are not the assigned approver",
+        wrong_state="Document is not pending approval"),
+    'reject_approval': Transition(
+        ['Pending Approval'], 'Approval Rejected', APPROVER,
+        forbidden="You are not the assigned approver",
+        wrong_state="Document is not pending approval"),
+    'upload_revision': Transition(
+        REJECTED_STATES, 'Draft', AUTHOR_OR_ADMIN,
+        forbidden="Only author or admin can upload revisions",
+        wrong_state="Only rejected documents can have revisions uploaded"),
+    'recall': Transition(
+        ['In QC', 'In Review', 'Pending Approval'],
+        {'In QC': 'Draft', 'In Review': 'QC Complete', 'Pending Approval': 'Review Complete'},
+        AUTHOR_OR_ADMIN,
+        resets={
+            'In QC': {'qc_reviewers': [], 'reviewers': [], 'approver': {}},
+            'In Review': {'reviewers': [], 'approver': {}},
+            'Pending Approval': {'approver': {}}
+        },
+        forbidden="Only author or admin can recall documents",
+        wrong_state="Can only recall documents in QC, Review, or Approval stages"),
+    'supersede': Transition(
+        ['Approved'], 'Superseded',
+        wrong_state="Only Approved documents can be superseded"),
+    'archive': Transition(
+        ['Approved', 'Superseded'], 'Archived', roles=('Archivist', 'Admin'),
+        forbidden="You do not have permission to archive documents",
+        wrong_state="Only Approved or Superseded documents can be archived",
+        not_found="User or document not found"),
+    'withdraw': Transition(
+        ['Draft', 'In QC', 'In Review', 'Pending Approval', *REJECTED_STATES, 'Under Revision'],
+        'Withdrawn', AUTHOR_OR_ADMIN,
+        forbidden="You do not have permission to withdraw this document",
+        wrong_state="Documents with status '{status}' cannot be withdrawn",
+        not_found="User or document not found"),
+    'mark_obsolete': Transition(
+        ['Approved'], 'Obsolete', roles=('Admin', 'Quality Manager'),
+        forbidden="You do not have permission to mark documents as obsolete",
+        wrong_state="Only Approved documents can be marked as obsolete",
+        not_found="User or document not found"),
+}
+
+
+def _values(value, path):
+    """Every value at a dotted path, descending into arrays like a MongoDB query does."""
+    values = [value]
+    for key in path.split('.'):
+        found = []
+        for item in values:
+            if isinstance(item, list):
+                found.extend(element.get(key) for element in item if isinstance(element, dict))
+            elif isinstance(item, dict):
+                found.append(item.get(key))
+        values = found
+    return values
+
+
+def _projection(*paths):
+    """Inclusion projection of `paths`, dropping any already covered by a parent path."""
+    fields = {}
+    for path in sorted(paths, key=len):
+        if not any(path == field or path.startswith(field + '.') for field in fields):
+            fields[path] = 1
+    return fields
+
+
+def literal(fields):
+    """Object expression whose values are taken as-is, for user text inside update pipelines."""
+    return {key: {'$literal': value} for key, value in fields.items()}
+
+
+def _check_role(transition, user):
+    if transition.roles and user['role'] not in transition.roles:
+        raise TransitionRejected(transition.forbidden, 403)
+
+
+def check_transition(db, name, doc_id, user, projection=None, expected_rev=None, session=None, guard=True):
+    """Read the document and raise TransitionRejected unless `user` may make the transition now.
+
+    Routes that must do slow work first (storing an upload, signing) call this
+    to fail early and to read what that work needs. apply_transition still
+    re-checks everything in its filter.
+
+    Routes also call it before answering 400 for a bad request body, so that
+    document errors take precedence as they always have. Review routes reported
+    a bad decision before checking the assignment, so they pass guard=False.
+    """
+    transition = TRANSITIONS[name]
+    _check_role(transition, user)
+    paths = [*DOCUMENT_STATE_PROJECTION, *(projection or {})]
+    if transition.guard.field:
+        paths.append(transition.guard.field)
+    doc = db.documents.find_one({'_id': doc_id}, _projection(*paths), session=session)
+    if doc is None:
+        raise TransitionRejected(transition.not_found, 404)
+    if is_stale(doc, expected_rev):
+        raise conflict(doc)
+
+    allowed = transition.guard.allows(doc, user) or not guard
+    if transition.guard.checked_first and not allowed:
+        raise TransitionRejected(transition.forbidden, 403)
+    if doc.get('status') not in transition.from_states:
+        raise TransitionRejected(transition.wrong_state.format(status=doc.get('status')), 400)
+    if not allowed:
+        raise TransitionRejected(transition.forbidden, 403)
+    return doc
+
+
+def apply_transition(db, name, doc_id, user, update, history=None, projection=None, from_state=None,
+                     expected_rev=None, session=None):
+    """Make the named transition in one conditional write. Returns the updated document.
+
+    `update` is an update document or pipeline carrying the route's own fields
+    and history entry (see update_with_history). Transitions whose target
+    depends on the current state need `from_state`; the write then only
+    matches that state. With `expected_rev` it only matches those revisions.
+    With `session` the write joins that session's transaction (see transactions).
+    Raises TransitionRejected when it does not apply.
+    """
+    transition = TRANSITIONS[name]
+    _check_role(transition, user)
+    if from_state is None and isinstance(transition.to_state, dict):
+        raise ValueError(f"Transition '{name}' needs the state it starts from")
+    states = [from_state] if from_state is not None else list(transition.from_states)
+
+    document_filter = {
+        '_id': doc_id,
+        'status': states[0] if len(states) == 1 else {'$in': states},
+        **transition.guard.condition(user)
+    }
+    if expected_rev is not None:
+        document_filter.update(revision_filter(expected_rev))
+    effects = transition.effects(from_state)
+    if isinstance(update, list):
+        update = update + [{'$set': literal(effects)}] if effects else update
+    else:
+        update.setdefault('$set', {}).update(effects)
+
+    document = update_with_history(db, document_filter, update, projection, history, session)
+    if document is None:
+        # Raises with the same error the route gave before; passing means it lost a race
+        current = check_transition(db, name, doc_id, user, expected_rev=expected_rev, session=session)
+        raise conflict(current, RACE_MESSAGE)
+    return document
+
+
+class ReviewStage:
+    """How the decisions in one reviewer array add up to a status."""
+
+    def __init__(self, field, approve, reject, in_progress, complete, rejected, actions):
+        self.field = field
+        self.approve = approve
+        self.reject = reject
+        self.in_progress = in_progress
+        self.complete = complete
+        self.rejected = rejected
+        self.actions = actions
+
+
+REVIEW_STAGES = {
+    'qc_review': ReviewStage(
+        'qc_reviewers', 'Pass', 'Fail', 'In QC', 'QC Complete', 'QC Rejected', {
+            'admin_approve': "QC Passed by Admin {username}",
+            'admin_reject': "QC Rejected by Admin {username}",
+            'rejected': "QC Rejected by {username}",
+            'complete': "QC Review Completed - All Passed",
+            'in_progress': "QC {decision} by {username}"
+        }),
+    'technical_review': ReviewStage(
+        'reviewers', 'Approved', 'RequestChanges', 'In Review', 'Review Complete', 'Under Revision', {
+            'admin_approve': "Technical Review - Admin {username} Approved (Final)",
+            'admin_reject': "Technical Review - Admin {username} Requested Changes (Final)",
+            'rejected': "Technical Review - Changes Requested by {username}",
+            'complete': "Technical Review Completed - All Reviewers Approved",
+            'in_progress': "Technical Review - Approved by {username}"
+        }),
+}
+
+
+def review_update(name, user, decision, comment):
+    """(pipeline, history) recording `user`'s decision for apply_transition.
+
+    An Admin's decision is final, and an Admin who was not assigned is added
+    to the array. Otherwise any rejection rejects the document, and it
+    completes once every reviewer has approved.
+    """
+    stage = REVIEW_STAGES[name]
+    now = datetime.datetime.now(datetime.timezone.utc)
+    path = f"${stage.field}"
+    reviewers = {'$ifNull': [path, []]}
+    entry = literal({'user_id': user['_id'], 'status': decision, 'reviewed_at': now, 'comment': comment})
+    actions = {key: {'$literal': text.format(username=user['username'], decision=decision)}
+               for key, text in stage.actions.items()}
+
+    replaced = {'$map': {'input': reviewers, 'as': 'reviewer', 'in': {
+        '$cond': [{'$eq': ['$$reviewer.user_id', {'$literal': user['_id']}]}, entry, '$$reviewer']
+    }}}
+
+    if user['role'] == 'Admin':
+        approved = decision == stage.approve
+        record = {'$cond': [
+            {'$in': [{'$literal': user['_id']}, {'$ifNull': [f"{path}.user_id", []]}]},
+            replaced,
+            {'$concatArrays': [reviewers, [entry]]}
+        ]}
+        status = {'$literal': stage.complete if approved else stage.rejected}
+        action = actions['admin_approve' if approved else 'admin_reject']
+    else:
+        record = replaced
+        status = {'$switch': {'branches': [
+            {'case': {'$in': [stage.reject, {'$ifNull': [f"{path}.status", []]}]}, 'then': stage.rejected},
+            {'case': {'$eq': [{'$size': {'$filter': {
+                'input': reviewers, 'as': 'reviewer', 'cond': {'$ne': ['$$reviewer.status', stage.approve]}
+            }}}, 0]}, 'then': stage.complete}
+        ], 'default': stage.in_progress}}
+        action = {'$switch': {'branches': [
+            {'case': {'$eq': ['$status', stage.rejected]}, 'then': actions['rejected']},
+            {'case': {'$eq': ['$status', stage.complete]}, 'then': actions['complete']}
+        ], 'default': actions['in_progress']}}
+
+    pipeline = [
+        {'$set': {stage.field: record}},
+        {'$set': {'status': status}},
+        search_terms_stage(comment)
+    ]
+    history = {
+        'action': action,
+        **literal({'user_id': user['_id'], 'user_username': user['username'], 'timestamp': now, 'details': comment})
+    }
+    return pipeline, history
@@ -0,0 +1,22 @@
+# backend/tests/conftest.py
+
+import mongomock
+import pytest
+
+
+class StandaloneClient(mongomock.MongoClient):
+    """mongomock runs no server commands; answer `hello` as the standalone server it behaves like."""
+
+    def __init__(self):
+        super().__init__()
+        self.admin.command = self.hello
+
+    @staticmethod
+    def hello(command, *args, **kwargs):
+        assert command == 'hello'
+        return {'isWritablePrimary': True, 'ok': 1.0}
+
+
+@pytest.fixture
+def db():
+    return StandaloneClient()['regdoc_test']
@@ -0,0 +1,83 @@
+# backend/tests/test_audit_log.py
+
+import datetime
+import pytest
+from bson import ObjectId
+from app.audit_log import GENESIS_HASH, append_event, verify_chains, verify_document_chain
+
+
+@pytest.fixture
+def document():
+    return {'_id': ObjectId(), 'lineage_id': 'L-1', 'doc_number': 'REG-1'}
+
+
+def entry(action):
+    return {'action': action, 'user_id': ObjectId(), 'user_username': 'alice', 'details': action,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc)}
+
+
+@pytest.fixture
+def chain(db, document):
+    events = [append_event(db, document, entry(action)) for action in ('Created', 'Submitted', 'Approved')]
+    return [event['_id'] for event in events]
+
+
+def test_events_link_in_order(db, document, chain):
+    events = list(db.audit_events.find({'document_id': document['_id']}).sort('seq', 1))
+    assert [event['seq'] for event in events] == [1, 2, 3]
+    assert events[0]['prev_hash'] == GENESIS_HASH
+    assert events[1]['prev_hash'] == events[0]['hash']
+    assert verify_document_chain(db, document['_id']) == {
+        'verified': True, 'events_checked': 3, 'last_seq': 3, 'error': None
+    }
+
+
+def test_edited_event_fails_its_hash(db, document, chain):
+    db.audit_events.update_one({'_id': chain[1]}, {'$set': {'details': 'rewritten'}})
+    result = verify_document_chain(db, document['_id'])
+    assert not result['verified']
+    assert result['error'] == "event 2 does not match its hash"
+    assert result['last_seq'] == 1
+
+
+def test_deleted_event_is_missing(db, document, chain):
+    db.audit_events.delete_one({'_id': chain[1]})
+    assert verify_document_chain(db, document['_id'])['error'] == "event 2 is missing"
+
+
+def test_replaced_event_breaks_the_link(db, document, chain):
+    db.audit_events.delete_many({'_id': {'$in': chain[1:]}})
+    append_event(db, document, entry('Forged'))
+    db.audit_events.update_one({'seq': 2}, {'$set': {'prev_hash': GENESIS_HASH}})
+    assert verify_document_chain(db, document['_id'])['error'] == "event 2 does not link to event 1"
+
+
+def test_idempotent_append(db, document):
+    event_id = ObjectId()
+    assert append_event(db, document, entry('Created'), event_id=event_id) is not None
+    assert append_event(db, document, entry('Created'), event_id=event_id) is None
+    assert db.audit_events.count_documents({'document_id': document['_id']}) == 1
+
+
+def test_checkpoints_resume_and_report_later_edits(db, document, chain):
+    first = verify_chains(db)
+    assert first['full'] and first['events_checked'] == 3 and first['failure_count'] == 0
+
+    archived = append_event(db, document, entry('Archived'))
+    second = verify_chains(db)
+    assert not second['full'] and second['events_checked'] == 1
+
+    db.audit_events.delete_one({'_id': archived['_id']})
+    append_event(db, document, entry('Forged'))
+    third = verify_chains(db)
+    assert third['failure_count'] == 1
+    assert third['failures'][0]['error'] == "event 4 changed or removed after it was verified"
+    assert db.audit_chain_heads.find_one({'_id': document['_id']})['broken']
+
+
+def test_full_run_finds_edits_behind_the_checkpoint(db, document, chain):
+    verify_chains(db)
+    db.audit_events.update_one({'_id': chain[0]}, {'$set': {'details': 'rewritten'}})
+    assert verify_chains(db)['failure_count'] == 0
+    full = verify_chains(db, full=True)
+    assert full['failures'] == [{'document_id': document['_id'], 'error': "event 1 does not match its hash"}]
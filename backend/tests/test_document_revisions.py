@@ -0,0 +1,68 @@
+# backend/tests/test_document_revisions.py
+
+import datetime
+import pytest
+from bson import ObjectId
+from flask import Flask
+from app.audit_log import update_with_history
+from app.document_revisions import if_match_revisions, is_stale, revision_etag
+from app.workflow_transitions import TransitionRejected, apply_transition
+
+
+@pytest.fixture
+def author():
+    return {'_id': ObjectId(), 'role': 'Contributor', 'username': 'alice'}
+
+
+@pytest.fixture
+def doc_id(db, author):
+    return db.documents.insert_one({
+        'status': 'Draft', 'author_id': author['_id'], 'lineage_id': 'L-1', 'doc_number': 'REG-1',
+        'major_version': 0, 'minor_version': 1, '_rev': 3, 'history': []
+    }).inserted_id
+
+
+def submitted(user):
+    return {'$push': {'history': {'action': 'Submitted', 'user_id': user['_id'], 'user_username': user['username'],
+                                  'details': '', 'timestamp': datetime.datetime.now(datetime.timezone.utc)}}}
+
+
+def revisions_from(header):
+    with Flask(__name__).test_request_context(headers={'If-Match': header} if header else {}):
+        return if_match_revisions()
+
+
+def test_if_match_parsing():
+    assert revisions_from(None) is None
+    assert revisions_from('"rev-7"') == [7]
+    assert sorted(revisions_from('"rev-7", "rev-8"')) == [7, 8]
+    assert revisions_from('"something-else"') == []
+    assert revision_etag(7) == 'rev-7'
+
+
+def test_documents_without_rev_are_at_zero():
+    assert not is_stale({}, [0])
+    assert is_stale({'_rev': 1}, [0])
+    assert not is_stale({'_rev': 1}, None)
+
+
+def test_every_update_bumps_rev(db, doc_id):
+    doc = update_with_history(db, {'_id': doc_id}, {'$set': {'status': 'Draft'}})
+    assert doc['_rev'] == 4
+    doc = update_with_history(db, {'_id': doc_id}, [{'$set': {'status': 'Draft'}}])
+    assert doc['_rev'] == 5
+
+
+def test_stale_if_match_is_409_with_current_state(db, author, doc_id):
+    with pytest.raises(TransitionRejected) as info:
+        apply_transition(db, 'submit_qc', doc_id, author, submitted(author), expected_rev=[2])
+    assert info.value.status_code == 409
+    assert info.value.body['current']['rev'] == 3
+    assert db.documents.find_one({'_id': doc_id})['status'] == 'Draft'
+    assert db.audit_events.count_documents({}) == 0
+
+
+def test_matching_if_match_applies(db, author, doc_id):
+    doc = apply_transition(db, 'submit_qc', doc_id, author, submitted(author), expected_rev=[3])
+    assert doc['_rev'] == 4
+    assert db.documents.find_one({'_id': doc_id})['status'] == 'In QC'
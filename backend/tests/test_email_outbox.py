@@ -0,0 +1,68 @@
+# backend/tests/test_email_outbox.py
+
+import pytest
+from flask import Flask
+from flask_mail import Message
+import app as app_package
+from app.email_outbox import EmailOutbox
+
+
+class Transport:
+    """Fails the listed recipients, then optionally fails on QUIT."""
+
+    def __init__(self, failing=(), fail_on_close=False):
+        self.failing = set(failing)
+        self.fail_on_close = fail_on_close
+        self.sent = []
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.fail_on_close:
+            raise ConnectionError("QUIT failed")
+
+    def send(self, msg):
+        if msg.recipients[0] in self.failing:
+            raise ConnectionError(f"rejected {msg.recipients[0]}")
+        self.sent.append(msg.recipients[0])
+
+
+@pytest.fixture
+def outbox(db, monkeypatch):
+    monkeypatch.setattr(app_package, 'db', db)
+    app = Flask(__name__)
+    outbox = EmailOutbox()
+    outbox.init_app(app)
+    monkeypatch.setattr(outbox, 'ensure_workers', lambda: None)
+    with app.app_context():
+        yield outbox
+
+
+def enqueue(outbox, *recipients):
+    outbox.enqueue([Message('Subject', sender='regdoc@example.com', recipients=[r], body='hi') for r in recipients])
+
+
+def statuses(outbox):
+    return {record['recipients'][0]: record['status'] for record in outbox.collection.find()}
+
+
+def test_failed_close_keeps_sent_messages_sent(outbox):
+    outbox.app.config['EMAIL_TRANSPORT'] = transport = Transport(failing={'a@x.com'}, fail_on_close=True)
+    enqueue(outbox, 'a@x.com', 'b@x.com')
+    assert outbox.process_batch() == 1
+    assert transport.sent == ['b@x.com']
+    assert statuses(outbox) == {'a@x.com': 'pending', 'b@x.com': 'sent'}
+    assert outbox.collection.find_one({'recipients': 'a@x.com'})['last_error'] == "rejected a@x.com"
+
+
+def test_failed_connection_retries_the_whole_batch(outbox):
+    def refuse():
+        raise ConnectionError("refused")
+    outbox.app.config['EMAIL_TRANSPORT'] = refuse
+    enqueue(outbox, 'a@x.com', 'b@x.com')
+    assert outbox.process_batch() == 0
+    assert statuses(outbox) == {'a@x.com': 'pending', 'b@x.com': 'pending'}
@@ -0,0 +1,48 @@
+# backend/tests/test_password_hashing.py
+
+import threading
+import time
+import pytest
+from flask import Flask
+from flask_bcrypt import Bcrypt
+from app.password_hashing import PasswordHasher
+
+ROUNDS = 10
+
+
+@pytest.fixture
+def hasher():
+    app = Flask(__name__)
+    app.config.update(BCRYPT_LOG_ROUNDS=ROUNDS, PASSWORD_HASH_WORKERS=1, PASSWORD_CHECK_WORKERS=1)
+    hasher = PasswordHasher()
+    hasher.init_app(app)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_hashes_match_bcrypt(hasher):
+    app = Flask(__name__)
+    app.config['BCRYPT_LOG_ROUNDS'] = ROUNDS
+    bcrypt = Bcrypt(app)
+    [pw_hash] = hasher.hash_many(['secret'])
+    assert bcrypt.check_password_hash(pw_hash, 'secret')
+    assert hasher.check(bcrypt.generate_password_hash('secret').decode('utf-8'), 'secret')
+    assert not hasher.check(pw_hash, 'wrong')
+
+
+def test_login_check_runs_during_import(hasher):
+    pw_hash = hasher.hash_many(['secret'])[0]
+    hasher.check(pw_hash, 'secret')  # start the check pool before timing it
+
+    imported = []
+    importer = threading.Thread(target=lambda: imported.extend(hasher.hash_many(['x'] * 60)))
+    importer.start()
+    try:
+        time.sleep(0.5)
+        started = time.monotonic()
+        assert hasher.check(pw_hash, 'secret', timeout=3)
+        assert importer.is_alive(), "import finished too quickly to overlap the check"
+        assert time.monotonic() - started < 3
+    finally:
+        importer.join()
+    assert len(imported) == 60
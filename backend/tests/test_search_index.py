@@ -0,0 +1,49 @@
+# backend/tests/test_search_index.py
+
+import pytest
+from app.search_index import MAX_PREFIX_LENGTH, build_search_fields, search_filter, tokenize
+
+
+@pytest.fixture
+def documents(db):
+    texts = {
+        'protocol': ('REG-TMF-00012', 'Protocol_v2.pdf'),
+        'consent': ('REG-TMF-00034', 'Informed consent form.docx'),
+        'long': ('REG-TMF-00056', 'pharmacovigilanceagreement.pdf'),
+    }
+    for name, fields in texts.items():
+        db.documents.insert_one({'name': name, 'is_latest': True, **build_search_fields(*fields)})
+    return db
+
+
+def search(db, query):
+    match, _ = search_filter(query)
+    return sorted(doc['name'] for doc in db.documents.find(match or {}))
+
+
+def test_tokenize_lowercases_and_splits():
+    assert tokenize('Protocol_v2.pdf', None, 'REG-1') == {'protocol', 'v2', 'pdf', 'reg', '1'}
+
+
+def test_prefixes_match_every_query_token(documents):
+    assert search(documents, 'prot') == ['protocol']
+    assert search(documents, 'PROT 0001') == ['protocol']
+    assert search(documents, 'reg tmf') == ['consent', 'long', 'protocol']
+    assert search(documents, 'prot consent') == []
+
+
+def test_prefix_is_not_a_substring_match(documents):
+    assert search(documents, 'tocol') == []
+
+
+def test_long_tokens_match_past_the_prefix_cap(documents):
+    query = 'pharmacovigilanceagreements'
+    assert len(query) > MAX_PREFIX_LENGTH
+    assert search(documents, query) == ['long']
+
+
+def test_short_tokens_are_ignored():
+    assert search_filter('p') == (None, [])
+    match, terms = search_filter('p prot')
+    assert terms == ['prot']
+    assert match == {'search_prefixes': {'$all': ['prot']}}
@@ -0,0 +1,42 @@
+# backend/tests/test_transactions.py
+
+import pytest
+from app.transactions import supports_transactions
+
+
+class Admin:
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+
+    def command(self, command):
+        assert command == 'hello'
+        self.calls += 1
+        return self.reply
+
+
+class Client:
+    def __init__(self, reply):
+        self.admin = Admin(reply)
+
+
+@pytest.mark.parametrize('reply, expected', [
+    ({'isWritablePrimary': True}, False),
+    ({'isWritablePrimary': True, 'setName': 'rs0'}, True),
+    ({'isWritablePrimary': False, 'setName': 'rs0'}, True),
+    ({'isWritablePrimary': True, 'msg': 'isdbgrid'}, True),
+])
+def test_decided_from_hello(reply, expected):
+    assert supports_transactions(Client(reply)) is expected
+
+
+def test_decided_once_per_client():
+    client = Client({'setName': 'rs0'})
+    supports_transactions(client)
+    client.admin.reply = {}
+    assert supports_transactions(client)
+    assert client.admin.calls == 1
+
+
+def test_standalone_fixture_has_no_transactions(db):
+    assert not supports_transactions(db.client)
@@ -0,0 +1,102 @@
+# backend/tests/test_workflow_transitions.py
+
+import datetime
+import pytest
+from bson import ObjectId
+from app.workflow_transitions import TRANSITIONS, TransitionRejected, apply_transition, check_transition
+
+
+def make_user(role='Contributor'):
+    return {'_id': ObjectId(), 'role': role, 'username': role.lower()}
+
+
+@pytest.fixture
+def author():
+    return make_user()
+
+
+@pytest.fixture
+def make_doc(db, author):
+    def make_doc(status='Draft', **fields):
+        doc = {'status': status, 'author_id': author['_id'], 'lineage_id': 'L-1', 'doc_number': 'REG-1',
+               'major_version': 0, 'minor_version': 1, '_rev': 0, 'history': [], **fields}
+        return db.documents.insert_one(doc).inserted_id
+    return make_doc
+
+
+def created(user, action):
+    return {'$push': {'history': {'action': action, 'user_id': user['_id'], 'user_username': user['username'],
+                                  'details': '', 'timestamp': datetime.datetime.now(datetime.timezone.utc)}}}
+
+
+def rejection(call):
+    with pytest.raises(TransitionRejected) as info:
+        call()
+    return info.value
+
+
+def test_every_transition_ends_outside_its_start_states():
+    for name, transition in TRANSITIONS.items():
+        for state in transition.from_states:
+            assert transition.target(state) not in transition.from_states or transition.target(state) is None, name
+
+
+def test_apply_moves_status_and_stage(db, author, make_doc):
+    doc_id = make_doc()
+    doc = apply_transition(db, 'submit_qc', doc_id, author, created(author, 'Submitted'), projection={'status': 1})
+    assert doc['status'] == 'In QC'
+    stored = db.documents.find_one({'_id': doc_id})
+    assert stored['current_stage'] == 'QC'
+    assert stored['_rev'] == 1
+    assert db.audit_events.count_documents({'document_id': doc_id}) == 1
+
+
+def test_recall_target_and_resets_depend_on_from_state(db, author, make_doc):
+    doc_id = make_doc('In Review', reviewers=[{'user_id': ObjectId()}], approver={'user_id': ObjectId()})
+    apply_transition(db, 'recall', doc_id, author, created(author, 'Recalled'), from_state='In Review')
+    stored = db.documents.find_one({'_id': doc_id})
+    assert stored['status'] == 'QC Complete'
+    assert stored['reviewers'] == [] and stored['approver'] == {}
+
+
+def test_recall_needs_its_from_state(db, author, make_doc):
+    with pytest.raises(ValueError):
+        apply_transition(db, 'recall', make_doc('In QC'), author, created(author, 'Recalled'))
+
+
+def test_wrong_status_is_400(db, author, make_doc):
+    error = rejection(lambda: check_transition(db, 'submit_qc', make_doc('In QC'), author))
+    assert error.status_code == 400
+    assert error.message == TRANSITIONS['submit_qc'].wrong_state
+
+
+def test_author_guard_is_checked_before_status(db, make_doc):
+    error = rejection(lambda: check_transition(db, 'submit_qc', make_doc('In QC'), make_user()))
+    assert error.status_code == 403
+
+
+def test_reviewer_guard_is_checked_after_status(db, make_doc):
+    doc_id = make_doc('Draft')
+    assert rejection(lambda: check_transition(db, 'qc_review', doc_id, make_user())).status_code == 400
+    db.documents.update_one({'_id': doc_id}, {'$set': {'status': 'In QC'}})
+    assert rejection(lambda: check_transition(db, 'qc_review', doc_id, make_user())).status_code == 403
+
+
+def test_admin_passes_author_guard(db, make_doc):
+    assert check_transition(db, 'submit_qc', make_doc(), make_user('Admin'))['status'] == 'Draft'
+
+
+def test_role_is_checked_before_the_document_is_read(db, author):
+    assert rejection(lambda: check_transition(db, 'archive', ObjectId(), author)).status_code == 403
+    assert rejection(lambda: check_transition(db, 'archive', ObjectId(), make_user('Archivist'))).status_code == 404
+
+
+def test_lost_race_is_409(db, author, make_doc):
+    doc_id = make_doc('In QC')
+    doc = check_transition(db, 'recall', doc_id, author)
+    db.documents.update_one({'_id': doc_id}, {'$set': {'status': 'In Review'}})
+    error = rejection(lambda: apply_transition(
+        db, 'recall', doc_id, author, created(author, 'Recalled'), from_state=doc['status']
+    ))
+    assert error.status_code == 409
+    assert error.body['current']['status'] == 'In Review'